@@ -0,0 +1,47 @@
+"""Order analytics rollups
+
+Revision ID: 2b8e5d9c4f31
+Revises: 9d3a7f2b6c18
+Create Date: 2026-10-18 16:42:18.203511
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2b8e5d9c4f31'
+down_revision: Union[str, None] = '9d3a7f2b6c18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('order_rollups',
+    sa.Column('period', sa.String(length=5), nullable=False),
+    sa.Column('bucket_start', sa.DateTime(), nullable=False),
+    sa.Column('relation_id', sa.Integer(), nullable=False),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('orders_created', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.Column('deliveries', sa.Integer(), nullable=False),
+    sa.Column('interventions', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('period', 'bucket_start', 'relation_id', 'owner_id')
+    )
+    op.create_index('ix_order_rollups_period_owner_id_bucket_start', 'order_rollups', ['period', 'owner_id', 'bucket_start'], unique=False)
+    op.create_index('ix_order_rollups_period_relation_id_bucket_start', 'order_rollups', ['period', 'relation_id', 'bucket_start'], unique=False)
+    op.create_table('rollup_watermarks',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('watermark', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+    # Agregaty wypełnia pierwsze uruchomienie `python -m app.analytics` (brak znacznika = pełne przeliczenie)
+
+
+def downgrade() -> None:
+    op.drop_table('rollup_watermarks')
+    op.drop_index('ix_order_rollups_period_relation_id_bucket_start', table_name='order_rollups')
+    op.drop_index('ix_order_rollups_period_owner_id_bucket_start', table_name='order_rollups')
+    op.drop_table('order_rollups')
@@ -0,0 +1,41 @@
+"""Relation daily load ledger
+
+Revision ID: 3b7e1c9a52d4
+Revises: fd5c4b4490ba
+Create Date: 2026-10-18 09:12:41.208113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7e1c9a52d4'
+down_revision: Union[str, None] = 'fd5c4b4490ba'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('relation_daily_load',
+    sa.Column('relation_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('used_units', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['relation_id'], ['relations.relation_id'], ),
+    sa.PrimaryKeyConstraint('relation_id', 'date')
+    )
+    # Wypełnienie rejestru na podstawie istniejących zamówień
+    op.execute("""
+        INSERT INTO relation_daily_load (relation_id, date, used_units)
+        SELECT relation_id, DATE(departure_time),
+               SUM(CASE size WHEN 'S' THEN 1 WHEN 'M' THEN 2 ELSE 3 END)
+        FROM orders
+        WHERE status IN ('Nadana', 'Przypisano kierowcę', 'Przyjęta od klienta')
+        GROUP BY relation_id, DATE(departure_time)
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('relation_daily_load')
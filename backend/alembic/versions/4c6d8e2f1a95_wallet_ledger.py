@@ -0,0 +1,52 @@
+"""Wallet ledger with decimal amounts and settled balance snapshot
+
+Revision ID: 4c6d8e2f1a95
+Revises: 7f4a2c9e1b53
+Create Date: 2026-10-18 21:12:09.734512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c6d8e2f1a95'
+down_revision: Union[str, None] = '7f4a2c9e1b53'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Dotychczasowe saldo staje się saldem rozliczonym
+    op.alter_column('wallets', 'balance', existing_type=sa.Float(), type_=sa.Numeric(precision=12, scale=2), existing_nullable=False)
+    op.add_column('wallets', sa.Column('settled_at', sa.DateTime(), nullable=True))
+    op.create_table('wallet_transactions',
+    sa.Column('transaction_id', sa.Integer(), nullable=False),
+    sa.Column('wallet_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('kind', sa.String(length=30), nullable=False),
+    sa.Column('order_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('settled_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['wallet_id'], ['wallets.wallet_id'], ),
+    sa.PrimaryKeyConstraint('transaction_id')
+    )
+    op.create_index('ix_wallet_transactions_wallet_id_settled_at', 'wallet_transactions', ['wallet_id', 'settled_at'], unique=False)
+    op.create_index('ix_wallet_transactions_settled_at_created_at', 'wallet_transactions', ['settled_at', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    # Nierozliczone transakcje wliczane są do salda przed usunięciem księgi
+    op.execute("""
+        UPDATE wallets SET balance = balance + COALESCE((
+            SELECT SUM(amount) FROM wallet_transactions
+            WHERE wallet_transactions.wallet_id = wallets.wallet_id AND wallet_transactions.settled_at IS NULL
+        ), 0)
+    """)
+    op.drop_index('ix_wallet_transactions_settled_at_created_at', table_name='wallet_transactions')
+    op.drop_index('ix_wallet_transactions_wallet_id_settled_at', table_name='wallet_transactions')
+    op.drop_table('wallet_transactions')
+    op.drop_column('wallets', 'settled_at')
+    op.alter_column('wallets', 'balance', existing_type=sa.Numeric(precision=12, scale=2), type_=sa.Float(), existing_nullable=False)
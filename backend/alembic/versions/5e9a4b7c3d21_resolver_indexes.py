@@ -0,0 +1,65 @@
+"""Secondary indexes for resolver filters
+
+Revision ID: 5e9a4b7c3d21
+Revises: 8c2f6d1e4a07
+Create Date: 2026-10-18 10:41:09.117342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e9a4b7c3d21'
+down_revision: Union[str, None] = '8c2f6d1e4a07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Kolumny kluczy obcych, dla których MySQL po cichu usuwa własny indeks,
+# gdy powstaje indeks złożony zaczynający się od tej samej kolumny
+FOREIGN_KEY_COLUMNS = [
+    ('orders', 'user_id'),
+    ('orders', 'relation_id'),
+    ('orders', 'driver_id'),
+    ('schedules', 'relation_id'),
+    ('schedules', 'vehicle_id'),
+    ('wallets', 'user_id'),
+]
+
+
+def upgrade() -> None:
+    # Logowanie, rejestracja i profile: filtr po email + user_type
+    op.create_index('ix_users_email_user_type', 'users', ['email', 'user_type'], unique=False)
+    # getUserOrders: user_id + deleted_by_user
+    op.create_index('ix_orders_user_id_deleted_by_user', 'orders', ['user_id', 'deleted_by_user'], unique=False)
+    # Zamówienia relacji na dany dzień i status (przewoźnik, statystyki, odbudowa rejestru zajętości)
+    op.create_index('ix_orders_relation_id_departure_time_status', 'orders', ['relation_id', 'departure_time', 'status'], unique=False)
+    # getDriverOrders: driver_id + status
+    op.create_index('ix_orders_driver_id_status', 'orders', ['driver_id', 'status'], unique=False)
+    # getAvailableStops / getAllStops / indeks tras: przystanek
+    op.create_index(op.f('ix_schedules_stop'), 'schedules', ['stop'], unique=False)
+    # Przystanki relacji w kolejności trasy
+    op.create_index('ix_schedules_relation_id_order_number', 'schedules', ['relation_id', 'order_number'], unique=False)
+    # addSchedule: MAX(order_number) dla pojazdu, getVehicleSchedules
+    op.create_index('ix_schedules_vehicle_id_order_number', 'schedules', ['vehicle_id', 'order_number'], unique=False)
+    op.create_index(op.f('ix_wallets_user_id'), 'wallets', ['user_id'], unique=False)
+    # getInterventionOrders: status problemu
+    op.create_index(op.f('ix_shipment_problems_status'), 'shipment_problems', ['status'], unique=False)
+
+
+def downgrade() -> None:
+    # Przywracamy indeksy kluczy obcych, inaczej MySQL nie pozwoli usunąć nowych indeksów
+    for table, column in FOREIGN_KEY_COLUMNS:
+        op.create_index(f'fk_{table}_{column}', table, [column], unique=False)
+
+    op.drop_index(op.f('ix_shipment_problems_status'), table_name='shipment_problems')
+    op.drop_index(op.f('ix_wallets_user_id'), table_name='wallets')
+    op.drop_index('ix_schedules_vehicle_id_order_number', table_name='schedules')
+    op.drop_index('ix_schedules_relation_id_order_number', table_name='schedules')
+    op.drop_index(op.f('ix_schedules_stop'), table_name='schedules')
+    op.drop_index('ix_orders_driver_id_status', table_name='orders')
+    op.drop_index('ix_orders_relation_id_departure_time_status', table_name='orders')
+    op.drop_index('ix_orders_user_id_deleted_by_user', table_name='orders')
+    op.drop_index('ix_users_email_user_type', table_name='users')
@@ -0,0 +1,31 @@
+"""Data versions for cross-process invalidation of in-memory indexes
+
+Revision ID: 6a1d3f8b2e47
+Revises: 4c6d8e2f1a95
+Create Date: 2026-10-19 09:14:52.201734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6a1d3f8b2e47'
+down_revision: Union[str, None] = '4c6d8e2f1a95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    data_versions = op.create_table('data_versions',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(data_versions, [{'name': 'timetable', 'version': 0}])
+
+
+def downgrade() -> None:
+    op.drop_table('data_versions')
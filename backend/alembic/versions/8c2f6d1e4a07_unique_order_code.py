@@ -0,0 +1,26 @@
+"""Unique index on orders.order_code
+
+Revision ID: 8c2f6d1e4a07
+Revises: 3b7e1c9a52d4
+Create Date: 2026-10-18 10:03:17.552690
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c2f6d1e4a07'
+down_revision: Union[str, None] = '3b7e1c9a52d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_orders_order_code'), 'orders', ['order_code'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_orders_order_code'), table_name='orders')
@@ -0,0 +1,42 @@
+"""Carrier stats rollup
+
+Revision ID: 9d3a7f2b6c18
+Revises: 5e9a4b7c3d21
+Create Date: 2026-10-18 15:37:04.512870
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d3a7f2b6c18'
+down_revision: Union[str, None] = '5e9a4b7c3d21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('carrier_stats',
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('order_count', sa.Integer(), nullable=False),
+    sa.Column('total_price', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('owner_id', 'status')
+    )
+    # Wypełnienie statystyk na podstawie istniejących zamówień
+    op.execute("""
+        INSERT INTO carrier_stats (owner_id, status, order_count, total_price)
+        SELECT vehicles.owner_id, orders.status, COUNT(orders.order_id), SUM(orders.price)
+        FROM orders
+        JOIN relations ON relations.relation_id = orders.relation_id
+        JOIN vehicles ON vehicles.vehicle_id = relations.vehicle_id
+        GROUP BY vehicles.owner_id, orders.status
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('carrier_stats')
@@ -0,0 +1,27 @@
+"""Data version for the query result cache
+
+Revision ID: a3e7c1d9b580
+Revises: 6a1d3f8b2e47
+Create Date: 2026-10-20 10:02:17.448193
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3e7c1d9b580'
+down_revision: Union[str, None] = '6a1d3f8b2e47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    data_versions = sa.table('data_versions', sa.column('name', sa.String), sa.column('version', sa.Integer))
+    op.bulk_insert(data_versions, [{'name': 'query_cache', 'version': 0}])
+
+
+def downgrade() -> None:
+    op.execute("DELETE FROM data_versions WHERE name = 'query_cache'")
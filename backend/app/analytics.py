@@ -0,0 +1,191 @@
+import argparse
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import case, func
+
+from app.models import Order, OrderRollup, OrderStatusHistory, Relation, RollupWatermark, Vehicle
+from app.rollups import upsert_add
+
+logger = logging.getLogger(__name__)
+
+# Agregaty analityczne zamówień: liczba nowych zamówień, przychód (suma cen nowych zamówień),
+# dostawy i interwencje (wpisy historii statusów) w przedziałach godzinowych i dziennych,
+# dla każdej relacji i jej przewoźnika. Odświeżanie jest przyrostowe - przetwarzane są tylko
+# wiersze od ostatniego znacznika (watermark) do chwili obecnej minus ANALYTICS_LAG,
+# aby nie pominąć transakcji zatwierdzonych z opóźnieniem.
+
+WATERMARK_NAME = "order_rollups"
+ANALYTICS_LAG = timedelta(seconds=int(os.environ.get("ANALYTICS_LAG_SECONDS", "60")))
+
+PERIODS = ("hour", "day")
+GROUP_BY_COLUMNS = {"carrier": OrderRollup.owner_id, "relation": OrderRollup.relation_id}
+COUNTERS = ("orders_created", "revenue", "deliveries", "interventions")
+
+DELIVERED_STATUS = 'Dostarczona'
+INTERVENTION_STATUS = 'Interwencja'
+
+
+def hour_bucket(db, column):
+    if db.get_bind().dialect.name == 'mysql':
+        return func.date_format(column, '%Y-%m-%d %H:00:00')
+    return func.strftime('%Y-%m-%d %H:00:00', column)
+
+def _bucket_start(value):
+    if isinstance(value, datetime):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+
+def _window(query, column, start, end):
+    if start is not None:
+        query = query.filter(column >= start)
+    return query.filter(column < end)
+
+# Przyrosty liczników w oknie [start, end) pogrupowane po (godzina, relacja, przewoźnik)
+def collect_deltas(db, start, end):
+    deltas = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+
+    created_hour = hour_bucket(db, Order.created_at)
+    created = db.query(
+        created_hour, Order.relation_id, Vehicle.owner_id, func.count(Order.order_id), func.sum(Order.price)
+    ).join(Relation, Relation.relation_id == Order.relation_id).join(Vehicle, Vehicle.vehicle_id == Relation.vehicle_id)
+    created = _window(created, Order.created_at, start, end).group_by(created_hour, Order.relation_id, Vehicle.owner_id)
+    for hour, relation_id, owner_id, count, revenue in created:
+        entry = deltas[(_bucket_start(hour), relation_id, owner_id)]
+        entry["orders_created"] += count
+        entry["revenue"] += revenue or 0.0
+
+    changed_hour = hour_bucket(db, OrderStatusHistory.changed_at)
+    changes = db.query(
+        changed_hour, Order.relation_id, Vehicle.owner_id,
+        func.sum(case((OrderStatusHistory.status == DELIVERED_STATUS, 1), else_=0)),
+        func.sum(case((OrderStatusHistory.status == INTERVENTION_STATUS, 1), else_=0)),
+    ).join(Order, Order.order_id == OrderStatusHistory.order_id).join(
+        Relation, Relation.relation_id == Order.relation_id
+    ).join(Vehicle, Vehicle.vehicle_id == Relation.vehicle_id).filter(
+        OrderStatusHistory.status.in_([DELIVERED_STATUS, INTERVENTION_STATUS])
+    )
+    changes = _window(changes, OrderStatusHistory.changed_at, start, end).group_by(
+        changed_hour, Order.relation_id, Vehicle.owner_id
+    )
+    for hour, relation_id, owner_id, deliveries, interventions in changes:
+        entry = deltas[(_bucket_start(hour), relation_id, owner_id)]
+        entry["deliveries"] += deliveries or 0
+        entry["interventions"] += interventions or 0
+
+    return deltas
+
+def apply_deltas(db, deltas):
+    buckets = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    for (hour, relation_id, owner_id), counters in deltas.items():
+        day = datetime.combine(hour.date(), time.min)
+        for period, bucket_start in (("hour", hour), ("day", day)):
+            bucket = buckets[(period, bucket_start, relation_id, owner_id)]
+            for name in COUNTERS:
+                bucket[name] += counters[name]
+
+    for (period, bucket_start, relation_id, owner_id), counters in buckets.items():
+        upsert_add(
+            db, OrderRollup,
+            {"period": period, "bucket_start": bucket_start, "relation_id": relation_id, "owner_id": owner_id},
+            counters,
+        )
+    return len(buckets)
+
+# Przyrostowe odświeżenie agregatów. Wiersz znacznika jest blokowany do końca transakcji,
+# więc równoległe odświeżenia nie policzą tych samych wierszy dwukrotnie.
+def refresh_rollups(db, now=None):
+    end = (now or datetime.now()) - ANALYTICS_LAG
+    watermark = db.query(RollupWatermark).filter(RollupWatermark.name == WATERMARK_NAME).with_for_update().first()
+    if watermark is None:
+        watermark = RollupWatermark(name=WATERMARK_NAME, watermark=None)
+        db.add(watermark)
+        db.flush()
+    start = watermark.watermark
+    if start is not None and end <= start:
+        return 0
+
+    updated = apply_deltas(db, collect_deltas(db, start, end))
+    watermark.watermark = end
+    db.flush()
+    logger.info(f"Order rollups refreshed from {start} to {end}: {updated} buckets updated.")
+    return updated
+
+# Pełne przeliczenie agregatów od początku historii
+def rebuild_rollups(db, now=None):
+    db.query(OrderRollup).delete(synchronize_session=False)
+    db.query(RollupWatermark).filter(RollupWatermark.name == WATERMARK_NAME).delete(synchronize_session=False)
+    return refresh_rollups(db, now)
+
+def parse_date_range(date_from, date_to):
+    try:
+        start = datetime.strptime(date_from, '%Y-%m-%d')
+        end = datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)
+    except ValueError:
+        raise ValueError(f"Nieprawidłowy zakres dat: {date_from} - {date_to} (oczekiwany format RRRR-MM-DD)")
+    if end <= start:
+        raise ValueError("Data początkowa musi być wcześniejsza niż końcowa")
+    return start, end
+
+def _totals():
+    return [func.sum(getattr(OrderRollup, name)) for name in COUNTERS]
+
+def _counters(values):
+    orders_created, revenue, deliveries, interventions = values
+    return {
+        "orders_created": orders_created or 0,
+        "revenue": revenue or 0.0,
+        "deliveries": deliveries or 0,
+        "interventions": interventions or 0,
+    }
+
+# Szereg czasowy dla wszystkich relacji albo zawężony do przewoźnika lub relacji
+def time_series(db, period, date_from, date_to, carrier_id=None, relation_id=None):
+    if period not in PERIODS:
+        raise ValueError(f"Nieobsługiwany okres agregacji: {period}")
+    start, end = parse_date_range(date_from, date_to)
+    query = db.query(OrderRollup.bucket_start, *_totals()).filter(
+        OrderRollup.period == period, OrderRollup.bucket_start >= start, OrderRollup.bucket_start < end
+    )
+    if carrier_id is not None:
+        query = query.filter(OrderRollup.owner_id == carrier_id)
+    if relation_id is not None:
+        query = query.filter(OrderRollup.relation_id == relation_id)
+    rows = query.group_by(OrderRollup.bucket_start).order_by(OrderRollup.bucket_start)
+    return [{"bucket_start": bucket_start.isoformat(sep=" "), **_counters(values)} for bucket_start, *values in rows]
+
+# Sumy w zakresie dat w podziale na przewoźników albo relacje (z agregatów dziennych)
+def breakdown(db, group_by, date_from, date_to):
+    if group_by not in GROUP_BY_COLUMNS:
+        raise ValueError(f"Nieobsługiwane grupowanie: {group_by}")
+    start, end = parse_date_range(date_from, date_to)
+    column = GROUP_BY_COLUMNS[group_by]
+    rows = db.query(column, *_totals()).filter(
+        OrderRollup.period == "day", OrderRollup.bucket_start >= start, OrderRollup.bucket_start < end
+    ).group_by(column).order_by(column)
+    return [{"id": key, **_counters(values)} for key, *values in rows]
+
+
+if __name__ == "__main__":
+    # Odświeżenie agregatów (np. z crona co kilka minut): python -m app.analytics [--rebuild]
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rebuild", action="store_true", help="przelicz agregaty od początku historii")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        if args.rebuild:
+            rebuild_rollups(db)
+        else:
+            refresh_rollups(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
@@ -0,0 +1,57 @@
+import argparse
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Porównanie przepustowości trybu synchronicznego i asynchronicznego na tym samym obciążeniu.
+# Serwer uruchamiamy dwa razy (DB_ASYNC=0 oraz DB_ASYNC=1) i dla każdego wywołujemy:
+#   python -m app.benchmark --url http://localhost:8000/graphql/ --requests 2000 --concurrency 50
+
+WORKLOAD = [
+    ("getAllOrders", "{ getAllOrders { order_id status user { email } relation { relation_name } } }"),
+    ("getAllStops", "{ getAllStops }"),
+    ("getAllUsers", "{ getAllUsers { user_id email wallet { balance } } }"),
+    ("getInterventionOrders", "{ getInterventionOrders { order { order_id } problem { description } } }"),
+]
+
+
+def send(url, query):
+    body = json.dumps({"query": query}).encode()
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            result = json.loads(response.read())
+    except urllib.error.HTTPError:
+        return time.perf_counter() - started, False
+    return time.perf_counter() - started, "errors" not in result
+
+
+def run(url, requests, concurrency):
+    queries = [WORKLOAD[i % len(WORKLOAD)][1] for i in range(requests)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda query: send(url, query), queries))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": sum(1 for _, ok in results if not ok),
+        "requests_per_second": round(requests / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000/graphql/")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    print(json.dumps(run(args.url, args.requests, args.concurrency), indent=2))
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import OperationalError
+
+from app.capacity import reserve_capacity, size_units
+from app.carrier_stats import track_order_stats
+from app.codes import add_with_unique_code, order_codes
+from app.fares import fare_table, stop_count
+from app.models import Order, OrderStatusHistory, Relation, Vehicle
+from app.route_index import route_index
+from app.wallets import ORDER_PAYMENT, InsufficientFunds, debit
+
+logger = logging.getLogger(__name__)
+
+# Kody błędów MySQL, po których transakcję można bezpiecznie powtórzyć
+# (1213 - deadlock, 1205 - przekroczony czas oczekiwania na blokadę)
+RETRYABLE_ERROR_CODES = {1213, 1205}
+
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF = 0.05  # sekundy, podwajane przy każdej kolejnej próbie
+
+
+class BookingError(ValueError):
+    pass
+
+
+def is_retryable(error):
+    orig = getattr(error, 'orig', None)
+    code = orig.args[0] if orig is not None and orig.args else None
+    if code in RETRYABLE_ERROR_CODES:
+        return True
+    message = str(orig or error).lower()
+    return 'deadlock' in message or 'database is locked' in message
+
+def retry_delay(attempt):
+    return RETRY_BACKOFF * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+
+# Rezerwacja przesyłki w jednej krótkiej transakcji:
+# wycena (app/fares.py) -> rezerwacja pojemności -> zamówienie -> obciążenie portfela (księga) -> historia statusu -> statystyki przewoźnika.
+# Przy deadlocku cała transakcja jest powtarzana (maksymalnie `max_attempts` razy).
+# Funkcja blokuje wątek (także na czas odczekania przed ponowieniem) - resolver wywołuje ją w puli wątków.
+def book_order(session_factory, user_id, relation_id, size, start_stop, end_stop, today_delivery, max_attempts=MAX_ATTEMPTS):
+    for attempt in range(1, max_attempts + 1):
+        db = session_factory()
+        try:
+            order = _book_order(db, user_id, relation_id, size, start_stop, end_stop, today_delivery)
+            db.commit()
+            db.refresh(order)
+            return order
+        except OperationalError as e:
+            db.rollback()
+            if attempt == max_attempts or not is_retryable(e):
+                raise
+            logger.warning(f"Booking for relation {relation_id} hit a lock conflict, retrying ({attempt}/{max_attempts}).")
+            time.sleep(retry_delay(attempt))
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+# To samo w trybie DB_ASYNC: transakcja w AsyncSession (sterownik async, bez osobnego połączenia
+# synchronicznego), a odczekanie przed ponowieniem nie blokuje pętli zdarzeń
+async def book_order_async(session_factory, user_id, relation_id, size, start_stop, end_stop, today_delivery, max_attempts=MAX_ATTEMPTS):
+    for attempt in range(1, max_attempts + 1):
+        async with session_factory() as db:
+            try:
+                order = await db.run_sync(_book_order, user_id, relation_id, size, start_stop, end_stop, today_delivery)
+                await db.commit()
+                await db.refresh(order)
+                return order
+            except OperationalError as e:
+                await db.rollback()
+                if attempt == max_attempts or not is_retryable(e):
+                    raise
+                logger.warning(f"Booking for relation {relation_id} hit a lock conflict, retrying ({attempt}/{max_attempts}).")
+            except Exception:
+                await db.rollback()
+                raise
+        await asyncio.sleep(retry_delay(attempt))
+
+def _book_order(db, user_id, relation_id, size, start_stop, end_stop, today_delivery):
+    # Przystanki relacji bierzemy z indeksu tras zamiast z bazy. Wersja rozkładu i cenników sprawdzana jest
+    # przy każdej rezerwacji, więc zmiana cennika w innym procesie nie zostanie naliczona po starej cenie.
+    route_index.ensure_fresh(db, force_check=True)
+    course = route_index.course_endpoints(relation_id, start_stop, end_stop)
+    if not course:
+        raise BookingError(f"Błędny przystanek początkowy lub końcowy: start_stop={start_stop}, end_stop={end_stop}")
+    start_schedule, end_schedule = course
+
+    # Cena liczona na serwerze z cennika w pamięci, tak samo jak w wyszukiwarce kursów i quoteFares
+    fare_table.ensure_fresh(db)
+    price = fare_table.quote_one(relation_id, stop_count(start_schedule, end_schedule), size)
+    if price is None:
+        raise BookingError(f"Relacja {relation_id} nie ma cennika")
+
+    # Data nadania: dziś albo jutro
+    departure_date = datetime.today() if today_delivery else datetime.today() + timedelta(days=1)
+    departure_time = datetime.combine(departure_date, start_schedule.departure_time.time())
+    arrival_time = datetime.combine(departure_date, end_schedule.arrival_time.time())
+
+    vehicle = db.query(Vehicle.capacity, Vehicle.owner_id).join(Relation, Relation.vehicle_id == Vehicle.vehicle_id).filter(
+        Relation.relation_id == relation_id
+    ).first()
+    if vehicle is None:
+        raise BookingError(f"Relacja {relation_id} nie istnieje")
+    vehicle_capacity, owner_id = vehicle
+
+    # Rezerwacja miejsca w pojeździe (blokuje wiersz relation_daily_load do końca transakcji)
+    if not reserve_capacity(db, relation_id, departure_time.date(), size_units(size), vehicle_capacity):
+        raise BookingError("Brak wolnego miejsca w pojeździe")
+
+    new_order = Order(
+        user_id=user_id,
+        relation_id=relation_id,
+        size=size,
+        start_stop=start_stop,
+        end_stop=end_stop,
+        departure_time=departure_time,
+        arrival_time=arrival_time,
+        price=price,
+        pickup_code='0000',
+        delivery_code='0000',
+        status='Nadana'
+    )
+    # Kod zamówienia z alokatora; unikalność pilnuje indeks w bazie
+    add_with_unique_code(db, new_order, 'order_code', order_codes)
+
+    # Obciążenie portfela blokuje jego wiersz do końca transakcji, saldo sprawdzane jest razem z nierozliczonymi transakcjami
+    try:
+        debit(db, user_id, price, ORDER_PAYMENT, new_order.order_id)
+    except InsufficientFunds as e:
+        raise BookingError(str(e))
+
+    db.add(OrderStatusHistory(order_id=new_order.order_id, status='Nadana', changed_at=datetime.now()))
+    track_order_stats(db, new_order, before=None, owner_id=owner_id)
+    return new_order
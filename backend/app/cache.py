@@ -0,0 +1,144 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Pamięć podręczna LRU w obrębie procesu. Wpisy unieważniane są jawnie (clear/invalidate/
+# invalidate_tags) po zatwierdzeniu zmian, które mogą je zdezaktualizować, a opcjonalnie
+# wygasają też po `ttl` sekundach. RedisCache ma ten sam interfejs i jest współdzielony
+# przez wszystkie procesy aplikacji.
+
+MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, max_size=1024, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # klucz -> (wartość, czas wygaśnięcia albo None, tagi)
+        self._entries = OrderedDict()
+        self._tags = defaultdict(set)
+        # Zwiększana przy każdym unieważnieniu; wynik wczytany przed unieważnieniem nie trafia do pamięci
+        self._generation = 0
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            value, expires_at, _ = self._entries[key]
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, generation=None, tags=()):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            expires_at = time.monotonic() + self.ttl if self.ttl else None
+            self._entries[key] = (value, expires_at, tuple(tags))
+            for tag in tags:
+                self._tags[tag].add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def get_or_load(self, key, load, tags=()):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            generation = self._generation
+            value = load()
+            self.set(key, value, generation, tags)
+        return value
+
+    def invalidate(self, *keys):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+
+    def invalidate_tags(self, *tags):
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache:
+    # Wartości serializowane pickle, tagi trzymane jako zbiory kluczy `<prefix>tag:<tag>`.
+    # Brak licznika generacji między procesami - nieaktualny wpis zapisany w trakcie
+    # unieważnienia żyje najdłużej `ttl` sekund.
+
+    def __init__(self, url, ttl=None, prefix="cache:"):
+        if redis is None:
+            raise Exception("Współdzielona pamięć podręczna wymaga pakietu redis (pip install redis)")
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def _tag_key(self, tag):
+        return f"{self.prefix}tag:{tag}"
+
+    def get(self, key, default=None):
+        raw = self._client.get(self.prefix + key)
+        return default if raw is None else pickle.loads(raw)
+
+    def set(self, key, value, generation=None, tags=()):
+        pipeline = self._client.pipeline()
+        pipeline.set(self.prefix + key, pickle.dumps(value), ex=self.ttl)
+        for tag in tags:
+            pipeline.sadd(self._tag_key(tag), self.prefix + key)
+            if self.ttl:
+                pipeline.expire(self._tag_key(tag), self.ttl)
+        pipeline.execute()
+
+    def get_or_load(self, key, load, tags=()):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            value = load()
+            self.set(key, value, tags=tags)
+        return value
+
+    def invalidate(self, *keys):
+        if keys:
+            self._client.delete(*[self.prefix + key for key in keys])
+
+    def invalidate_tags(self, *tags):
+        tag_keys = [self._tag_key(tag) for tag in tags]
+        if not tag_keys:
+            return
+        keys = self._client.sunion(tag_keys)
+        self._client.delete(*keys, *tag_keys)
+
+    def clear(self):
+        keys = list(self._client.scan_iter(match=f"{self.prefix}*"))
+        if keys:
+            self._client.delete(*keys)
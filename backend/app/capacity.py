@@ -0,0 +1,117 @@
+import logging
+from collections import defaultdict
+
+from sqlalchemy import case, func, insert
+from sqlalchemy.dialects import mysql, sqlite
+
+from app.models import Order, RelationDailyLoad
+from app.rollups import upsert_add
+
+logger = logging.getLogger(__name__)
+
+# Liczba jednostek pojemności pojazdu zajmowanych przez przesyłkę danego rozmiaru
+SIZE_UNITS = {'S': 1, 'M': 2, 'L': 3}
+
+# Statusy zamówień, które zajmują miejsce w pojeździe
+ACTIVE_STATUSES = ('Nadana', 'Przypisano kierowcę', 'Przyjęta od klienta')
+
+
+def size_units(size):
+    return SIZE_UNITS.get(size, 3)
+
+# Zwraca (relation_id, data, jednostki) zajmowane przez zamówienie albo None
+def order_load(order):
+    if order is None or order.status not in ACTIVE_STATUSES:
+        return None
+    return (order.relation_id, order.departure_time.date(), size_units(order.size))
+
+# Zmiana zajętości relacji w danym dniu jednym atomowym upsertem
+def adjust_load(db, relation_id, day, delta):
+    if not delta:
+        return
+    upsert_add(db, RelationDailyLoad, {"relation_id": relation_id, "date": day}, {"used_units": delta})
+
+# Warunkowa rezerwacja pojemności: zwiększa zajętość tylko jeśli zmieści się w pojeździe.
+# UPDATE blokuje wiersz rejestru do końca transakcji, więc równoległe rezerwacje
+# na tę samą relację i dzień są serializowane przez bazę, a nie sprawdzane w Pythonie.
+def reserve_capacity(db, relation_id, day, units, vehicle_capacity):
+    dialect = db.get_bind().dialect.name
+    if dialect == 'mysql':
+        stmt = mysql.insert(RelationDailyLoad).values(relation_id=relation_id, date=day, used_units=0).prefix_with('IGNORE')
+    elif dialect == 'sqlite':
+        stmt = sqlite.insert(RelationDailyLoad).values(relation_id=relation_id, date=day, used_units=0).on_conflict_do_nothing()
+    else:
+        stmt = None
+        if not db.query(RelationDailyLoad).filter(RelationDailyLoad.relation_id == relation_id, RelationDailyLoad.date == day).count():
+            stmt = insert(RelationDailyLoad).values(relation_id=relation_id, date=day, used_units=0)
+    if stmt is not None:
+        db.execute(stmt)
+
+    updated = db.query(RelationDailyLoad).filter(
+        RelationDailyLoad.relation_id == relation_id,
+        RelationDailyLoad.date == day,
+        RelationDailyLoad.used_units + units <= vehicle_capacity,
+    ).update({RelationDailyLoad.used_units: RelationDailyLoad.used_units + units}, synchronize_session=False)
+    return updated == 1
+
+# Aktualizacja rejestru po zmianie zamówienia; `before` to wynik order_load sprzed zmiany
+def track_order(db, order, before=None):
+    after = order_load(order)
+    if before == after:
+        return
+    if before:
+        adjust_load(db, before[0], before[1], -before[2])
+    if after:
+        adjust_load(db, after[0], after[1], after[2])
+
+# Zwolnienie pojemności zajmowanej przez zamówienia, które zaraz zostaną usunięte
+def release_orders(db, *criteria):
+    released = defaultdict(int)
+    rows = db.query(Order.relation_id, Order.departure_time, Order.size).filter(
+        *criteria, Order.status.in_(ACTIVE_STATUSES)
+    )
+    for relation_id, departure_time, size in rows:
+        released[(relation_id, departure_time.date())] += size_units(size)
+    for (relation_id, day), units in released.items():
+        adjust_load(db, relation_id, day, -units)
+
+# Zajętość wielu relacji w danym dniu - jedno zapytanie po kluczu głównym
+def get_used_units(db, relation_ids, day):
+    if not relation_ids:
+        return {}
+    rows = db.query(RelationDailyLoad.relation_id, RelationDailyLoad.used_units).filter(
+        RelationDailyLoad.relation_id.in_(relation_ids), RelationDailyLoad.date == day
+    )
+    return {relation_id: used_units for relation_id, used_units in rows}
+
+# Odbudowa całego rejestru na podstawie tabeli `orders`
+def rebuild_relation_daily_load(db):
+    units = case(*[(Order.size == size, value) for size, value in SIZE_UNITS.items()], else_=3)
+    day = func.date(Order.departure_time)
+    select_load = (
+        db.query(Order.relation_id, day, func.sum(units))
+        .filter(Order.status.in_(ACTIVE_STATUSES))
+        .group_by(Order.relation_id, day)
+        .statement
+    )
+    db.query(RelationDailyLoad).delete(synchronize_session=False)
+    db.execute(insert(RelationDailyLoad).from_select(
+        [RelationDailyLoad.relation_id, RelationDailyLoad.date, RelationDailyLoad.used_units], select_load
+    ))
+
+
+if __name__ == "__main__":
+    # Uzgodnienie rejestru z zamówieniami: python -m app.capacity
+    from app.database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        rebuild_relation_daily_load(db)
+        db.commit()
+        logger.info(f"Relation daily load rebuilt: {db.query(RelationDailyLoad).count()} rows.")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
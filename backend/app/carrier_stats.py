@@ -0,0 +1,96 @@
+import logging
+from collections import defaultdict
+
+from sqlalchemy import func, insert
+
+from app.models import CarrierStats, Order, Relation, Vehicle
+from app.rollups import upsert_add
+
+logger = logging.getLogger(__name__)
+
+COMPLETED_STATUS = 'Dostarczona'
+NEW_STATUS = 'Nadana'
+
+
+def carrier_of_relation(db, relation_id):
+    return db.query(Vehicle.owner_id).join(Relation, Relation.vehicle_id == Vehicle.vehicle_id).filter(
+        Relation.relation_id == relation_id
+    ).scalar()
+
+# Zwraca (owner_id, status, cena) zamówienia albo None
+def order_stat(db, order, owner_id=None):
+    if order is None:
+        return None
+    if owner_id is None:
+        owner_id = carrier_of_relation(db, order.relation_id)
+    return (owner_id, order.status, order.price or 0.0)
+
+def adjust_stats(db, owner_id, status, count_delta, price_delta):
+    if owner_id is None or not count_delta:
+        return
+    upsert_add(
+        db, CarrierStats,
+        {"owner_id": owner_id, "status": status},
+        {"order_count": count_delta, "total_price": price_delta},
+    )
+
+# Aktualizacja statystyk po zmianie zamówienia; `before` to wynik order_stat sprzed zmiany
+def track_order_stats(db, order, before=None, owner_id=None):
+    after = order_stat(db, order, owner_id=before[0] if before else owner_id)
+    if before == after:
+        return
+    if before:
+        adjust_stats(db, before[0], before[1], -1, -before[2])
+    if after:
+        adjust_stats(db, after[0], after[1], 1, after[2])
+
+# Odjęcie ze statystyk zamówień, które zaraz zostaną usunięte
+def release_order_stats(db, *criteria):
+    rows = db.query(Vehicle.owner_id, Order.status, func.count(Order.order_id), func.coalesce(func.sum(Order.price), 0.0)).join(
+        Relation, Relation.relation_id == Order.relation_id
+    ).join(Vehicle, Vehicle.vehicle_id == Relation.vehicle_id).filter(*criteria).group_by(Vehicle.owner_id, Order.status)
+    for owner_id, status, count, total in rows:
+        adjust_stats(db, owner_id, status, -count, -total)
+
+# Statystyki przewoźnika odczytywane z tabeli agregatów - koszt nie zależy od liczby zamówień
+def get_carrier_stats(db, owner_id):
+    stats = defaultdict(lambda: (0, 0.0))
+    rows = db.query(CarrierStats.status, CarrierStats.order_count, CarrierStats.total_price).filter(
+        CarrierStats.owner_id == owner_id
+    )
+    for status, count, total in rows:
+        stats[status] = (count, total)
+    return stats
+
+# Jedno zapytanie grupujące po przewoźniku i statusie - źródło prawdy dla tabeli agregatów
+def carrier_stats_query(db):
+    return db.query(
+        Vehicle.owner_id, Order.status, func.count(Order.order_id), func.sum(Order.price)
+    ).join(Relation, Relation.relation_id == Order.relation_id).join(
+        Vehicle, Vehicle.vehicle_id == Relation.vehicle_id
+    ).group_by(Vehicle.owner_id, Order.status)
+
+# Odbudowa całej tabeli statystyk na podstawie tabeli `orders`
+def rebuild_carrier_stats(db):
+    db.query(CarrierStats).delete(synchronize_session=False)
+    db.execute(insert(CarrierStats).from_select(
+        [CarrierStats.owner_id, CarrierStats.status, CarrierStats.order_count, CarrierStats.total_price],
+        carrier_stats_query(db).statement,
+    ))
+
+
+if __name__ == "__main__":
+    # Uzgodnienie statystyk przewoźników z zamówieniami: python -m app.carrier_stats
+    from app.database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        rebuild_carrier_stats(db)
+        db.commit()
+        logger.info(f"Carrier stats rebuilt: {db.query(CarrierStats).count()} rows.")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
@@ -0,0 +1,83 @@
+import hashlib
+import itertools
+import os
+import secrets
+import threading
+
+from sqlalchemy.exc import IntegrityError
+
+# Klucz permutacji; w produkcji ustawiany zmienną środowiskową, aby wszystkie procesy
+# korzystały z tej samej permutacji (kolizja jest wtedy możliwa tylko przy tym samym liczniku)
+CODE_ALLOCATOR_KEY = os.environ.get("CODE_ALLOCATOR_KEY", "").encode() or secrets.token_bytes(16)
+
+# Ile razy ponawiamy zapis po kolizji na unikalnym indeksie
+MAX_INSERT_ATTEMPTS = 5
+
+FEISTEL_ROUNDS = 4
+
+
+class FeistelPermutation:
+    # Permutacja liczb z zakresu [0, domain_size) oparta na sieci Feistela
+    # z "cycle walking" - wynik spoza zakresu jest permutowany ponownie.
+
+    def __init__(self, domain_size, key, rounds=FEISTEL_ROUNDS):
+        self.domain_size = domain_size
+        self.key = key
+        self.rounds = rounds
+        self.half_bits = max(1, ((domain_size - 1).bit_length() + 1) // 2)
+        self.half_mask = (1 << self.half_bits) - 1
+
+    def _round(self, value, round_number):
+        digest = hashlib.blake2b(
+            value.to_bytes(8, 'big') + bytes([round_number]), key=self.key, digest_size=8
+        ).digest()
+        return int.from_bytes(digest, 'big') & self.half_mask
+
+    def _encrypt(self, value):
+        left, right = value >> self.half_bits, value & self.half_mask
+        for round_number in range(self.rounds):
+            left, right = right, left ^ self._round(right, round_number)
+        return (left << self.half_bits) | right
+
+    def permute(self, value):
+        value = self._encrypt(value)
+        while value >= self.domain_size:
+            value = self._encrypt(value)
+        return value
+
+
+class CodeAllocator:
+    # Generuje kody bez zapytań do bazy: kolejne wartości licznika procesu
+    # przepuszczone przez permutację. Licznik startuje w losowym miejscu,
+    # więc różne procesy zajmują rozłączne fragmenty przestrzeni kodów.
+
+    def __init__(self, width, minimum=0, key=CODE_ALLOCATOR_KEY):
+        self.width = width
+        self.minimum = minimum
+        self.domain_size = 10 ** width - minimum
+        self.permutation = FeistelPermutation(self.domain_size, key)
+        self._lock = threading.Lock()
+        self._counter = itertools.count(secrets.randbelow(self.domain_size))
+
+    def next_code(self):
+        with self._lock:
+            value = next(self._counter) % self.domain_size
+        return str(self.minimum + self.permutation.permute(value)).zfill(self.width)
+
+
+order_codes = CodeAllocator(width=14)
+driver_codes = CodeAllocator(width=9, minimum=100000000)
+
+# Zapis obiektu z nowym kodem; przy naruszeniu unikalnego indeksu kod jest losowany
+# ponownie w obrębie SAVEPOINT, bez wcześniejszego sprawdzania w bazie
+def add_with_unique_code(db, obj, attribute, allocator, attempts=MAX_INSERT_ATTEMPTS):
+    for attempt in range(1, attempts + 1):
+        setattr(obj, attribute, allocator.next_code())
+        try:
+            with db.begin_nested():
+                db.add(obj)
+                db.flush()
+            return obj
+        except IntegrityError:
+            if attempt == attempts:
+                raise
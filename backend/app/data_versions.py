@@ -0,0 +1,77 @@
+import os
+import threading
+import time
+
+from sqlalchemy import update
+
+from app.models import DataVersion
+
+# Wersje danych trzymanych w pamięci procesu (indeks tras, cenniki, katalog przystanków,
+# pamięć podręczna wyników zapytań).
+# Unieważnienie po zatwierdzeniu transakcji (after_commit) działa tylko w procesie, który dane zmienił -
+# pozostałe workery uvicorn i import rozkładu z CLI (python -m app.timetable) o zmianie nie wiedzą.
+# Dlatego każda zmiana zwiększa licznik w tabeli data_versions w tej samej transakcji (bump), a proces
+# przed użyciem danych porównuje zapamiętaną wersję z bazą (jedno zapytanie po kluczu głównym, najwyżej
+# raz na DATA_VERSION_CHECK_SECONDS; force=True - zawsze, np. przy naliczaniu ceny rezerwacji).
+# Po zmianie wykonanej przez inny proces wywoływane są funkcje zarejestrowane przez on_change.
+
+DATA_VERSION_CHECK_SECONDS = float(os.environ.get("DATA_VERSION_CHECK_SECONDS", "1"))
+
+# Rozkłady jazdy, relacje i cenniki
+TIMETABLE = "timetable"
+# Encje z pamięci podręcznej wyników zapytań (app/query_cache.py): pojazdy, relacje, kierowcy, cenniki
+QUERY_CACHE = "query_cache"
+
+
+class VersionedData:
+    def __init__(self, name, check_seconds=DATA_VERSION_CHECK_SECONDS):
+        self.name = name
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._known = None
+        self._checked_at = None
+        self._listeners = []
+
+    def on_change(self, callback):
+        self._listeners.append(callback)
+        return callback
+
+    def read(self, db):
+        return db.query(DataVersion.version).filter(DataVersion.name == self.name).scalar() or 0
+
+    # Zwiększa wersję w bieżącej transakcji; zwraca nową wersję (do przekazania do `committed` po zatwierdzeniu)
+    def bump(self, db):
+        updated = db.execute(
+            update(DataVersion).where(DataVersion.name == self.name).values(version=DataVersion.version + 1)
+        ).rowcount
+        if not updated:
+            db.add(DataVersion(name=self.name, version=1))
+            db.flush()
+        return self.read(db)
+
+    # Zmianę zatwierdził ten proces i unieważnił już swoje dane - jeśli w międzyczasie nie było zmian
+    # z innych procesów, nowa wersja jest od razu znana i nie wymusza ponownego wczytania
+    def committed(self, version):
+        with self._lock:
+            if self._known == version - 1:
+                self._known = version
+
+    # Sprawdza wersję w bazie; zwraca True, gdy dane zmienił inny proces (po wywołaniu funkcji on_change)
+    def check(self, db, force=False):
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._checked_at is not None and now - self._checked_at < self.check_seconds:
+                return False
+        version = self.read(db)
+        with self._lock:
+            changed = self._known is not None and version != self._known
+            self._known = version
+            self._checked_at = now
+        if changed:
+            for callback in self._listeners:
+                callback()
+        return changed
+
+
+timetable_version = VersionedData(TIMETABLE)
+query_cache_version = VersionedData(QUERY_CACHE)
@@ -0,0 +1,154 @@
+import argparse
+import logging
+
+from sqlalchemy import or_, select
+
+from app.capacity import release_orders
+from app.carrier_stats import release_order_stats
+from app.models import (
+    User, Vehicle, Schedule, Order, Wallet, WalletTransaction, Driver, Relation, ShipmentProblem, OrderStatusHistory,
+    PriceList, RelationDailyLoad, CarrierStats,
+)
+
+logger = logging.getLogger(__name__)
+
+# Usuwanie użytkownika razem z zależnymi danymi. Każda tabela czyszczona jest jednym
+# DELETE ... WHERE ... IN (podzapytanie), w kolejności zależności kluczy obcych,
+# więc liczba zapytań nie zależy od liczby pojazdów, relacji i zamówień.
+# Przy podanym `chunk_size` zamówienia (wraz z historią statusów i problemami) usuwane są
+# partiami; `on_chunk` wywoływane po każdej partii może ją zatwierdzić, co ogranicza
+# czas trzymania blokad przy bardzo dużych przewoźnikach.
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def carrier_relations(user_id):
+    return select(Relation.relation_id).join(Vehicle, Vehicle.vehicle_id == Relation.vehicle_id).where(
+        Vehicle.owner_id == user_id
+    )
+
+def carrier_vehicles(user_id):
+    return select(Vehicle.vehicle_id).where(Vehicle.owner_id == user_id)
+
+def carrier_drivers(user_id):
+    return select(Driver.driver_id).where(Driver.owner_id == user_id)
+
+# Warunki wyboru zamówień do usunięcia: zamówienia złożone przez użytkownika,
+# a dla przewoźnika także wszystkie zamówienia na jego relacjach
+def order_criteria(user):
+    if user.user_type == 'carrier':
+        return [or_(Order.user_id == user.user_id, Order.relation_id.in_(carrier_relations(user.user_id)))]
+    return [Order.user_id == user.user_id]
+
+# Zamówienia, których zajętość i statystyki trzeba zwolnić u innych przewoźników.
+# Rejestr zajętości i statystyki samego przewoźnika są usuwane w całości.
+def release_criteria(user):
+    if user.user_type == 'carrier':
+        return [Order.user_id == user.user_id, Order.relation_id.not_in(carrier_relations(user.user_id))]
+    return [Order.user_id == user.user_id]
+
+def _delete(db, model, *criteria):
+    return db.query(model).filter(*criteria).delete(synchronize_session=False)
+
+def delete_orders(db, criteria, release, deleted):
+    release_orders(db, *criteria, *release)
+    release_order_stats(db, *criteria, *release)
+    order_ids = select(Order.order_id).where(*criteria)
+    deleted["order_status_history"] += _delete(db, OrderStatusHistory, OrderStatusHistory.order_id.in_(order_ids))
+    deleted["shipment_problems"] += _delete(db, ShipmentProblem, ShipmentProblem.order_id.in_(order_ids))
+    deleted["orders"] += _delete(db, Order, *criteria)
+
+def delete_orders_in_chunks(db, criteria, release, deleted, chunk_size, on_chunk=None):
+    last_id = 0
+    while True:
+        # Partia wyznaczana po kluczu głównym - kolejne partie nie skanują już usuniętych wierszy
+        chunk = [order_id for (order_id,) in db.query(Order.order_id).filter(
+            *criteria, Order.order_id > last_id
+        ).order_by(Order.order_id).limit(chunk_size)]
+        if not chunk:
+            return
+        last_id = chunk[-1]
+        delete_orders(db, [Order.order_id.in_(chunk)], release, deleted)
+        if on_chunk:
+            on_chunk(deleted)
+
+# Usuwa użytkownika i wszystkie zależne dane; zwraca (liczniki usuniętych wierszy, id usuniętych relacji)
+def delete_user(db, user, chunk_size=None, on_chunk=None):
+    deleted = dict.fromkeys([
+        "order_status_history", "shipment_problems", "orders", "price_list", "relation_daily_load",
+        "schedules", "relations", "vehicles", "drivers", "carrier_stats", "wallet_transactions", "wallets", "users",
+    ], 0)
+    user_id = user.user_id
+    criteria = order_criteria(user)
+    release = release_criteria(user)
+    relation_ids = []
+
+    if chunk_size:
+        delete_orders_in_chunks(db, criteria, release, deleted, chunk_size, on_chunk)
+    else:
+        delete_orders(db, criteria, release, deleted)
+
+    if user.user_type == 'carrier':
+        relations = carrier_relations(user_id)
+        relation_ids = [relation_id for (relation_id,) in db.execute(relations)]
+        deleted["price_list"] = _delete(db, PriceList, PriceList.relation_id.in_(relations))
+        deleted["relation_daily_load"] = _delete(db, RelationDailyLoad, RelationDailyLoad.relation_id.in_(relations))
+        deleted["schedules"] = _delete(db, Schedule, or_(
+            Schedule.vehicle_id.in_(carrier_vehicles(user_id)), Schedule.relation_id.in_(relations)
+        ))
+        deleted["relations"] = _delete(db, Relation, Relation.vehicle_id.in_(carrier_vehicles(user_id)))
+        deleted["vehicles"] = _delete(db, Vehicle, Vehicle.owner_id == user_id)
+
+        # Kierowcy przewoźnika mogą być jeszcze przypisani do zamówień innych przewoźników
+        db.query(Order).filter(Order.driver_id.in_(carrier_drivers(user_id))).update(
+            {Order.driver_id: None}, synchronize_session=False
+        )
+        deleted["drivers"] = _delete(db, Driver, Driver.owner_id == user_id)
+        deleted["carrier_stats"] = _delete(db, CarrierStats, CarrierStats.owner_id == user_id)
+
+    # Problemy zgłoszone przez użytkownika do zamówień, które nie zostały usunięte
+    deleted["shipment_problems"] += _delete(db, ShipmentProblem, ShipmentProblem.user_id == user_id)
+    deleted["wallet_transactions"] = _delete(db, WalletTransaction, WalletTransaction.wallet_id.in_(
+        select(Wallet.wallet_id).where(Wallet.user_id == user_id)
+    ))
+    deleted["wallets"] = _delete(db, Wallet, Wallet.user_id == user_id)
+    deleted["users"] = _delete(db, User, User.user_id == user_id)
+    db.expunge(user)
+    return deleted, relation_ids
+
+
+if __name__ == "__main__":
+    # Usunięcie dużego konta partiami, z zatwierdzaniem i postępem po każdej partii:
+    # python -m app.deletion --email carrier@example.com --user-type carrier [--chunk-size 5000]
+    from app.data_versions import timetable_version
+    from app.database import SessionLocal
+    from app.query_cache import evict_all
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--user-type", required=True)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    def commit_chunk(deleted):
+        db.commit()
+        logger.info(f"Deleted {deleted['orders']} orders so far.")
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == args.email, User.user_type == args.user_type).first()
+        if user is None:
+            raise SystemExit(f"Nie znaleziono użytkownika {args.email}")
+        deleted, _ = delete_user(db, user, args.chunk_size, commit_chunk)
+        # Usunięte relacje, pojazdy i kierowcy - pozostałe procesy odświeżą indeks tras i pamięć podręczną
+        timetable_version.bump(db)
+        evict_all(db)
+        db.commit()
+        logger.info(f"User {args.email} deleted: {deleted}")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
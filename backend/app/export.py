@@ -0,0 +1,101 @@
+import csv
+import io
+import json
+from datetime import datetime, time
+
+from sqlalchemy import select
+
+from app.database import DB_ASYNC, async_engine, engine
+from app.models import Order, OrderStatusHistory, Relation, Vehicle
+
+# Eksport zamówień z historią statusów (wiersz na każdą zmianę statusu).
+# Wiersze czytane są kursorem po stronie serwera i wysyłane partiami, więc zużycie
+# pamięci nie zależy od wielkości eksportu.
+
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+EXPORT_COLUMNS = [
+    Order.order_id,
+    Order.order_code,
+    Order.status,
+    Order.user_id,
+    Vehicle.owner_id.label("carrier_id"),
+    Order.relation_id,
+    Order.driver_id,
+    Order.size,
+    Order.start_stop,
+    Order.end_stop,
+    Order.departure_time,
+    Order.arrival_time,
+    Order.price,
+    Order.created_at,
+    OrderStatusHistory.status.label("history_status"),
+    OrderStatusHistory.changed_at.label("history_changed_at"),
+]
+
+FIELD_NAMES = [column.key for column in EXPORT_COLUMNS]
+
+
+def orders_export_query(carrier_id=None, date_from=None, date_to=None, status=None):
+    query = select(*EXPORT_COLUMNS).join(
+        Relation, Relation.relation_id == Order.relation_id
+    ).join(
+        Vehicle, Vehicle.vehicle_id == Relation.vehicle_id
+    ).outerjoin(
+        OrderStatusHistory, OrderStatusHistory.order_id == Order.order_id
+    )
+    if carrier_id is not None:
+        query = query.where(Vehicle.owner_id == carrier_id)
+    if date_from is not None:
+        query = query.where(Order.departure_time >= datetime.combine(date_from, time.min))
+    if date_to is not None:
+        query = query.where(Order.departure_time <= datetime.combine(date_to, time.max))
+    if status is not None:
+        query = query.where(Order.status == status)
+    return query.order_by(Order.order_id, OrderStatusHistory.change_id).execution_options(
+        stream_results=True, yield_per=EXPORT_BATCH_SIZE
+    )
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return value
+
+def _format_batch(rows, export_format, with_header=False):
+    if export_format == "ndjson":
+        return "".join(
+            json.dumps({name: _value(value) for name, value in zip(FIELD_NAMES, row)}, ensure_ascii=False) + "\n"
+            for row in rows
+        )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if with_header:
+        writer.writerow(FIELD_NAMES)
+    writer.writerows([_value(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+def stream_export(query, export_format):
+    # Każda partia wierszy z kursora jest od razu formatowana i wysyłana do klienta
+    if DB_ASYNC:
+        return _stream_export_async(query, export_format)
+    return _stream_export(query, export_format)
+
+def _stream_export(query, export_format):
+    if export_format == "csv":
+        yield _format_batch([], export_format, with_header=True)
+    with engine.connect() as connection:
+        for rows in connection.execute(query).partitions():
+            yield _format_batch(rows, export_format)
+
+async def _stream_export_async(query, export_format):
+    if export_format == "csv":
+        yield _format_batch([], export_format, with_header=True)
+    async with async_engine.connect() as connection:
+        result = await connection.stream(query)
+        async for rows in result.partitions():
+            yield _format_batch(rows, export_format)
@@ -0,0 +1,158 @@
+import os
+import threading
+from array import array
+
+from app.capacity import SIZE_UNITS
+from app.data_versions import timetable_version
+from app.models import PriceList
+from app.route_index import route_index
+
+# Silnik taryf: wszystkie cenniki (PriceList) trzymane w pamięci procesu jako kolumny
+# array('d') indeksowane numerem slotu relacji, a mnożniki za rozmiar przesyłki jako osobna
+# kolumna indeksowana rozmiarem. Wycena wielu kursów to jedno przejście po kolumnach
+# (bez zapytań do bazy): cena = (opłata bazowa + liczba przystanków * opłata za przystanek) * mnożnik rozmiaru.
+# Cenniki zmienione przez mutacje są oznaczane jako nieaktualne i przeładowywane
+# jednym zapytaniem przy następnej wycenie. Zmiany z innych procesów (inne workery, import z CLI)
+# wykrywa wersja rozkładu (app/data_versions.py) - wtedy tabela wczytywana jest od nowa.
+
+# Mnożniki ceny za rozmiar przesyłki (dotychczas naliczane w formularzu nadania przesyłki)
+FARE_SIZE_FACTORS = os.environ.get("FARE_SIZE_FACTORS", "S=1,M=2,L=3")
+# Maksymalna liczba wycen w jednym zapytaniu quoteFares
+MAX_FARE_QUOTES = int(os.environ.get("MAX_FARE_QUOTES", "1000"))
+
+SIZES = tuple(SIZE_UNITS)
+# Rozmiar spoza SIZE_UNITS wyceniany jest jak największy (tak jak w size_units)
+DEFAULT_SIZE = SIZES[-1]
+
+
+def parse_size_factors(value):
+    factors = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        size, _, factor = item.partition("=")
+        if size not in SIZE_UNITS:
+            raise ValueError(f"Nieznany rozmiar przesyłki w FARE_SIZE_FACTORS: {size}")
+        factors[size] = float(factor)
+    return factors
+
+
+class FareTable:
+    def __init__(self, size_factors=None, version=None):
+        self._lock = threading.RLock()
+        self._slots = {}
+        self._base = array('d')
+        self._per_stop = array('d')
+        self._free = []
+        self._loaded = False
+        self._dirty = set()
+        size_factors = size_factors or {}
+        self._size_index = {size: index for index, size in enumerate(SIZES)}
+        self._size_factors = array('d', (size_factors.get(size, 1.0) for size in SIZES))
+        self._version = version
+        if version is not None:
+            version.on_change(self.reset)
+
+    def invalidate(self, *relation_ids):
+        with self._lock:
+            self._dirty.update(r for r in relation_ids if r is not None)
+
+    def reset(self):
+        with self._lock:
+            self._slots = {}
+            self._base = array('d')
+            self._per_stop = array('d')
+            self._free = []
+            self._loaded = False
+            self._dirty = set()
+
+    # force_check - wersja sprawdzana w bazie niezależnie od DATA_VERSION_CHECK_SECONDS (naliczanie ceny rezerwacji)
+    def ensure_fresh(self, db, force_check=False):
+        if self._version is not None:
+            self._version.check(db, force_check)
+        with self._lock:
+            if not self._loaded:
+                self.load_rows(self._fetch_rows(db), full=True)
+            elif self._dirty:
+                dirty = set(self._dirty)
+                self.load_rows(self._fetch_rows(db, dirty), relation_ids=dirty)
+
+    def _fetch_rows(self, db, relation_ids=None):
+        query = db.query(PriceList.relation_id, PriceList.base_price, PriceList.price_per_stop)
+        if relation_ids is not None:
+            query = query.filter(PriceList.relation_id.in_(relation_ids))
+        return query.all()
+
+    def load_rows(self, rows, relation_ids=None, full=False):
+        # rows: krotki (relation_id, base_price, price_per_stop)
+        with self._lock:
+            if full:
+                self.reset()
+            for relation_id in set(relation_ids or ()):
+                slot = self._slots.pop(relation_id, None)
+                if slot is not None:
+                    self._free.append(slot)
+            for relation_id, base_price, price_per_stop in rows:
+                slot = self._slots.get(relation_id)
+                if slot is None:
+                    slot = self._free.pop() if self._free else len(self._base)
+                    if slot == len(self._base):
+                        self._base.append(0.0)
+                        self._per_stop.append(0.0)
+                    self._slots[relation_id] = slot
+                self._base[slot] = base_price
+                self._per_stop[slot] = price_per_stop
+            self._dirty.difference_update(relation_ids or ())
+            if full:
+                self._dirty.clear()
+            self._loaded = True
+
+    # Wycena partii kursów jednym przejściem. Kolejne argumenty to kolumny tej samej długości:
+    # relacje, liczby przystanków i rozmiary. Relacja bez cennika ma cenę None - nie można na niej nadać
+    # przesyłki (cena 0 oznacza cennik z zerowymi stawkami).
+    def quote(self, relation_ids, stop_counts, sizes):
+        with self._lock:
+            slots = [self._slots.get(relation_id, -1) for relation_id in relation_ids]
+            size_index = [self._size_index.get(size, self._size_index[DEFAULT_SIZE]) for size in sizes]
+            base, per_stop, size_factors = self._base, self._per_stop, self._size_factors
+            return [
+                round((base[slot] + stops * per_stop[slot]) * size_factors[size], 2) if slot >= 0 else None
+                for slot, stops, size in zip(slots, stop_counts, size_index)
+            ]
+
+    def quote_one(self, relation_id, stops, size):
+        return self.quote((relation_id,), (stops,), (size,))[0]
+
+    # Składniki ceny odcinka na relacji dla rozmiaru: (opłata bazowa, opłata za przystanek), już z mnożnikiem
+    # rozmiaru; None, gdy relacja nie ma cennika. Używane przez planer podróży (app/journeys.py).
+    def leg_rates(self, relation_id, size):
+        with self._lock:
+            slot = self._slots.get(relation_id)
+            if slot is None:
+                return None
+            factor = self._size_factors[self._size_index.get(size, self._size_index[DEFAULT_SIZE])]
+            return self._base[slot] * factor, self._per_stop[slot] * factor
+
+
+def stop_count(start, end):
+    return abs(end.order_number - start.order_number)
+
+# Wycena partii zapytań (słowniki relation_id, start_stop, end_stop, size) - cena None dla nieistniejącego kursu
+# albo relacji bez cennika
+def quote_fares(db, requests):
+    if len(requests) > MAX_FARE_QUOTES:
+        raise ValueError(f"Zbyt wiele wycen w jednym zapytaniu (maksymalnie {MAX_FARE_QUOTES})")
+    route_index.ensure_fresh(db)
+    fare_table.ensure_fresh(db)
+    # Przystanki kursu wyznaczane tak samo jak przy rezerwacji (RouteIndex.course_endpoints)
+    endpoints = [route_index.course_endpoints(r["relation_id"], r["start_stop"], r["end_stop"]) for r in requests]
+    stop_counts = [stop_count(*course) if course else None for course in endpoints]
+    priced = [i for i, stops in enumerate(stop_counts) if stops is not None]
+    prices = fare_table.quote(
+        [requests[i]["relation_id"] for i in priced], [stop_counts[i] for i in priced], [requests[i]["size"] for i in priced]
+    )
+    quotes = [{**request, "price": None} for request in requests]
+    for i, price in zip(priced, prices):
+        quotes[i]["price"] = price
+    return quotes
+
+
+fare_table = FareTable(parse_size_factors(FARE_SIZE_FACTORS), timetable_version)
@@ -0,0 +1,141 @@
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from inspect import isawaitable
+
+from ariadne.contrib.tracing.utils import should_trace
+from ariadne.types import Extension
+from sqlalchemy import event
+
+from app.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Pomiary zapytań GraphQL i bazy danych eksportowane na /metrics:
+# czas resolverów (bez domyślnych resolverów pól skalarnych), liczba i łączny czas zapytań SQL
+# w obrębie jednego zapytania GraphQL oraz log wolnych zapytań SQL z nazwą operacji GraphQL.
+# Zapytanie GraphQL, które wykonuje daną instrukcję SQL, wskazuje zmienna kontekstowa current_request
+# (przenoszona także do greenletów AsyncSession.run_sync).
+# Etykieta operation to nazwa operacji z zatwierdzonego przez walidację dokumentu (info.operation),
+# nigdy operationName przysłane przez klienta: zapytania odrzucone przed wykonaniem mają etykietę
+# "invalid", operacje bez nazwy - "anonymous", a po MAX_METRIC_OPERATIONS różnych nazwach kolejne
+# trafiają do "other", żeby liczba serii metryk nie rosła bez ograniczeń.
+
+# Próg logowania wolnych zapytań SQL w sekundach (0 - log wyłączony)
+SLOW_QUERY_SECONDS = float(os.environ.get("SLOW_QUERY_SECONDS", "0.5"))
+MAX_METRIC_OPERATIONS = int(os.environ.get("MAX_METRIC_OPERATIONS", "200"))
+
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+resolver_seconds = registry.histogram(
+    "graphql_resolver_seconds", "Czas wykonania resolvera pola GraphQL (field=Typ.pole)"
+)
+request_seconds = registry.histogram(
+    "graphql_request_seconds", "Czas wykonania zapytania GraphQL (operation)"
+)
+request_db_queries = registry.histogram(
+    "graphql_request_db_queries", "Liczba zapytań SQL na zapytanie GraphQL (operation)", buckets=COUNT_BUCKETS
+)
+request_db_seconds = registry.histogram(
+    "graphql_request_db_seconds", "Łączny czas zapytań SQL na zapytanie GraphQL (operation)"
+)
+db_query_seconds = registry.histogram("db_query_seconds", "Czas wykonania pojedynczego zapytania SQL")
+slow_queries = registry.counter("db_slow_queries_total", "Zapytania SQL dłuższe niż SLOW_QUERY_SECONDS (operation)")
+
+
+# Nazwy operacji, które już mają własne serie metryk
+known_operations = set()
+known_operations_lock = threading.Lock()
+
+def operation_label(operation):
+    if operation.name is None:
+        return "anonymous"
+    name = operation.name.value
+    with known_operations_lock:
+        if name not in known_operations:
+            if len(known_operations) >= MAX_METRIC_OPERATIONS:
+                return "other"
+            known_operations.add(name)
+    return name
+
+
+class RequestStats:
+    def __init__(self):
+        self.operation = "invalid"
+        self.executed = False
+        self.db_queries = 0
+        self.db_seconds = 0.0
+
+
+current_request = ContextVar("current_request", default=None)
+
+
+def record_query(statement, elapsed):
+    db_query_seconds.observe(elapsed)
+    stats = current_request.get()
+    if stats is not None:
+        stats.db_queries += 1
+        stats.db_seconds += elapsed
+    if SLOW_QUERY_SECONDS and elapsed >= SLOW_QUERY_SECONDS:
+        operation = stats.operation if stats is not None else "-"
+        slow_queries.inc(operation=operation)
+        logger.warning(f"Slow query ({elapsed:.3f}s, operation {operation}): {' '.join(statement.split())}")
+
+# Podpina pomiar czasu każdej instrukcji SQL do silnika (w trybie async - do jego fasady synchronicznej)
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        record_query(statement, time.perf_counter() - conn.info["query_started"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+        if started:
+            started.pop()
+
+
+class RequestMetricsExtension(Extension):
+    # Rozszerzenie Ariadne mierzące czas resolverów i zbierające statystyki SQL zapytania
+
+    def __init__(self):
+        self.stats = None
+        self.token = None
+        self.started = None
+
+    def request_started(self, context):
+        self.stats = RequestStats()
+        self.token = current_request.set(self.stats)
+        self.started = time.perf_counter()
+
+    def request_finished(self, context):
+        current_request.reset(self.token)
+        operation = self.stats.operation
+        request_seconds.observe(time.perf_counter() - self.started, operation=operation)
+        request_db_queries.observe(self.stats.db_queries, operation=operation)
+        request_db_seconds.observe(self.stats.db_seconds, operation=operation)
+
+    def resolve(self, next_, obj, info, **kwargs):
+        if self.stats is not None and not self.stats.executed:
+            self.stats.executed = True
+            self.stats.operation = operation_label(info.operation)
+        if not should_trace(info):
+            return next_(obj, info, **kwargs)
+
+        field = f"{info.parent_type.name}.{info.field_name}"
+        started = time.perf_counter()
+        result = next_(obj, info, **kwargs)
+        if isawaitable(result):
+            async def await_result():
+                try:
+                    return await result
+                finally:
+                    resolver_seconds.observe(time.perf_counter() - started, field=field)
+            return await_result()
+        resolver_seconds.observe(time.perf_counter() - started, field=field)
+        return result
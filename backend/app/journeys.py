@@ -0,0 +1,197 @@
+import os
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from app.capacity import get_used_units, size_units
+from app.fares import fare_table, stop_count
+from app.models import User, Vehicle
+from app.route_index import route_index
+
+# Planer podróży z przesiadkami między relacjami (wyszukiwarka kursów znajduje tylko kursy bezpośrednie).
+# Sieć to indeks tras w pamięci (app/route_index.py): każda relacja jest jednym kursem dziennym,
+# a przesiadka możliwa jest na przystanku o tej samej nazwie, nie wcześniej niż JOURNEY_MIN_TRANSFER_MINUTES
+# po przyjeździe. Wyszukiwanie w rundach w stylu RAPTOR: runda k to podróże z k odcinkami, w każdej
+# rundzie skanowane są tylko relacje przechodzące przez przystanki poprawione w poprzedniej rundzie.
+# Każdy przystanek ma zbiór etykiet Pareto (czas przyjazdu, cena), więc wynik to podróże najwcześniej
+# przyjeżdżające i najtańsze (dla remisu - z mniejszą liczbą przesiadek). Ceny z cenników w pamięci
+# (app/fares.py), a pojemność sprawdzana jest po wyszukaniu w rejestrze relation_daily_load - relacje
+# bez miejsca są wykluczane i wyszukiwanie powtarzane.
+
+JOURNEY_MIN_TRANSFER_MINUTES = int(os.environ.get("JOURNEY_MIN_TRANSFER_MINUTES", "30"))
+JOURNEY_DEFAULT_TRANSFERS = int(os.environ.get("JOURNEY_DEFAULT_TRANSFERS", "2"))
+JOURNEY_MAX_TRANSFERS = int(os.environ.get("JOURNEY_MAX_TRANSFERS", "4"))
+JOURNEY_MAX_RESULTS = int(os.environ.get("JOURNEY_MAX_RESULTS", "5"))
+# Ile razy wyszukiwanie jest powtarzane po wykluczeniu relacji bez wolnej pojemności
+JOURNEY_CAPACITY_ROUNDS = 3
+
+# Minimalny odstęp od teraz do odjazdu przy nadaniu na dziś (jak w can_send_today)
+SAME_DAY_NOTICE = timedelta(hours=2)
+
+# Odcinek podróży: przejazd relacją od przystanku `board` do `alight` (StopTime z indeksu tras)
+JourneyLeg = namedtuple("JourneyLeg", ["relation_id", "board", "alight"])
+# Podróż: przyjazd (minuty od północy), cena i odcinki w kolejności przejazdu
+Journey = namedtuple("Journey", ["arrival", "price", "legs"])
+# Etykieta przystanku: przyjazd, cena dotychczasowej podróży, ostatni odcinek i etykieta poprzednia
+Label = namedtuple("Label", ["arrival", "price", "leg", "parent"])
+
+
+def minutes(value):
+    return value.hour * 60 + value.minute
+
+def dominates(label, other):
+    return label.arrival <= other.arrival and label.price <= other.price
+
+# Dodaje etykietę do zbioru Pareto, jeśli nie jest zdominowana; usuwa etykiety, które ona dominuje
+def add_label(bag, label):
+    if any(dominates(other, label) for other in bag):
+        return False
+    bag[:] = [other for other in bag if not dominates(label, other)]
+    bag.append(label)
+    return True
+
+def legs_of(label):
+    legs = []
+    while label.leg is not None:
+        legs.append(label.leg)
+        label = label.parent
+    return legs[::-1]
+
+
+def plan(index, fares, start_stop, end_stop, size, earliest=0, max_transfers=JOURNEY_DEFAULT_TRANSFERS,
+         excluded=frozenset(), min_transfer=JOURNEY_MIN_TRANSFER_MINUTES):
+    if start_stop == end_stop:
+        return []
+    # best: wszystkie dotychczasowe etykiety przystanku (ze wszystkich rund) - etykieta zdominowana
+    # przez którąkolwiek z nich albo przez etykietę celu nie może dać lepszej podróży
+    best = {start_stop: [Label(earliest, 0.0, None, None)], end_stop: []}
+    target = best[end_stop]
+    previous = {start_stop: best[start_stop]}
+    for round_number in range(max_transfers + 1):
+        # Relacje przez przystanki poprawione w poprzedniej rundzie, od pierwszego takiego przystanku
+        queue = {}
+        for stop in previous:
+            for relation_id, position in index.stops_at(stop):
+                if relation_id not in excluded and position < queue.get(relation_id, position + 1):
+                    queue[relation_id] = position
+        slack = min_transfer if round_number else 0
+        improved = {}
+        for relation_id, first in queue.items():
+            rates = fares.leg_rates(relation_id, size)
+            if rates is None:
+                continue  # relacja bez cennika - nie można na niej nadać przesyłki
+            base, per_stop = rates
+            # pojazd -> (cena wsiadającego pomniejszona o order_number * per_stop, przystanek wsiadania, etykieta)
+            boarded = {}
+            for stop_time in index.relation_stops(relation_id)[first:]:
+                current = boarded.get(stop_time.vehicle_id)
+                if current is not None:
+                    value, board, parent = current
+                    label = Label(
+                        minutes(stop_time.arrival_time), value + base + stop_time.order_number * per_stop,
+                        JourneyLeg(relation_id, board, stop_time), parent,
+                    )
+                    if not any(dominates(other, label) for other in target) and add_label(best.setdefault(stop_time.stop, []), label):
+                        add_label(improved.setdefault(stop_time.stop, []), label)
+                # Wsiadamy z najtańszą etykietą poprzedniej rundy, która zdąży na odjazd
+                labels = previous.get(stop_time.stop)
+                if not labels:
+                    continue
+                latest = minutes(stop_time.departure_time) - slack
+                candidates = [label for label in labels if label.arrival <= latest]
+                if candidates:
+                    parent = min(candidates, key=lambda label: label.price)
+                    value = parent.price - stop_time.order_number * per_stop
+                    if current is None or value < current[0]:
+                        boarded[stop_time.vehicle_id] = (value, stop_time, parent)
+        # Do następnej rundy przechodzą tylko etykiety, które przetrwały do końca tej rundy
+        previous = {stop: [label for label in labels if any(label is kept for kept in best[stop])] for stop, labels in improved.items()}
+        previous = {stop: labels for stop, labels in previous.items() if labels and stop != end_stop}
+        if not previous:
+            break
+
+    journeys = [Journey(label.arrival, label.price, legs_of(label)) for label in target]
+    return sorted(journeys, key=lambda journey: (journey.arrival, journey.price, len(journey.legs)))
+
+
+# Podróże z `start_stop` do `end_stop` w dniu `departure_date` z wolną pojemnością na każdym odcinku
+def find_journeys(db, start_stop, end_stop, size, departure_date, earliest=0, max_transfers=JOURNEY_DEFAULT_TRANSFERS,
+                  limit=JOURNEY_MAX_RESULTS):
+    if not 0 <= max_transfers <= JOURNEY_MAX_TRANSFERS:
+        raise ValueError(f"Liczba przesiadek musi być z zakresu 0-{JOURNEY_MAX_TRANSFERS}")
+    route_index.ensure_fresh(db)
+    fare_table.ensure_fresh(db)
+    required_capacity = size_units(size)
+    vehicles, used = {}, {}
+    excluded = set()
+    for _ in range(JOURNEY_CAPACITY_ROUNDS + 1):
+        journeys = plan(route_index, fare_table, start_stop, end_stop, size, earliest, max_transfers, excluded)[:limit]
+        legs = [leg for journey in journeys for leg in journey.legs]
+        # Pojazdy i zajętość tylko dla relacji, których jeszcze nie sprawdzano - po jednym zapytaniu
+        vehicle_ids = {leg.board.vehicle_id for leg in legs} - vehicles.keys()
+        if vehicle_ids:
+            vehicles.update(
+                (vehicle_id, (capacity, company_name))
+                for vehicle_id, capacity, company_name in db.query(Vehicle.vehicle_id, Vehicle.capacity, User.company_name)
+                .join(User, Vehicle.owner_id == User.user_id)
+                .filter(Vehicle.vehicle_id.in_(vehicle_ids))
+            )
+        relation_ids = {leg.relation_id for leg in legs} - used.keys()
+        if relation_ids:
+            used.update(dict.fromkeys(relation_ids, 0))
+            used.update(get_used_units(db, relation_ids, departure_date))
+        full = {
+            leg.relation_id for leg in legs
+            if leg.board.vehicle_id not in vehicles
+            or used[leg.relation_id] + required_capacity > vehicles[leg.board.vehicle_id][0]
+        }
+        if not full:
+            break
+        excluded |= full
+    journeys = [journey for journey in journeys if not any(leg.relation_id in excluded for leg in journey.legs)]
+    results = [journey_result(journey, size, vehicles) for journey in journeys]
+    return [result for result in results if result is not None]
+
+# None, gdy cennik którejś relacji został usunięty w trakcie wyszukiwania
+def journey_result(journey, size, vehicles):
+    prices = fare_table.quote(
+        [leg.relation_id for leg in journey.legs],
+        [stop_count(leg.board, leg.alight) for leg in journey.legs],
+        [size] * len(journey.legs),
+    )
+    if None in prices:
+        return None
+    legs = [{
+        "relation_id": leg.relation_id,
+        "vehicle_id": leg.board.vehicle_id,
+        "company_name": vehicles[leg.board.vehicle_id][1],
+        "start_stop": leg.board.stop,
+        "end_stop": leg.alight.stop,
+        "departure_time": leg.board.departure_time.strftime('%H:%M'),
+        "arrival_time": leg.alight.arrival_time.strftime('%H:%M'),
+        "price": price,
+    } for leg, price in zip(journey.legs, prices)]
+    return {
+        "legs": legs,
+        "transfers": len(legs) - 1,
+        "departure_time": legs[0]["departure_time"],
+        "arrival_time": legs[-1]["arrival_time"],
+        "total_price": round(sum(prices), 2),
+    }
+
+# Najwcześniejszy odjazd (minuty od północy) przy nadaniu na dziś; None, gdy dziś nie da się już nadać
+def same_day_earliest(now):
+    earliest = now + SAME_DAY_NOTICE
+    if earliest.date() != now.date():
+        return None
+    return earliest.hour * 60 + earliest.minute + (1 if earliest.second or earliest.microsecond else 0)
+
+def plan_journey(db, start_stop, end_stop, size, today_delivery, max_transfers=None, now=None):
+    now = now or datetime.now()
+    if max_transfers is None:
+        max_transfers = JOURNEY_DEFAULT_TRANSFERS
+    if today_delivery:
+        earliest = same_day_earliest(now)
+        if earliest is None:
+            return []
+        return find_journeys(db, start_stop, end_stop, size, now.date(), earliest, max_transfers)
+    return find_journeys(db, start_stop, end_stop, size, (now + timedelta(days=1)).date(), 0, max_transfers)
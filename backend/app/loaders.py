@@ -0,0 +1,99 @@
+from collections import defaultdict
+
+from aiodataloader import DataLoader
+
+from app.database import request_session, run_in_session
+from app.models import User, Vehicle, Relation, Driver, Wallet, PriceList, OrderStatusHistory, Schedule, Order
+from app.wallets import balances
+
+# Loadery zbierają klucze pól zagnieżdżonych z całego poziomu odpowiedzi i ładują je jednym zapytaniem.
+# Zapytania nie są wykonywane w osobnym wątku: idą przez run_in_session na sesji bieżącego zapytania
+# GraphQL (app/database.py) - w trybie synchronicznym bezpośrednio w pętli zdarzeń, a przy DB_ASYNC=1
+# przez AsyncSession.run_sync i sterownik async, szeregowane blokadą sesji z resolverami głównymi.
+
+
+class ModelLoader(DataLoader):
+    # Ładuje obiekty modelu po kolumnie klucza: jedno zapytanie `IN (...)` na paczkę kluczy.
+    # Gdy `many=True`, dla każdego klucza zwracana jest lista obiektów (relacje jeden-do-wielu).
+
+    def __init__(self, context, column, many=False, order_by=None):
+        super().__init__()
+        self.context = context
+        self.column = column
+        self.many = many
+        self.order_by = order_by
+
+    async def batch_load_fn(self, keys):
+        return await run_in_session(self.context, self.fetch, keys)
+
+    def fetch(self, keys):
+        # Zapytanie w sesji bieżącego zapytania GraphQL - jedno połączenie z puli na zapytanie
+        # i obiekty z tej samej mapy tożsamości co w resolverach głównych
+        db = request_session(self.context)
+        query = db.query(self.column.class_).filter(self.column.in_(set(keys)))
+        if self.order_by is not None:
+            query = query.order_by(self.order_by)
+        rows = query.all()
+
+        key_name = self.column.key
+        if self.many:
+            grouped = defaultdict(list)
+            for row in rows:
+                grouped[getattr(row, key_name)].append(row)
+            return [grouped.get(key, []) for key in keys]
+
+        by_key = {getattr(row, key_name): row for row in rows}
+        return [by_key.get(key) for key in keys]
+
+
+class WalletBalanceLoader(DataLoader):
+    # Bieżące salda portfeli (saldo rozliczone + nierozliczone transakcje) jednym zapytaniem na paczkę kluczy
+
+    def __init__(self, context):
+        super().__init__()
+        self.context = context
+
+    async def batch_load_fn(self, keys):
+        return await run_in_session(self.context, self.fetch, keys)
+
+    def fetch(self, keys):
+        found = balances(request_session(self.context), keys)
+        return [found.get(key) for key in keys]
+
+
+# Definicje loaderów dostępnych w kontekście zapytania
+LOADERS = {
+    "users": lambda context: ModelLoader(context, User.user_id),
+    "vehicles": lambda context: ModelLoader(context, Vehicle.vehicle_id),
+    "relations": lambda context: ModelLoader(context, Relation.relation_id),
+    "drivers": lambda context: ModelLoader(context, Driver.driver_id),
+    "orders": lambda context: ModelLoader(context, Order.order_id),
+    "wallets_by_user": lambda context: ModelLoader(context, Wallet.user_id),
+    "wallet_balances": lambda context: WalletBalanceLoader(context),
+    "price_lists": lambda context: ModelLoader(context, PriceList.relation_id),
+    "status_history": lambda context: ModelLoader(context, OrderStatusHistory.order_id, many=True, order_by=OrderStatusHistory.change_id),
+    "schedules_by_relation": lambda context: ModelLoader(context, Schedule.relation_id, many=True, order_by=Schedule.schedule_id),
+}
+
+
+class Loaders:
+    # Zestaw loaderów dla jednego zapytania GraphQL; loadery tworzone są przy pierwszym
+    # użyciu, aby powstały wewnątrz pętli zdarzeń obsługującej zapytanie
+
+    def __init__(self, context):
+        self._context = context
+        self._loaders = {}
+
+    def __getattr__(self, name):
+        if name not in LOADERS:
+            raise AttributeError(name)
+        if name not in self._loaders:
+            self._loaders[name] = LOADERS[name](self._context)
+        return self._loaders[name]
+
+
+def get_loaders(info):
+    context = info.context
+    if "loaders" not in context:
+        context["loaders"] = Loaders(context)
+    return context["loaders"]
@@ -1,14 +1,46 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from ariadne import load_schema_from_path, make_executable_schema
 from ariadne.asgi import GraphQL
+from ariadne.asgi.handlers import GraphQLTransportWSHandler
 
-from app.resolvers import query, mutation
+from app.resolvers import query, mutation, subscription, object_types
+from app.loaders import Loaders
+from app.persisted_queries import PersistedQueryHandler, parse_cached, validate_cached
+from app.query_cost import query_cost_rules
+from app.instrumentation import RequestMetricsExtension
+from app.metrics import registry
+from app.export import EXPORT_FORMATS, orders_export_query, stream_export
+from app.outbox import start_workers, worker_session_factory
+from app.wallets import start_settler
 
 type_defs = load_schema_from_path("app/schema.graphql")
-schema = make_executable_schema(type_defs, query, mutation)
+schema = make_executable_schema(type_defs, query, mutation, subscription, *object_types)
+
+# Kontekst zapytania GraphQL: nowy zestaw loaderów dla każdego zapytania.
+# Sesja bazy danych ("db") tworzona jest przy pierwszym użyciu i zamykana przez DatabaseSessionHandler.
+def get_context_value(request, data=None):
+    context = {"request": request}
+    context["loaders"] = Loaders(context)
+    return context
+
+# Pula wątków przetwarzająca zdarzenia outbox (wypłaty, statystyki, powiadomienia) i rozliczanie
+# portfeli działają razem z aplikacją
+@asynccontextmanager
+async def lifespan(_app):
+    outbox_workers = start_workers()
+    wallet_settler = start_settler(worker_session_factory())
+    yield
+    for background in (wallet_settler, outbox_workers):
+        if background is not None:
+            background.stop()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Dodaj middleware CORS
 app.add_middleware(
@@ -19,8 +51,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.mount("/graphql", GraphQL(schema, debug=True))
+# Zapytania utrwalone (APQ) także metodą GET; sparsowane i zwalidowane dokumenty są zapamiętywane.
+# Zapytania ponad budżet kosztu lub głębokości odrzucane są przy walidacji (app/query_cost.py).
+# Subskrypcje przez WebSocket (protokół graphql-transport-ws z biblioteki graphql-ws).
+app.mount("/graphql", GraphQL(
+    schema,
+    context_value=get_context_value,
+    http_handler=PersistedQueryHandler(extensions=[RequestMetricsExtension]),
+    websocket_handler=GraphQLTransportWSHandler(),
+    query_parser=parse_cached,
+    query_validator=validate_cached,
+    validation_rules=query_cost_rules(schema),
+    execute_get_queries=True,
+    debug=True,
+))
+
+# Metryki w formacie tekstowym Prometheusa (m.in. czasy resolverów i zapytań SQL - app/instrumentation.py)
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    return registry.render()
 
 @app.get("/")
 def read_root():
     return {"Hello": "World"}
+
+# Eksport zamówień z historią statusów (CSV lub NDJSON) strumieniowany partiami
+@app.get("/export/orders")
+def export_orders(
+    export_format: str = Query("csv", alias="format"),
+    carrier_id: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    status: Optional[str] = None,
+):
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Nieobsługiwany format eksportu: {export_format}")
+    query = orders_export_query(carrier_id=carrier_id, date_from=date_from, date_to=date_to, status=status)
+    return StreamingResponse(
+        stream_export(query, export_format),
+        media_type=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="orders.{export_format}"'},
+    )
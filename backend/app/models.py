@@ -1,4 +1,6 @@
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, func, ForeignKey, Float
+from datetime import datetime
+
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, Date, func, ForeignKey, Float, Index, JSON, Numeric
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 import sqlalchemy as sa
@@ -25,13 +27,35 @@ class User(Base):
     orders = relationship("Order", order_by="Order.order_id", back_populates="user")
     shipment_problems = relationship("ShipmentProblem", order_by="ShipmentProblem.problem_id", back_populates="user")
 
+    __table_args__ = (
+        Index('ix_users_email_user_type', 'email', 'user_type'),
+    )
+
 class Wallet(Base):
     __tablename__ = 'wallets'
     wallet_id = Column(Integer, primary_key=True, index=True)
-    balance = Column(Float, nullable=False, default=0.0)
-    user_id = Column(Integer, ForeignKey('users.user_id'), nullable=False)
+    # Saldo rozliczonych transakcji; bieżące saldo to balance + nierozliczone transakcje (app/wallets.py)
+    balance = Column(Numeric(12, 2), nullable=False, default=0)
+    settled_at = Column(DateTime, nullable=True)
+    user_id = Column(Integer, ForeignKey('users.user_id'), nullable=False, index=True)
     user = relationship("User", back_populates="wallet")
 
+# Księga portfela - wiersze tylko dopisywane; settled_at ustawiane przy przeniesieniu kwoty do Wallet.balance
+class WalletTransaction(Base):
+    __tablename__ = 'wallet_transactions'
+    transaction_id = Column(Integer, primary_key=True)
+    wallet_id = Column(Integer, ForeignKey('wallets.wallet_id'), nullable=False)
+    amount = Column(Numeric(12, 2), nullable=False)
+    kind = Column(String(30), nullable=False)
+    order_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+    settled_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_wallet_transactions_wallet_id_settled_at', 'wallet_id', 'settled_at'),
+        Index('ix_wallet_transactions_settled_at_created_at', 'settled_at', 'created_at'),
+    )
+
 class Vehicle(Base):
     __tablename__ = 'vehicles'
     vehicle_id = Column(Integer, primary_key=True, index=True)
@@ -59,7 +83,7 @@ class Schedule(Base):
     __tablename__ = 'schedules'
     schedule_id = Column(Integer, primary_key=True, index=True)
     vehicle_id = Column(Integer, ForeignKey('vehicles.vehicle_id'), nullable=False)
-    stop = Column(String(100), nullable=False)
+    stop = Column(String(100), nullable=False, index=True)
     arrival_time = Column(DateTime, nullable=False)
     departure_time = Column(DateTime, nullable=False)
     created_at = Column(DateTime, server_default=func.now())
@@ -68,6 +92,11 @@ class Schedule(Base):
     vehicle = relationship("Vehicle", back_populates="schedules")
     relation = relationship("Relation", back_populates="schedules")
 
+    __table_args__ = (
+        Index('ix_schedules_relation_id_order_number', 'relation_id', 'order_number'),
+        Index('ix_schedules_vehicle_id_order_number', 'vehicle_id', 'order_number'),
+    )
+
 class Order(Base):
     __tablename__ = 'orders'
     order_id = Column(Integer, primary_key=True, index=True)
@@ -82,7 +111,7 @@ class Order(Base):
     arrival_time = Column(DateTime, nullable=False)
     price = Column(Float, nullable=False)
     created_at = Column(DateTime, server_default=func.now())
-    order_code = Column(String(14), nullable=False)
+    order_code = Column(String(14), nullable=False, unique=True, index=True)
     pickup_code = Column(String(4), nullable=False, default="0000")
     delivery_code = Column(String(4), nullable=False, default="0000")
     deleted_by_user = Column(Boolean, default=False)
@@ -94,6 +123,12 @@ class Order(Base):
     problems = relationship("ShipmentProblem", order_by="ShipmentProblem.problem_id", back_populates="order")
     status_history = relationship("OrderStatusHistory", order_by="OrderStatusHistory.change_id", back_populates="order", lazy="joined")
 
+    __table_args__ = (
+        Index('ix_orders_user_id_deleted_by_user', 'user_id', 'deleted_by_user'),
+        Index('ix_orders_relation_id_departure_time_status', 'relation_id', 'departure_time', 'status'),
+        Index('ix_orders_driver_id_status', 'driver_id', 'status'),
+    )
+
 class Driver(Base):
     __tablename__ = 'drivers'
     driver_id = Column(Integer, primary_key=True, index=True)
@@ -111,7 +146,7 @@ class ShipmentProblem(Base):
     order_id = Column(Integer, ForeignKey('orders.order_id'), nullable=False)
     user_id = Column(Integer, ForeignKey('users.user_id'), nullable=False)
     description = Column(String(255), nullable=True)
-    status = Column(String(20), nullable=False, default='Interwencja')
+    status = Column(String(20), nullable=False, default='Interwencja', index=True)
     created_at = Column(DateTime, server_default=func.now())
 
     order = relationship("Order", back_populates="problems")
@@ -134,6 +169,69 @@ class PriceList(Base):
 
     relation = relationship("Relation", back_populates="price_list")
 
+class RelationDailyLoad(Base):
+    __tablename__ = 'relation_daily_load'
+    relation_id = Column(Integer, ForeignKey('relations.relation_id'), primary_key=True)
+    date = Column(Date, primary_key=True)
+    used_units = Column(Integer, nullable=False, default=0)
+
+# Statystyki przewoźnika: liczba zamówień i suma ich cen dla każdego statusu (utrzymywane przyrostowo)
+class CarrierStats(Base):
+    __tablename__ = 'carrier_stats'
+    owner_id = Column(Integer, ForeignKey('users.user_id'), primary_key=True)
+    status = Column(String(20), primary_key=True)
+    order_count = Column(Integer, nullable=False, default=0)
+    total_price = Column(Float, nullable=False, default=0.0)
+
+# Agregaty analityczne zamówień w przedziałach godzinowych ('hour') i dziennych ('day') dla każdej relacji
+# i przewoźnika, do którego relacja należała. Bez kluczy obcych - historia zostaje po usunięciu relacji lub przewoźnika.
+class OrderRollup(Base):
+    __tablename__ = 'order_rollups'
+    period = Column(String(5), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    relation_id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, primary_key=True)
+    orders_created = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+    deliveries = Column(Integer, nullable=False, default=0)
+    interventions = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_order_rollups_period_owner_id_bucket_start', 'period', 'owner_id', 'bucket_start'),
+        Index('ix_order_rollups_period_relation_id_bucket_start', 'period', 'relation_id', 'bucket_start'),
+    )
+
+# Znacznik czasu, do którego dane źródłowe zostały już ujęte w agregatach
+class RollupWatermark(Base):
+    __tablename__ = 'rollup_watermarks'
+    name = Column(String(50), primary_key=True)
+    watermark = Column(DateTime, nullable=True)
+
+# Wersje danych trzymanych w pamięci procesów aplikacji (app/data_versions.py) - zwiększane w transakcji
+# zmieniającej dane, dzięki czemu inne procesy (workery uvicorn, import z CLI) wiedzą, że muszą je wczytać ponownie
+class DataVersion(Base):
+    __tablename__ = 'data_versions'
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+# Skutki uboczne zmian zamówień (rozliczenie portfela, statystyki, powiadomienia) zapisywane w tej samej
+# transakcji co zmiana i przetwarzane później przez pulę wątków app.outbox (transactional outbox)
+class OutboxEvent(Base):
+    __tablename__ = 'outbox_events'
+    event_id = Column(Integer, primary_key=True)
+    event_type = Column(String(50), nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+    # Najwcześniejszy czas przetworzenia - przesuwany przy ponowieniach po błędzie
+    available_at = Column(DateTime, nullable=False, default=datetime.now)
+    attempts = Column(Integer, nullable=False, default=0)
+    processed_at = Column(DateTime, nullable=True)
+    last_error = Column(String(500), nullable=True)
+
+    __table_args__ = (
+        Index('ix_outbox_events_processed_at_available_at', 'processed_at', 'available_at'),
+    )
+
 # Relacje między tabelami
 User.drivers = relationship("Driver", order_by=Driver.driver_id, back_populates="owner")
 User.vehicles = relationship("Vehicle", order_by=Vehicle.vehicle_id, back_populates="owner")
@@ -0,0 +1,67 @@
+from datetime import datetime
+
+from app.database import after_commit
+from app.models import Relation, Vehicle
+from app.pubsub import broker
+
+# Zdarzenia zmian zamówień dla subskrypcji GraphQL (orderStatusChanged, interventionReported).
+# Zdarzenie zawiera tylko zmienione pola zamówienia, więc panele aktualizują listy bez ponownego
+# pobierania. Każde zdarzenie trafia na kanał ogólny i kanały klienta, przewoźnika i kierowcy,
+# a publikacja następuje dopiero po zatwierdzeniu transakcji zapytania.
+
+ORDER_STATUS_CHANNEL = "order_status"
+INTERVENTION_CHANNEL = "interventions"
+
+
+def channel(name, key=None, value=None):
+    return name if key is None else f"{name}:{key}:{value}"
+
+def order_carrier_id(db, order):
+    return db.query(Vehicle.owner_id).join(Relation, Relation.vehicle_id == Vehicle.vehicle_id).filter(
+        Relation.relation_id == order.relation_id
+    ).scalar()
+
+def publish_after_commit(db, name, event, keys):
+    for key in (None, *keys):
+        if key is None or event.get(key) is not None:
+            after_commit(db, broker.publish, channel(name, key, event.get(key)), event)
+
+def order_status_event(db, order, changed_at=None):
+    driver = order.driver
+    return {
+        "order_id": order.order_id,
+        "order_code": order.order_code,
+        "status": order.status,
+        "changed_at": str(changed_at or datetime.now().replace(microsecond=0)),
+        "user_id": order.user_id,
+        "carrier_id": order_carrier_id(db, order),
+        "driver_id": order.driver_id,
+        "driver_first_name": driver.first_name if driver else None,
+        "driver_last_name": driver.last_name if driver else None,
+    }
+
+# Wywoływane po zmianie statusu zamówienia (po flush, przed zatwierdzeniem)
+def order_status_changed(db, order, status_history=None):
+    event = order_status_event(db, order, status_history.changed_at if status_history is not None else None)
+    publish_after_commit(db, ORDER_STATUS_CHANNEL, event, ("user_id", "carrier_id", "driver_id"))
+
+def intervention_reported(db, problem, order):
+    event = {
+        "problem_id": problem.problem_id,
+        "order_id": order.order_id,
+        "order_code": order.order_code,
+        "user_id": problem.user_id,
+        "carrier_id": order_carrier_id(db, order),
+        "description": problem.description,
+        "status": problem.status,
+        "created_at": str(problem.created_at or datetime.now().replace(microsecond=0)),
+    }
+    publish_after_commit(db, INTERVENTION_CHANNEL, event, ("carrier_id",))
+
+# Źródło subskrypcji: kanał najbardziej szczegółowego filtra, pozostałe filtry sprawdzane na zdarzeniu
+async def subscribe_events(name, **filters):
+    filters = {key: value for key, value in filters.items() if value is not None}
+    key = next(iter(filters), None)
+    async for event in broker.subscribe(channel(name, key, filters.get(key))):
+        if all(event.get(key) == value for key, value in filters.items()):
+            yield event
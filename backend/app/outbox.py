@@ -0,0 +1,274 @@
+import argparse
+import functools
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.carrier_stats import adjust_stats
+from app.database import DB_ASYNC, SQLALCHEMY_DATABASE_URL, SessionLocal, after_commit
+from app.metrics import registry
+from app.models import OutboxEvent, Relation, Vehicle
+from app.order_events import order_carrier_id
+from app.wallets import DELIVERY_PAYOUT, record, wallet_ids
+
+logger = logging.getLogger(__name__)
+
+# Transactional outbox: mutacje zapisują zdarzenie w tabeli outbox_events w tej samej transakcji
+# co zmianę zamówienia, a skutki uboczne (wypłata do portfela przewoźnika, statystyki przewoźnika,
+# powiadomienia) wykonuje pula wątków poza zapytaniem. Zdarzenia pobierane są partiami
+# (SELECT ... FOR UPDATE SKIP LOCKED), więc wiele wątków i procesów może je przetwarzać równolegle.
+# Partia przetwarzana jest w jednej transakcji razem z oznaczeniem zdarzeń jako przetworzone;
+# po błędzie zdarzenia ponawiane są pojedynczo z wykładniczo rosnącym opóźnieniem.
+
+OUTBOX_WORKERS = int(os.environ.get("OUTBOX_WORKERS", "2"))  # 0 - tylko osobny proces `python -m app.outbox`
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_POLL_SECONDS = float(os.environ.get("OUTBOX_POLL_SECONDS", "1"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_RETRY_SECONDS = float(os.environ.get("OUTBOX_RETRY_SECONDS", "5"))
+OUTBOX_MAX_RETRY_SECONDS = 3600
+
+ORDER_STATUS_CHANGED = "order_status_changed"
+ORDER_DELIVERED = "order_delivered"
+
+outbox_events = registry.counter("outbox_events_total", "Przetworzone zdarzenia outbox (event_type, result=processed|failed)")
+outbox_batch_seconds = registry.histogram("outbox_batch_seconds", "Czas przetwarzania partii zdarzeń outbox")
+
+# typ zdarzenia -> funkcje (db, zdarzenia) wywoływane dla całej partii
+handlers = defaultdict(list)
+# Ustawiane po zatwierdzeniu transakcji ze zdarzeniami - wątki nie czekają do kolejnego odpytania
+work_available = threading.Event()
+
+
+def handler(event_type):
+    def register(fn):
+        handlers[event_type].append(fn)
+        return fn
+    return register
+
+def enqueue(db, event_type, payload):
+    db.add(OutboxEvent(event_type=event_type, payload=payload))
+    after_commit(db, work_available.set)
+
+# Zmiana statusu zamówienia; `previous_status` - status przed zmianą. Przewoźnik zapisywany jest w zdarzeniu
+# w transakcji zmiany - późniejsze usunięcie relacji lub zmiana jej pojazdu nie zmienia, komu zdarzenie jest naliczane.
+def enqueue_status_change(db, order, previous_status, owner_id=None):
+    enqueue(db, ORDER_STATUS_CHANGED, {
+        "order_id": order.order_id,
+        "relation_id": order.relation_id,
+        "owner_id": owner_id if owner_id is not None else order_carrier_id(db, order),
+        "previous_status": previous_status,
+        "status": order.status,
+        "price": order.price or 0.0,
+    })
+
+# Doręczenie przesyłki - cena zamówienia trafia do portfela przewoźnika
+def enqueue_delivery(db, order, owner_id=None):
+    enqueue(db, ORDER_DELIVERED, {
+        "order_id": order.order_id,
+        "relation_id": order.relation_id,
+        "owner_id": owner_id if owner_id is not None else order_carrier_id(db, order),
+        "price": order.price or 0.0,
+    })
+
+# Przewoźnicy zdarzeń partii (w kolejności zdarzeń). Zdarzenia zapisane przed dodaniem owner_id
+# do treści - przez relację, jednym zapytaniem.
+def event_carriers(db, events):
+    legacy = {event.payload["relation_id"] for event in events if "owner_id" not in event.payload}
+    carriers = dict(db.query(Relation.relation_id, Vehicle.owner_id).join(
+        Vehicle, Vehicle.vehicle_id == Relation.vehicle_id
+    ).filter(Relation.relation_id.in_(legacy))) if legacy else {}
+    return [
+        event.payload["owner_id"] if "owner_id" in event.payload else carriers.get(event.payload["relation_id"])
+        for event in events
+    ]
+
+
+@handler(ORDER_STATUS_CHANGED)
+def update_carrier_stats(db, events):
+    deltas = defaultdict(lambda: [0, 0.0])
+    for event, owner_id in zip(events, event_carriers(db, events)):
+        price = event.payload["price"]
+        for status, sign in ((event.payload["previous_status"], -1), (event.payload["status"], 1)):
+            if status is not None:
+                deltas[(owner_id, status)][0] += sign
+                deltas[(owner_id, status)][1] += sign * price
+    for (owner_id, status), (count, total) in deltas.items():
+        adjust_stats(db, owner_id, status, count, total)
+
+@handler(ORDER_STATUS_CHANGED)
+def notify_status_change(db, events):
+    for event in events:
+        logger.info(f"Order {event.payload['order_id']} status changed: {event.payload['previous_status']} -> {event.payload['status']}")
+
+@handler(ORDER_DELIVERED)
+def settle_deliveries(db, events):
+    carriers = event_carriers(db, events)
+    wallets = wallet_ids(db, {owner_id for owner_id in carriers if owner_id is not None})
+    entries = []
+    for event, owner_id in zip(events, carriers):
+        wallet_id = wallets.get(owner_id)
+        if wallet_id is None:
+            # Błąd obsługi zamiast pominięcia - zdarzenie zostaje ponowione, a po OUTBOX_MAX_ATTEMPTS
+            # pozostaje nieprzetworzone (z last_error) do wyjaśnienia
+            raise ValueError(f"Przewoźnik {owner_id} zamówienia {event.payload['order_id']} nie ma portfela")
+        entries.append({"wallet_id": wallet_id, "amount": event.payload["price"], "kind": DELIVERY_PAYOUT, "order_id": event.payload["order_id"]})
+    # Wypłaty całej partii jednym INSERT do księgi - bez blokowania wierszy portfeli przewoźników
+    record(db, entries)
+
+
+def dispatch(db, events):
+    by_type = defaultdict(list)
+    for event in events:
+        by_type[event.event_type].append(event)
+    for event_type, batch in by_type.items():
+        for fn in handlers.get(event_type, ()):
+            fn(db, batch)
+
+def claim_events(db, limit, now):
+    return db.query(OutboxEvent).filter(
+        OutboxEvent.processed_at.is_(None),
+        OutboxEvent.available_at <= now,
+        OutboxEvent.attempts < OUTBOX_MAX_ATTEMPTS,
+    ).order_by(OutboxEvent.event_id).limit(limit).with_for_update(skip_locked=True).all()
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(OUTBOX_RETRY_SECONDS * 2 ** (attempts - 1), OUTBOX_MAX_RETRY_SECONDS))
+
+# Przetwarza jedną partię zdarzeń; transakcję zatwierdza wywołujący. Zwraca liczbę pobranych zdarzeń.
+def process_batch(db, batch_size=OUTBOX_BATCH_SIZE, now=None):
+    now = now or datetime.now()
+    events = claim_events(db, batch_size, now)
+    if not events:
+        return 0
+
+    failed = {}
+    try:
+        with db.begin_nested():
+            dispatch(db, events)
+    except Exception as e:
+        # Jedno błędne zdarzenie nie blokuje pozostałych - ponowienie partii po jednym zdarzeniu
+        logger.warning(f"Outbox batch of {len(events)} events failed ({str(e)}), retrying one by one")
+        for event in events:
+            try:
+                with db.begin_nested():
+                    dispatch(db, [event])
+            except Exception as event_error:
+                failed[event.event_id] = event_error
+
+    for event in events:
+        event.attempts += 1
+        error = failed.get(event.event_id)
+        if error is None:
+            event.processed_at = now
+            outbox_events.inc(event_type=event.event_type, result="processed")
+            continue
+        event.last_error = str(error)[:500]
+        event.available_at = now + retry_delay(event.attempts)
+        outbox_events.inc(event_type=event.event_type, result="failed")
+        if event.attempts >= OUTBOX_MAX_ATTEMPTS:
+            logger.error(f"Outbox event {event.event_id} ({event.event_type}) failed {event.attempts} times: {event.last_error}")
+    db.flush()
+    return len(events)
+
+# Usuwa zdarzenia przetworzone przed `before`
+def purge_processed(db, before):
+    return db.query(OutboxEvent).filter(OutboxEvent.processed_at < before).delete(synchronize_session=False)
+
+
+# Wątki nie mogą korzystać z fasady silnika async - w trybie DB_ASYNC dostają wspólny, osobny silnik synchroniczny
+@functools.lru_cache(maxsize=None)
+def worker_session_factory():
+    if DB_ASYNC:
+        return sessionmaker(bind=create_engine(SQLALCHEMY_DATABASE_URL, pool_pre_ping=True), autoflush=False)
+    return SessionLocal
+
+
+class OutboxWorkerPool:
+    def __init__(self, session_factory, workers=OUTBOX_WORKERS, batch_size=OUTBOX_BATCH_SIZE, poll_seconds=OUTBOX_POLL_SECONDS):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def drain_once(self):
+        db = self.session_factory()
+        started = datetime.now()
+        try:
+            processed = process_batch(db, self.batch_size)
+            db.commit()
+            if processed:
+                outbox_batch_seconds.observe((datetime.now() - started).total_seconds())
+            return processed
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Outbox worker error: {str(e)}")
+            return 0
+        finally:
+            db.close()
+
+    def run(self):
+        while not self._stopping.is_set():
+            if self.drain_once():
+                continue
+            work_available.wait(self.poll_seconds)
+            work_available.clear()
+
+    def start(self):
+        for number in range(self.workers):
+            thread = threading.Thread(target=self.run, name=f"outbox-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.workers} outbox workers.")
+
+    def stop(self):
+        self._stopping.set()
+        work_available.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+
+def start_workers():
+    if OUTBOX_WORKERS <= 0:
+        return None
+    pool = OutboxWorkerPool(worker_session_factory())
+    pool.start()
+    return pool
+
+
+if __name__ == "__main__":
+    # Osobny proces przetwarzający zdarzenia (np. przy OUTBOX_WORKERS=0 w aplikacji):
+    # python -m app.outbox --workers 4
+    # Usunięcie zdarzeń przetworzonych ponad 7 dni temu: python -m app.outbox --purge-days 7
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=max(OUTBOX_WORKERS, 1))
+    parser.add_argument("--purge-days", type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    session_factory = worker_session_factory()
+    if args.purge_days is not None:
+        db = session_factory()
+        try:
+            purged = purge_processed(db, datetime.now() - timedelta(days=args.purge_days))
+            db.commit()
+            logger.info(f"Purged {purged} processed outbox events.")
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    else:
+        pool = OutboxWorkerPool(session_factory, workers=args.workers)
+        pool.start()
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pool.stop()
@@ -0,0 +1,54 @@
+import base64
+
+# Stronicowanie kursorami w stylu Relay (first/after). Strona wyznaczana jest warunkiem
+# `klucz > kursor` na kolumnie z indeksem (klucz główny), więc koszt zapytania zależy
+# od rozmiaru strony, a nie od liczby wierszy w tabeli.
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+CURSOR_PREFIX = "cursor:"
+
+
+def encode_cursor(value):
+    return base64.urlsafe_b64encode(f"{CURSOR_PREFIX}{value}".encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        value = base64.urlsafe_b64decode(cursor.encode()).decode()
+        if not value.startswith(CURSOR_PREFIX):
+            raise ValueError(cursor)
+        return int(value[len(CURSOR_PREFIX):])
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"Nieprawidłowy kursor: {cursor}")
+
+def page_size(first):
+    if first is None:
+        return DEFAULT_PAGE_SIZE
+    if first < 1:
+        raise ValueError("Parametr first musi być dodatni")
+    return min(first, MAX_PAGE_SIZE)
+
+# Zwraca stronę wyników jako słownik zgodny z typami *Connection ze schema.graphql.
+# `key_column` - kolumna klucza stronicowania, `key` i `node` - opcjonalne funkcje zwracające
+# klucz i węzeł dla wiersza (potrzebne, gdy zapytanie zwraca krotki kilku encji).
+def paginate(query, key_column, first=None, after=None, key=None, node=None):
+    limit = page_size(first)
+    if after is not None:
+        query = query.filter(key_column > decode_cursor(after))
+    rows = query.order_by(key_column).limit(limit + 1).all()
+
+    has_next_page = len(rows) > limit
+    rows = rows[:limit]
+    if key is None:
+        key = lambda row: getattr(row, key_column.key)
+    edges = [{"cursor": encode_cursor(key(row)), "node": node(row) if node else row} for row in rows]
+    return {
+        "edges": edges,
+        "pageInfo": {
+            "hasNextPage": has_next_page,
+            "hasPreviousPage": after is not None,
+            "startCursor": edges[0]["cursor"] if edges else None,
+            "endCursor": edges[-1]["cursor"] if edges else None,
+        },
+    }
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+
+from ariadne.exceptions import HttpBadRequestError
+from graphql import parse, validate
+
+from app.cache import LRUCache
+from app.database import DatabaseSessionHandler
+
+# Automatyczne zapytania utrwalone (APQ, protokół Apollo) i pamięć sparsowanych dokumentów.
+# Klient wysyła tylko skrót sha256 zapytania (extensions.persistedQuery.sha256Hash),
+# a pełny tekst jedynie przy pierwszym użyciu - po odpowiedzi PersistedQueryNotFound.
+# Dokumenty GraphQL trzymane są w LRU po skrócie tekstu zapytania, więc każde zapytanie
+# jest parsowane i walidowane raz na proces, także gdy klient wysyła pełny tekst.
+
+PERSISTED_QUERY_CACHE_SIZE = int(os.environ.get("PERSISTED_QUERY_CACHE_SIZE", "1000"))
+# Cache-Control dla odpowiedzi na zapytania GET (0 - bez nagłówka)
+GRAPHQL_GET_MAX_AGE = int(os.environ.get("GRAPHQL_GET_MAX_AGE", "0"))
+
+PERSISTED_QUERY_NOT_FOUND = "PersistedQueryNotFound"
+
+# skrót sha256 -> (tekst zapytania, DocumentNode)
+documents = LRUCache(max_size=PERSISTED_QUERY_CACHE_SIZE)
+# (id dokumentu, reguły walidacji) -> dokument, który przeszedł walidację bez błędów
+validated_documents = LRUCache(max_size=PERSISTED_QUERY_CACHE_SIZE)
+
+
+class PersistedQueryError(Exception):
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+def get_document(query, sha256_hash=None):
+    sha256_hash = sha256_hash or query_hash(query)
+    return documents.get_or_load(sha256_hash, lambda: (query, parse(query)))[1]
+
+# query_parser dla Ariadne: parsowanie tylko przy pierwszym wystąpieniu danego tekstu zapytania
+def parse_cached(_context, data):
+    return get_document(data["query"])
+
+# query_validator dla Ariadne: dokument z pamięci, który już przeszedł walidację, nie jest walidowany ponownie
+def validate_cached(schema, document, rules=None, **kwargs):
+    key = (id(document), tuple(rules or ()))
+    if validated_documents.get(key) is document:
+        return []
+    errors = validate(schema, document, rules=rules, **kwargs)
+    if not errors:
+        # Wpis trzyma referencję do dokumentu, więc jego id nie zostanie użyte ponownie przez inny obiekt
+        validated_documents.set(key, document)
+    return errors
+
+def _load_json_param(request, name):
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        raise HttpBadRequestError(f"Parametr {name} nie jest poprawnym JSON-em")
+
+def persisted_query_hash(data):
+    if not isinstance(data, dict) or not isinstance(data.get("extensions"), dict):
+        return None
+    persisted_query = data["extensions"].get("persistedQuery")
+    if not isinstance(persisted_query, dict):
+        return None
+    if persisted_query.get("version") != 1 or not isinstance(persisted_query.get("sha256Hash"), str):
+        raise PersistedQueryError("Nieobsługiwana wersja zapytania utrwalonego", "PERSISTED_QUERY_NOT_SUPPORTED")
+    return persisted_query["sha256Hash"]
+
+# Uzupełnia dane zapytania APQ o tekst zapytania; zwraca (dane, dokument albo None)
+def resolve_persisted_query(data):
+    sha256_hash = persisted_query_hash(data)
+    if sha256_hash is None:
+        return data, None
+    query = data.get("query")
+    if query:
+        if query_hash(query) != sha256_hash:
+            raise PersistedQueryError("Skrót nie odpowiada treści zapytania", "PERSISTED_QUERY_HASH_MISMATCH")
+        return data, get_document(query, sha256_hash)
+    entry = documents.get(sha256_hash)
+    if entry is None:
+        raise PersistedQueryError(PERSISTED_QUERY_NOT_FOUND, "PERSISTED_QUERY_NOT_FOUND")
+    query, document = entry
+    return {**data, "query": query}, document
+
+
+class PersistedQueryHandler(DatabaseSessionHandler):
+    # Zapytania (query) mogą być wysyłane metodą GET z samym skrótem w `extensions`,
+    # dzięki czemu odpowiedzi da się buforować po adresie URL
+
+    async def handle_request_override(self, request):
+        if request.method == "GET" and self.execute_get_queries and request.query_params.get("extensions"):
+            return await self.graphql_http_server(request)
+        return None
+
+    async def extract_data_from_request(self, request):
+        if request.method == "GET" and self.execute_get_queries and request.query_params.get("extensions"):
+            return self.extract_data_from_get_request(request)
+        return await super().extract_data_from_request(request)
+
+    def extract_data_from_get_request(self, request):
+        extensions = request.query_params.get("extensions")
+        query = request.query_params.get("query")
+        if query is not None:
+            data = super().extract_data_from_get_request(request)
+        else:
+            data = {
+                "query": None,
+                "operationName": request.query_params.get("operationName") or None,
+                "variables": _load_json_param(request, "variables"),
+            }
+        if extensions:
+            data["extensions"] = _load_json_param(request, "extensions")
+        return data
+
+    async def execute_graphql_query(self, request, data, *, context_value=None, query_document=None):
+        try:
+            data, persisted_document = resolve_persisted_query(data)
+        except PersistedQueryError as error:
+            # Odpowiedź 200 jak w Apollo Server - klient ponawia zapytanie z pełnym tekstem
+            return True, {"errors": [{"message": str(error), "extensions": {"code": error.code}}]}
+        return await super().execute_graphql_query(
+            request, data, context_value=context_value, query_document=query_document or persisted_document
+        )
+
+    async def create_json_response(self, request, result, success):
+        response = await super().create_json_response(request, result, success)
+        if request.method == "GET" and GRAPHQL_GET_MAX_AGE and success and not result.get("errors"):
+            response.headers["Cache-Control"] = f"public, max-age={GRAPHQL_GET_MAX_AGE}"
+        return response
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from collections import defaultdict
+
+try:
+    import redis
+    import redis.asyncio as redis_asyncio
+except ImportError:
+    redis = None
+    redis_asyncio = None
+
+logger = logging.getLogger(__name__)
+
+# Publikacja/subskrypcja zdarzeń dla subskrypcji GraphQL (WebSocket).
+# Domyślnie broker działa w pamięci procesu - wystarcza przy jednym procesie aplikacji.
+# PUBSUB_URL=redis://... przełącza na kanały Redis, dzięki czemu zdarzenie opublikowane
+# w jednym procesie trafia do subskrybentów połączonych z innymi procesami.
+# Wiadomości to słowniki zgodne z JSON.
+
+PUBSUB_URL = os.environ.get("PUBSUB_URL")
+# Maksymalna liczba zaległych wiadomości jednego subskrybenta; nadmiarowe są odrzucane
+SUBSCRIBER_QUEUE_SIZE = int(os.environ.get("PUBSUB_QUEUE_SIZE", "1000"))
+
+
+class InMemoryBackend:
+    def __init__(self, queue_size=SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        # kanał -> {(pętla zdarzeń, kolejka subskrybenta)}
+        self._subscribers = defaultdict(set)
+
+    def _deliver(self, queue, channel, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            logger.warning(f"Subscriber queue full, dropping message on channel {channel}")
+
+    # Można wywołać z dowolnego wątku; wiadomość trafia do kolejki w pętli zdarzeń subskrybenta
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(self._deliver, queue, channel, message)
+
+    async def subscribe(self, channel):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=self.queue_size))
+        with self._lock:
+            self._subscribers[channel].add(subscriber)
+        try:
+            while True:
+                yield await subscriber[1].get()
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(subscriber)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+    def subscriber_count(self, channel):
+        return len(self._subscribers.get(channel, ()))
+
+
+class RedisBackend:
+    def __init__(self, url, prefix="pubsub:"):
+        if redis is None:
+            raise Exception("Broker Redis wymaga pakietu redis (pip install redis)")
+        self.url = url
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def publish(self, channel, message):
+        self._client.publish(self.prefix + channel, json.dumps(message))
+
+    async def subscribe(self, channel):
+        client = redis_asyncio.Redis.from_url(self.url)
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(self.prefix + channel)
+        try:
+            async for message in pubsub.listen():
+                yield json.loads(message["data"])
+        finally:
+            await pubsub.unsubscribe(self.prefix + channel)
+            await pubsub.aclose()
+            await client.aclose()
+
+
+class Broker:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def publish(self, channel, message):
+        try:
+            self.backend.publish(channel, message)
+        except Exception as e:
+            # Zdarzenia publikowane są po zatwierdzeniu transakcji - błąd brokera nie może jej cofnąć
+            logger.error(f"Error publishing to channel {channel}: {str(e)}")
+
+    def subscribe(self, channel):
+        return self.backend.subscribe(channel)
+
+
+def create_broker():
+    if PUBSUB_URL:
+        return Broker(RedisBackend(PUBSUB_URL))
+    return Broker(InMemoryBackend())
+
+broker = create_broker()
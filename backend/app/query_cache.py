@@ -0,0 +1,90 @@
+import functools
+import json
+import os
+
+from sqlalchemy import inspect
+
+from app.cache import LRUCache, RedisCache
+from app.data_versions import query_cache_version
+from app.database import after_commit, get_session
+from app.metrics import registry
+
+# Pamięć podręczna wyników rzadko zmienianych zapytań (pojazdy, relacje, kierowcy, rozkłady, cenniki).
+# Domyślnie LRU z TTL w pamięci procesu; QUERY_CACHE_URL=redis://... włącza pamięć współdzieloną.
+# Wpisy oznaczane są tagami encji ("owner:5", "vehicle:3", "relation:7"), a mutacje
+# usuwają tagi zmienionych encji po zatwierdzeniu transakcji (evict_tags).
+# Pamięć w procesie zna tylko zmiany z własnego procesu, dlatego evict_tags zwiększa też wersję
+# query_cache w tabeli data_versions (app/data_versions.py). Pozostałe workery uvicorn i narzędzia
+# CLI (app.timetable, app.deletion) wykrywają zmianę przy odczycie (najwyżej raz na
+# DATA_VERSION_CHECK_SECONDS) i czyszczą całą swoją pamięć. Pamięć Redis jest współdzielona
+# i wersji nie potrzebuje.
+# Zapamiętywane są tylko kolumny obiektów z zapytania głównego - pola zagnieżdżone
+# nadal ładują loadery, więc zawsze są aktualne.
+
+QUERY_CACHE_URL = os.environ.get("QUERY_CACHE_URL")
+QUERY_CACHE_TTL = int(os.environ.get("QUERY_CACHE_TTL", "300"))
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", "4096"))
+
+query_cache_requests = registry.counter(
+    "query_cache_requests_total", "Odczyty pamięci podręcznej wyników zapytań (result=hit|miss)"
+)
+
+
+def create_query_cache():
+    if QUERY_CACHE_URL:
+        return RedisCache(QUERY_CACHE_URL, ttl=QUERY_CACHE_TTL, prefix="query_cache:")
+    return LRUCache(max_size=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+
+query_cache = create_query_cache()
+if not QUERY_CACHE_URL:
+    query_cache_version.on_change(query_cache.clear)
+
+
+def owner_tag(owner_id):
+    return f"owner:{owner_id}"
+
+def vehicle_tag(vehicle_id):
+    return f"vehicle:{vehicle_id}"
+
+def relation_tag(relation_id):
+    return f"relation:{relation_id}"
+
+# Obiekty ORM zamieniane są na słowniki kolumn, które można bezpiecznie współdzielić między zapytaniami
+def cacheable(value):
+    if isinstance(value, list):
+        return [cacheable(item) for item in value]
+    if value is None or isinstance(value, dict):
+        return value
+    return {attr.key: getattr(value, attr.key) for attr in inspect(value).mapper.column_attrs}
+
+# Dekorator resolvera zapytania; `tags` zwraca tagi wpisu na podstawie argumentów zapytania
+def cached_query(name, tags):
+    def decorator(resolver):
+        @functools.wraps(resolver)
+        def resolve_cached(obj, info, **kwargs):
+            if not QUERY_CACHE_URL:
+                query_cache_version.check(get_session(info))
+            key = f"{name}:{json.dumps(kwargs, sort_keys=True, default=str)}"
+            loaded = []
+
+            def load():
+                loaded.append(True)
+                return cacheable(resolver(obj, info, **kwargs))
+
+            value = query_cache.get_or_load(key, load, [tag for tag in tags(**kwargs) if tag is not None])
+            query_cache_requests.inc(query=name, result="miss" if loaded else "hit")
+            return value
+        return resolve_cached
+    return decorator
+
+# Usunięcie wpisów z tagami zmienionych encji po zatwierdzeniu transakcji
+def evict_tags(db, *tags):
+    after_commit(db, query_cache.invalidate_tags, *tags)
+    if not QUERY_CACHE_URL:
+        after_commit(db, query_cache_version.committed, query_cache_version.bump(db))
+
+# Zmiana poza resolverami (narzędzia CLI) - bez listy zmienionych encji czyszczona jest cała pamięć
+def evict_all(db):
+    after_commit(db, query_cache.clear)
+    if not QUERY_CACHE_URL:
+        after_commit(db, query_cache_version.committed, query_cache_version.bump(db))
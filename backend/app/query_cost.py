@@ -0,0 +1,206 @@
+import os
+
+from graphql import (
+    FieldNode, FragmentDefinitionNode, FragmentSpreadNode, GraphQLError, GraphQLList, GraphQLNonNull,
+    InlineFragmentNode, IntValueNode, OperationDefinitionNode, ValidationRule, get_named_type, is_composite_type,
+)
+
+from app.cache import LRUCache
+from app.metrics import registry
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+# Analiza kosztu zapytań GraphQL przed wykonaniem. Schemat jest cykliczny (Order.relation.vehicle.owner,
+# Schedule.relation.schedules), a część list nie ma stronicowania, więc jedno zapytanie może rozwinąć się
+# w miliony pól. Koszt pola = waga pola + szacowana długość listy * koszt pól zagnieżdżonych.
+# Zapytania przekraczające budżet (MAX_QUERY_COST) albo głębokość (MAX_QUERY_DEPTH) są odrzucane
+# na etapie walidacji, a wyliczony koszt trafia do `extensions.cost` odpowiedzi.
+# Koszt zależy tylko od dokumentu (zmienna `first` liczona jest jako MAX_PAGE_SIZE), więc jest
+# zapamiętywany razem z dokumentem i nie psuje pamięci walidacji z persisted_queries.
+
+MAX_QUERY_COST = int(os.environ.get("MAX_QUERY_COST", "20000"))
+MAX_QUERY_DEPTH = int(os.environ.get("MAX_QUERY_DEPTH", "12"))
+
+# Domyślne wagi: pole główne (osobne zapytanie do bazy), pole z obiektem (resolver albo loader), skalar
+ROOT_FIELD_WEIGHT = 10
+OBJECT_FIELD_WEIGHT = 1
+SCALAR_FIELD_WEIGHT = 0
+
+# Wagi pól odbiegające od domyślnych ("Typ.pole")
+FIELD_WEIGHTS = {
+    "Query.getAvailableCourses": 50,
+    "Query.getAnalyticsBreakdown": 20,
+    "Query.getAnalyticsTimeSeries": 20,
+    "Query.getCarrierStats": 20,
+    "Mutation.deleteUser": 100,
+    "Mutation.importSchedules": 50,
+}
+
+# Szacowana długość list bez stronicowania ("Typ.pole")
+DEFAULT_LIST_SIZE = 20
+LIST_SIZES = {
+    "Query.getAllOrders": 1000,
+    "Query.getAllUsers": 500,
+    "Query.getCarrierOrders": 500,
+    "Query.getDriverOrders": 200,
+    "Query.getInterventionOrders": 100,
+    "Query.getUserOrders": 100,
+    "Query.getAvailableCourses": 50,
+    "Query.getAnalyticsTimeSeries": 48,
+    "Relation.schedules": 20,
+    "Order.status_history": 5,
+}
+
+query_cost_histogram = registry.histogram(
+    "graphql_query_cost", "Wyliczony koszt zapytań GraphQL",
+    buckets=(10, 50, 100, 500, 1000, 2500, 5000, 10000, 20000, 50000),
+)
+
+# id dokumentu -> (dokument, koszt, głębokość)
+analyses = LRUCache(max_size=1000)
+
+
+def is_list_type(type_):
+    if isinstance(type_, GraphQLNonNull):
+        type_ = type_.of_type
+    return isinstance(type_, GraphQLList)
+
+# Liczba elementów strony dla pola z argumentem `first` (zmienna - najgorszy przypadek)
+def requested_page_size(field):
+    for argument in field.arguments or ():
+        if argument.name.value == "first":
+            if isinstance(argument.value, IntValueNode):
+                return max(1, min(int(argument.value.value), MAX_PAGE_SIZE))
+            return MAX_PAGE_SIZE
+    return DEFAULT_PAGE_SIZE
+
+def field_weight(key, type_, is_root):
+    if key in FIELD_WEIGHTS:
+        return FIELD_WEIGHTS[key]
+    if is_root:
+        return ROOT_FIELD_WEIGHT
+    return OBJECT_FIELD_WEIGHT if is_composite_type(get_named_type(type_)) else SCALAR_FIELD_WEIGHT
+
+
+class CostAnalysis:
+    def __init__(self, schema, document):
+        self.schema = schema
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document.definitions if isinstance(definition, FragmentDefinitionNode)
+        }
+        # (nazwa fragmentu, strona, pole główne) -> (koszt, głębokość). Bez tego fragment rozwijany byłby
+        # przy każdym użyciu, a dokument, w którym każdy fragment używa poprzedniego dwa razy, rośnie
+        # wykładniczo z liczbą fragmentów (22 fragmenty to sekundy analizy na każde żądanie)
+        self.fragment_costs = {}
+        self.expanding = set()
+
+    def operation(self, operation):
+        root_type = self.schema.get_root_type(operation.operation)
+        if root_type is None:
+            return 0, 0
+        return self.selections(root_type, operation.selection_set, is_root=True, page=None)
+
+    # Zwraca (koszt, głębokość) zbioru pól; `page` - rozmiar strony połączenia (*Connection) nadrzędnego
+    def selections(self, parent_type, selection_set, is_root, page):
+        cost = depth = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                field_cost, field_depth = self.field(parent_type, selection, is_root, page)
+            elif isinstance(selection, InlineFragmentNode):
+                type_ = self.schema.get_type(selection.type_condition.name.value) if selection.type_condition else parent_type
+                if type_ is None:
+                    continue
+                field_cost, field_depth = self.selections(type_, selection.selection_set, is_root, page)
+            elif isinstance(selection, FragmentSpreadNode):
+                field_cost, field_depth = self.fragment(selection.name.value, is_root, page)
+            else:
+                continue
+            cost += field_cost
+            depth = max(depth, field_depth)
+        return cost, depth
+
+    def fragment(self, name, is_root, page):
+        key = (name, page, is_root)
+        if key in self.fragment_costs:
+            return self.fragment_costs[key]
+        fragment = self.fragments.get(name)
+        # Cykle fragmentów odrzuca walidacja (NoFragmentCycles) - tu wystarczy ich nie rozwijać
+        if fragment is None or key in self.expanding:
+            return 0, 0
+        type_ = self.schema.get_type(fragment.type_condition.name.value)
+        if type_ is None:
+            return 0, 0
+        self.expanding.add(key)
+        try:
+            result = self.selections(type_, fragment.selection_set, is_root, page)
+        finally:
+            self.expanding.discard(key)
+        self.fragment_costs[key] = result
+        return result
+
+    def field(self, parent_type, field, is_root, page):
+        name = field.name.value
+        fields = getattr(parent_type, "fields", None)
+        # Pola introspekcji i nieznane pola (zgłasza je walidacja) nie mają kosztu
+        if name.startswith("__") or not fields or name not in fields:
+            return 0, 0
+        definition = fields[name]
+        key = f"{parent_type.name}.{name}"
+        weight = field_weight(key, definition.type, is_root)
+        child_page = requested_page_size(field) if "first" in definition.args else None
+
+        child_cost = child_depth = 0
+        if field.selection_set:
+            child_cost, child_depth = self.selections(
+                get_named_type(definition.type), field.selection_set, False, child_page
+            )
+        multiplier = 1
+        if is_list_type(definition.type):
+            # Lista krawędzi połączenia ma długość strony zapytanej w polu nadrzędnym
+            multiplier = page if page is not None and name == "edges" else LIST_SIZES.get(key, DEFAULT_LIST_SIZE)
+        return weight + multiplier * child_cost, child_depth + 1
+
+
+# Koszt dokumentu: maksimum po operacjach (koszt i głębokość), zapamiętywane dla dokumentu
+def analyze_document(schema, document):
+    entry = analyses.get(id(document))
+    if entry is not None and entry[0] is document:
+        return entry[1], entry[2]
+    analysis = CostAnalysis(schema, document)
+    cost = depth = 0
+    for definition in document.definitions:
+        if isinstance(definition, OperationDefinitionNode):
+            operation_cost, operation_depth = analysis.operation(definition)
+            cost, depth = max(cost, operation_cost), max(depth, operation_depth)
+    # Wpis trzyma referencję do dokumentu, więc jego id nie zostanie użyte ponownie przez inny obiekt
+    analyses.set(id(document), (document, cost, depth))
+    return cost, depth
+
+
+class QueryCostRule(ValidationRule):
+    # Reguła walidacji odrzucająca zbyt kosztowne i zbyt głębokie zapytania przed wykonaniem
+
+    def enter_document(self, node, *_args):
+        cost, depth = analyze_document(self.context.schema, node)
+        if depth > MAX_QUERY_DEPTH:
+            self.report_error(GraphQLError(
+                f"Zapytanie jest zbyt głębokie: {depth} poziomów (maksymalnie {MAX_QUERY_DEPTH})", node,
+                extensions={"code": "QUERY_TOO_DEEP"},
+            ))
+        if cost > MAX_QUERY_COST:
+            self.report_error(GraphQLError(
+                f"Zapytanie jest zbyt kosztowne: koszt {cost} (maksymalnie {MAX_QUERY_COST})", node,
+                extensions={"code": "QUERY_TOO_COMPLEX"},
+            ))
+        return self.SKIP
+
+
+# validation_rules dla Ariadne: zapisuje koszt zapytania w kontekście (raportowany w extensions)
+# i zwraca stałą listę reguł, więc wynik walidacji dokumentu nadal może być zapamiętany
+def query_cost_rules(schema):
+    def get_validation_rules(context, document, _data):
+        cost, depth = analyze_document(schema, document)
+        query_cost_histogram.observe(cost)
+        context["query_cost"] = {"requested": cost, "maximum": MAX_QUERY_COST, "depth": depth}
+        return [QueryCostRule]
+    return get_validation_rules
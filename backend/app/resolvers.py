@@ -1,29 +1,81 @@
 from datetime import datetime, timedelta
-from ariadne import QueryType, MutationType
-from app.models import User, Vehicle, Schedule, Order, Wallet, Driver, Relation, ShipmentProblem, OrderStatusHistory, PriceList
-from app.database import SessionLocal
+from ariadne import QueryType, MutationType, ObjectType, ScalarType, SubscriptionType
+from app.models import User, Vehicle, Schedule, Order, Wallet, WalletTransaction, Driver, Relation, ShipmentProblem, OrderStatusHistory, PriceList, RelationDailyLoad
+from starlette.concurrency import run_in_threadpool
+from app.database import DB_ASYNC, AsyncSessionLocal, SessionLocal, get_session, after_commit, async_resolver
+from app.route_index import route_index
+from app.data_versions import timetable_version
+from app.booking import book_order, book_order_async
+from app.fares import fare_table, quote_fares, stop_count
+from app.journeys import plan_journey
+from app.codes import add_with_unique_code, driver_codes
+from app.loaders import get_loaders
+from app.pagination import paginate
+from app.cache import LRUCache
+from app.query_cache import cached_query, evict_tags, owner_tag, vehicle_tag, relation_tag
+from app.stop_catalogue import DEFAULT_SEARCH_LIMIT, stop_catalogue
+from app.capacity import size_units, order_load, track_order, get_used_units
+from app.analytics import time_series, breakdown
+from app.deletion import delete_user
+from app.timetable import import_schedules, reorder_schedules
+from app.carrier_stats import COMPLETED_STATUS, NEW_STATUS, order_stat, track_order_stats, get_carrier_stats
+from app.outbox import enqueue_delivery, enqueue_status_change
+from app.wallets import set_balance
+from app.order_events import (
+    INTERVENTION_CHANNEL, ORDER_STATUS_CHANNEL, intervention_reported, order_carrier_id, order_status_changed,
+    subscribe_events,
+)
 import logging, random
-from sqlalchemy import func, select
-from sqlalchemy.orm import joinedload
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import aliased, joinedload
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-query = QueryType()
-mutation = MutationType()
+class SessionFields:
+    # W trybie DB_ASYNC resolvery główne rejestrowane są jako `async def` wykonywane w AsyncSession.run_sync,
+    # funkcje w module pozostają synchroniczne
+    def create_register_resolver(self, name):
+        register = super().create_register_resolver(name)
+        def register_resolver(f):
+            register(async_resolver(f) if DB_ASYNC else f)
+            return f
+        return register_resolver
+
+class SessionQueryType(SessionFields, QueryType):
+    pass
+
+class SessionMutationType(SessionFields, MutationType):
+    pass
+
+# Przystanki dostępne z danego przystanku początkowego (klucz: startStop)
+available_stops_cache = LRUCache(max_size=1024)
+timetable_version.on_change(available_stops_cache.clear)
+
+query = SessionQueryType()
+# Mutacje jednego dokumentu GraphQL dzielą sesję zatwierdzaną na końcu zapytania. Mutacja, która przechwytuje
+# własny błąd, wykonuje się w SAVEPOINT (db.begin_nested()) - błąd wycofuje tylko jej zmiany, a nie zmiany
+# wcześniejszych mutacji tego samego dokumentu (db.rollback() wycofałby całą transakcję zapytania).
+mutation = SessionMutationType()
+subscription = SubscriptionType()
+
+# Wywoływane po każdej zmianie rozkładu jazdy, aby odświeżyć indeks tras, katalog przystanków
+# i przystanki dostępne z przystanku.
+# Unieważnienie następuje dopiero po zatwierdzeniu transakcji zapytania.
+def timetable_changed(db, *relation_ids):
+    # Wersja w bazie powiadamia pozostałe procesy aplikacji (app/data_versions.py)
+    after_commit(db, timetable_version.committed, timetable_version.bump(db))
+    after_commit(db, route_index.invalidate, *relation_ids)
+    after_commit(db, fare_table.invalidate, *relation_ids)
+    after_commit(db, available_stops_cache.clear)
+    after_commit(db, stop_catalogue.invalidate)
+    evict_tags(db, *[relation_tag(relation_id) for relation_id in relation_ids if relation_id is not None])
+
+# Zmiana listy relacji pojazdu - usuwa z pamięci podręcznej relacje pojazdu i przewoźnika
+def vehicle_relations_changed(db, vehicle_id):
+    owner_id = db.query(Vehicle.owner_id).filter(Vehicle.vehicle_id == vehicle_id).scalar()
+    evict_tags(db, vehicle_tag(vehicle_id), owner_tag(owner_id))
 
-def generate_driver_id_code(db):
-    while True:
-        code = str(random.randint(100000000, 999999999))
-        if not db.query(Driver).filter(Driver.driver_id_code == code).first():
-            return code
-
-def generate_unique_order_code(db):
-    while True:
-        code = ''.join([str(random.randint(0, 9)) for _ in range(14)])
-        if not db.query(Order).filter(Order.order_code == code).first():
-            return code
-        
 def generate_random_code():
     return str(random.randint(1000, 9999))
 
@@ -46,10 +98,9 @@ def can_send_today(departure_time_str, current_time):
 # Rejestracja przewoźnika
 @mutation.field("registerCarrier")
 def resolve_register_carrier(_, info, email, password, company_name, postal_code, city, street, phoneNumber=None):
-    session = SessionLocal()
+    session = get_session(info)
     existing_user = session.query(User).filter(User.email == email, User.user_type == 'carrier').first()
     if existing_user:
-        session.close()
         return {"message": "Email already registered as carrier", "user_id": None, "email": email, "token": ""}
     
     user = User(
@@ -65,35 +116,31 @@ def resolve_register_carrier(_, info, email, password, company_name, postal_code
     wallet = Wallet(balance=0.0, user=user)
     session.add(user)
     session.add(wallet)
-    session.commit()
+    session.flush()
     user_id = user.user_id
-    session.close()
     return {"message": "User registered", "user_id": user_id, "email": email, "token": "some-token-value"}
 
 # Rejestracja klienta
 @mutation.field("registerCustomer")
 def resolve_register_customer(_, info, firstName, lastName, email, password, phoneNumber=None):
-    session = SessionLocal()
+    session = get_session(info)
     existing_user = session.query(User).filter(User.email == email, User.user_type == 'customer').first()
     if existing_user:
-        session.close()
         return {"message": "Email already registered as customer", "user_id": None, "email": email, "token": ""}
 
     user = User(email=email, password=password, first_name=firstName, last_name=lastName, user_type='customer', phone_number=phoneNumber)
     wallet = Wallet(balance=0.0, user=user)
     session.add(user)
     session.add(wallet)
-    session.commit()
+    session.flush()
     user_id = user.user_id
-    session.close()
     return {"message": "User registered", "user_id": user_id, "email": email, "token": "some-token-value"}
 
 # Logowanie przewoźnika
 @mutation.field("loginCarrier")
 def resolve_login_carrier(_, info, email, password):
-    session = SessionLocal()
+    session = get_session(info)
     user = session.query(User).filter(User.email == email, User.password == password, User.user_type == 'carrier').first()
-    session.close()
     if user:
         return {"message": "User logged in", "user_id": user.user_id, "token": "some-token-value", "email": user.email}
     else:
@@ -102,9 +149,8 @@ def resolve_login_carrier(_, info, email, password):
 # Logowanie klienta
 @mutation.field("loginCustomer")
 def resolve_login_customer(_, info, email, password):
-    session = SessionLocal()
+    session = get_session(info)
     user = session.query(User).filter(User.email == email, User.password == password, User.user_type == 'customer').first()
-    session.close()
     if user:
         return {"message": "User logged in", "user_id": user.user_id, "token": "some-token-value", "email": user.email}
     else:
@@ -113,9 +159,8 @@ def resolve_login_customer(_, info, email, password):
 # Logowanie administratora
 @mutation.field("loginAdmin")
 def resolve_login_admin(_, info, email, password):
-    session = SessionLocal()
+    session = get_session(info)
     user = session.query(User).filter(User.email == email, User.password == password, User.user_type == 'admin').first()
-    session.close()
     if user:
         return {"message": "User logged in", "user_id": user.user_id, "token": "some-token-value", "email": user.email}
     else:
@@ -124,81 +169,35 @@ def resolve_login_admin(_, info, email, password):
 # Usuwanie użytkownika
 @mutation.field("deleteUser")
 def resolve_delete_user(_, info, email, user_type):
-    db = SessionLocal()
+    db = get_session(info)
     try:
-        # Znajdź użytkownika na podstawie emaila i typu użytkownika
-        user = db.query(User).filter(User.email == email, User.user_type == user_type).first()
-
-        if not user:
-            logger.warning(f"User {email} not found.")
-            return "User not found"
-
-        # Obsługa usuwania danych dla przewoźnika (carrier)
-        if user.user_type == 'carrier':
-            # Znajdź pojazdy przewoźnika
-            vehicles = db.query(Vehicle).filter(Vehicle.owner_id == user.user_id).all()
-            for vehicle in vehicles:
-                # Usuń wszystkie rozkłady jazdy związane z pojazdem
-                db.query(Schedule).filter(Schedule.vehicle_id == vehicle.vehicle_id).delete()
-
-                # Usuń wszystkie relacje powiązane z pojazdem
-                relations = db.query(Relation).filter(Relation.vehicle_id == vehicle.vehicle_id).all()
-                for relation in relations:
-                    # Usuń wszystkie rozkłady jazdy związane z relacją
-                    db.query(Schedule).filter(Schedule.relation_id == relation.relation_id).delete()
-
-                    # Usuń powiązane cenniki
-                    db.query(PriceList).filter(PriceList.relation_id == relation.relation_id).delete()
-
-                    # Usuń zamówienia powiązane z relacją
-                    db.query(Order).filter(Order.relation_id == relation.relation_id).delete()
-
-                    # Usuń relację
-                    db.delete(relation)
-
-                # Usuń pojazd
-                db.delete(vehicle)
-
-            # Usuń kierowców powiązanych z przewoźnikiem
-            db.query(Driver).filter(Driver.owner_id == user.user_id).delete()
+        with db.begin_nested():
+            # Znajdź użytkownika na podstawie emaila i typu użytkownika
+            user = db.query(User).filter(User.email == email, User.user_type == user_type).first()
 
-            # Usuń zamówienia przewoźnika
-            db.query(Order).filter(Order.user_id == user.user_id).delete()
+            if not user:
+                logger.warning(f"User {email} not found.")
+                return "User not found"
 
-            # Usuń portfel przewoźnika
-            db.query(Wallet).filter(Wallet.user_id == user.user_id).delete()
+            # Usunięcie konta z pojazdami, relacjami, rozkładami, zamówieniami (z historią statusów
+            # i problemami) itd. - zapytaniami zbiorczymi w kolejności zależności (app/deletion.py)
+            deleted, removed_relation_ids = delete_user(db, user)
+            evict_tags(db, owner_tag(user.user_id))
 
-        # Obsługa usuwania danych dla klienta (customer)
-        elif user.user_type == 'customer':
-            # Usuń zamówienia klienta
-            db.query(Order).filter(Order.user_id == user.user_id).delete()
-
-            # Usuń portfel klienta
-            db.query(Wallet).filter(Wallet.user_id == user.user_id).delete()
-
-        # Usuń problemy związane z przesyłkami (dla wszystkich typów użytkowników)
-        db.query(ShipmentProblem).filter(ShipmentProblem.user_id == user.user_id).delete()
-
-        # Usuń użytkownika
-        db.delete(user)
-
-        # Zatwierdź zmiany w bazie danych
-        db.commit()
-        logger.info(f"User {email} deleted.")
-        return "User deleted"
+            # Zapisz zmiany (zatwierdzane na końcu zapytania)
+            db.flush()
+            timetable_changed(db, *removed_relation_ids)
+            logger.info(f"User {email} deleted: {deleted}")
+            return "User deleted"
 
     except Exception as e:
-        db.rollback()
         logger.error(f"Error occurred while deleting user {email}: {str(e)}")
         return f"Error occurred: {str(e)}"
-    
-    finally:
-        db.close()
 
 # Aktualizacja profilu klienta
 @mutation.field("updateCustomerProfile")
 def resolve_update_customer_profile(_, info, email, new_email=None, first_name=None, last_name=None, phone_number=None):
-    db = SessionLocal()
+    db = get_session(info)
     user = db.query(User).filter(User.email == email, User.user_type == 'customer').first()
     if user:
         if new_email is not None:
@@ -209,19 +208,17 @@ def resolve_update_customer_profile(_, info, email, new_email=None, first_name=N
             user.last_name = last_name
         if phone_number is not None:
             user.phone_number = phone_number  # Dodane: Aktualizacja numeru telefonu
-        db.commit()
+        db.flush()
         db.refresh(user)
-        db.close()
         logger.info(f"Customer {email} updated profile.")
         return user
-    db.close()
     logger.warning(f"Customer {email} not found.")
     return None
 
 # Aktualizacja profilu przewoźnika
 @mutation.field("updateCarrierProfile")
 def resolve_update_carrier_profile(_, info, email, new_email=None, company_name=None, postal_code=None, city=None, street=None, phone_number=None):
-    db = SessionLocal()
+    db = get_session(info)
     user = db.query(User).filter(User.email == email, User.user_type == 'carrier').first()
     if user:
         if new_email is not None:
@@ -236,58 +233,52 @@ def resolve_update_carrier_profile(_, info, email, new_email=None, company_name=
             user.street = street
         if phone_number is not None:
             user.phone_number = phone_number  # Dodane: Aktualizacja numeru telefonu
-        db.commit()
+        db.flush()
         db.refresh(user)
-        db.close()
         logger.info(f"Carrier {email} updated profile.")
         return user
-    db.close()
     logger.warning(f"Carrier {email} not found.")
     return None
 
 # Aktualizacja hasła
 @mutation.field("updatePassword")
 def resolve_update_password(_, info, email, oldPassword, newPassword, user_type):
-    db = SessionLocal()
+    db = get_session(info)
     user = db.query(User).filter(User.email == email, User.user_type == user_type).first()
     if user:
         if user.password == oldPassword:
             user.password = newPassword
-            db.commit()
-            db.close()
+            db.flush()
             logger.info(f"User {email} updated password.")
             return "Password updated"
         else:
-            db.close()
             logger.warning(f"User {email} provided incorrect old password.")
             return "Incorrect old password"
-    db.close()
     logger.warning(f"User {email} not found.")
     return "User not found"
 
 # Edycja pojazdu
 @mutation.field("updateVehicle")
 def resolve_update_vehicle(_, info, vehicle_id, model, capacity, registration_number):
-    db = SessionLocal()
+    db = get_session(info)
     vehicle = db.query(Vehicle).filter(Vehicle.vehicle_id == vehicle_id).first()
     if vehicle:
         vehicle.model = model
         vehicle.capacity = capacity
         vehicle.registration_number = registration_number
-        db.commit()
+        db.flush()
         db.refresh(vehicle)
-        db.close()
+        evict_tags(db, owner_tag(vehicle.owner_id), vehicle_tag(vehicle_id))
         logger.info(f"Vehicle {vehicle_id} updated to model {model} with capacity {capacity} and registration number {registration_number}.")
         return vehicle
-    db.close()
     logger.warning(f"Vehicle {vehicle_id} not found.")
     return None
 
 # Dodanie nowego pojazdu
 @mutation.field("addVehicle")
 def resolve_add_vehicle(_, info, model, capacity, registration_number, owner_id):
-    # Inicjalizacja sesji z bazą danych
-    db = SessionLocal()
+    # Sesja bazy danych bieżącego zapytania
+    db = get_session(info)
 
     # Tworzenie nowego obiektu Vehicle z danymi wejściowymi
     vehicle = Vehicle(
@@ -300,14 +291,12 @@ def resolve_add_vehicle(_, info, model, capacity, registration_number, owner_id)
     # Dodanie nowego pojazdu do sesji (przygotowanie do zapisu w bazie)
     db.add(vehicle)
     
-    # Zatwierdzenie (commit) zmian w bazie danych, co zapisuje pojazd
-    db.commit()
+    # Zapis pojazdu w bazie (commit wykonywany na końcu zapytania)
+    db.flush()
 
     # Odświeżenie obiektu vehicle, aby upewnić się, że mamy aktualne dane z bazy
     db.refresh(vehicle)
-
-    # Zamknięcie sesji z bazą danych, aby zwolnić zasoby
-    db.close()
+    evict_tags(db, owner_tag(owner_id))
 
     # Logowanie informacji o dodanym pojeździe
     logger.info(f"Vehicle {model} with registration number {registration_number} added for owner {owner_id}.")
@@ -318,179 +307,108 @@ def resolve_add_vehicle(_, info, model, capacity, registration_number, owner_id)
 # Dodanie rozkładu jazdy
 @mutation.field("addSchedule")
 def resolve_add_schedule(_, info, vehicle_id, stop, arrival_time, departure_time, relation_id=None):
-    db = SessionLocal()
+    db = get_session(info)
     try:
-        arrival_time_dt = datetime.strptime(arrival_time, '%H:%M').replace(year=1970, month=1, day=1)
-        departure_time_dt = datetime.strptime(departure_time, '%H:%M').replace(year=1970, month=1, day=1)
-
-        max_order_number = db.query(func.max(Schedule.order_number)).filter(Schedule.vehicle_id == vehicle_id).scalar()
-        if max_order_number is None:
-            max_order_number = 0
-        new_order_number = max_order_number + 1
-
-        schedule = Schedule(
-            vehicle_id=vehicle_id, 
-            stop=stop, 
-            arrival_time=arrival_time_dt, 
-            departure_time=departure_time_dt,
-            order_number=new_order_number,
-            relation_id=relation_id  # Ustawienie relation_id
-        )
-        db.add(schedule)
-        db.commit()
-        db.refresh(schedule)
-        logger.info(f"Schedule added for vehicle {vehicle_id} at stop {stop}.")
-        return schedule
+        with db.begin_nested():
+            arrival_time_dt = datetime.strptime(arrival_time, '%H:%M').replace(year=1970, month=1, day=1)
+            departure_time_dt = datetime.strptime(departure_time, '%H:%M').replace(year=1970, month=1, day=1)
+
+            max_order_number = db.query(func.max(Schedule.order_number)).filter(Schedule.vehicle_id == vehicle_id).scalar()
+            if max_order_number is None:
+                max_order_number = 0
+            new_order_number = max_order_number + 1
+
+            schedule = Schedule(
+                vehicle_id=vehicle_id, 
+                stop=stop, 
+                arrival_time=arrival_time_dt, 
+                departure_time=departure_time_dt,
+                order_number=new_order_number,
+                relation_id=relation_id  # Ustawienie relation_id
+            )
+            db.add(schedule)
+            db.flush()
+            db.refresh(schedule)
+            timetable_changed(db, relation_id)
+            evict_tags(db, vehicle_tag(vehicle_id))
+            logger.info(f"Schedule added for vehicle {vehicle_id} at stop {stop}.")
+            return schedule
     except Exception as e:
-        db.rollback()
         logger.error(f"Error adding schedule: {e}")
         return None
-    finally:
-        db.close()
 
 # Aktualizacja rozkładu jazdy
 @mutation.field("updateSchedule")
 def resolve_update_schedule(_, info, schedule_id, stop, arrival_time, departure_time):
-    db = SessionLocal()
+    db = get_session(info)
     schedule = db.query(Schedule).filter(Schedule.schedule_id == schedule_id).first()
     if schedule:
         schedule.stop = stop
         schedule.arrival_time = datetime.strptime(arrival_time, '%H:%M').replace(year=1970, month=1, day=1)
         schedule.departure_time = datetime.strptime(departure_time, '%H:%M').replace(year=1970, month=1, day=1)
-        db.commit()
+        db.flush()
         db.refresh(schedule)
-        db.close()
+        timetable_changed(db, schedule.relation_id)
+        evict_tags(db, vehicle_tag(schedule.vehicle_id))
         logger.info(f"Schedule {schedule_id} updated.")
         return schedule
-    db.close()
     logger.warning(f"Schedule {schedule_id} not found.")
     return None
 
 # Utworzenie zamówienia
-@mutation.field("createOrder")
-def resolve_create_order(_, info, user_id, relation_id, size, start_stop, end_stop, price, today_delivery):
-    # Inicjalizacja połączenia z bazą danych
-    db = SessionLocal()
-
-    try:
-        # Pobieramy wszystkie przystanki (schedules) powiązane z daną relacją (relation_id)
-        # Sortujemy je według kolejności (order_number), aby zachować właściwą sekwencję trasy
-        vehicle_schedules = db.query(Schedule).filter(Schedule.relation_id == relation_id).order_by(Schedule.order_number).all()
-        start_schedule = None
-        end_schedule = None
-
-        # Przeszukiwanie przystanków, aby znaleźć przystanek początkowy i końcowy
-        for schedule in vehicle_schedules:
-            if schedule.stop == start_stop:  # Znaleziono przystanek początkowy
-                start_schedule = schedule
-            if schedule.stop == end_stop:  # Znaleziono przystanek końcowy
-                end_schedule = schedule
-
-        # Jeśli nie znaleziono przystanków, wyrzuć błąd
-        if not start_schedule or not end_schedule:
-            raise ValueError(f"Błędny przystanek początkowy lub końcowy: start_stop={start_stop}, end_stop={end_stop}")
-
-        # Obliczenie daty i godziny nadania przesyłki na podstawie today_delivery
-        if today_delivery:
-            # Jeśli przesyłka ma być nadana dziś, ustaw odpowiednią godzinę nadania i odbioru
-            departure_time = datetime.combine(datetime.today(), start_schedule.departure_time.time())
-            arrival_time = datetime.combine(datetime.today(), end_schedule.arrival_time.time())
-        else:
-            # Jeśli nadanie ma nastąpić jutro, ustaw datę na kolejny dzień
-            departure_time = datetime.combine(datetime.today() + timedelta(days=1), start_schedule.departure_time.time())
-            arrival_time = datetime.combine(datetime.today() + timedelta(days=1), end_schedule.arrival_time.time())
-
-        # Sprawdzamy, czy użytkownik ma wystarczające środki w portfelu
-        user_wallet = db.query(Wallet).filter(Wallet.user_id == user_id).first()
-        if user_wallet.balance < price:
-            # Jeśli saldo w portfelu jest mniejsze niż cena przesyłki, wyrzuć błąd
-            raise ValueError("Brak wystarczających środków na koncie")
-
-        # Tworzymy nowe zamówienie (order) z przypisaną relacją, przystankami i czasem dostawy
-        new_order = Order(
-            user_id=user_id,  # Identyfikator użytkownika tworzącego zamówienie
-            relation_id=relation_id,  # Relacja, na której opiera się przesyłka
-            size=size,  # Rozmiar przesyłki (np. S, M, L)
-            start_stop=start_stop,  # Przystanek początkowy
-            end_stop=end_stop,  # Przystanek końcowy
-            departure_time=departure_time,  # Czas nadania przesyłki
-            arrival_time=arrival_time,  # Czas odbioru przesyłki
-            price=price,  # Cena przesyłki
-            order_code=generate_unique_order_code(db),  # Generujemy unikalny kod zamówienia
-            pickup_code='0000',  # Kod odbioru (do aktualizacji później)
-            delivery_code='0000',  # Kod dostarczenia (do aktualizacji później)
-            status='Nadana'  # Status zamówienia na początek to "Nadana"
-        )
-
-        # Zapisujemy nowe zamówienie i jego historię statusów
-        db.add(new_order)
-        db.flush()  # Flushing zapisuje dane do bazy, ale nie kończy sesji transakcji
-
-        # Dodajemy wpis do historii statusów zamówienia (status na początku to "Nadana")
-        status_history_entry = OrderStatusHistory(
-            order_id=new_order.order_id,  # Powiązane zamówienie
-            status='Nadana',  # Status początkowy
-            changed_at=datetime.now()  # Czas, kiedy status został zmieniony
-        )
-        db.add(status_history_entry)
-
-        # Aktualizacja stanu portfela użytkownika po pomyślnym utworzeniu zamówienia
-        user_wallet.balance -= price
-        db.commit()  # Zatwierdzamy wszystkie zmiany w bazie danych
-
-        # Odświeżamy dane zamówienia, aby upewnić się, że wszystkie informacje są aktualne
-        db.refresh(new_order)
-
-        # Zwracamy utworzone zamówienie jako wynik mutacji
-        return new_order
-
-    except Exception as e:
-        # Jeśli wystąpił jakikolwiek błąd, wycofujemy wszystkie zmiany w bazie danych
-        db.rollback()
-        raise e
+# Wycena, rezerwacja pojemności, obciążenie portfela i zapis zamówienia w jednej, własnej transakcji
+# (app/booking.py), zatwierdzanej od razu - niezależnie od transakcji zapytania GraphQL, więc zamówienie
+# zostaje, nawet gdy inna mutacja tego samego dokumentu się nie powiedzie.
+# Rezerwacja (z odczekaniem przy deadlocku) nie blokuje pętli zdarzeń: w trybie synchronicznym działa
+# w puli wątków, a w DB_ASYNC - w AsyncSession. Resolver jest `async def` rejestrowanym bezpośrednio
+# (set_field), bo nie korzysta z sesji zapytania (async_resolver).
+# Cena przesłana przez klienta nie jest używana.
+async def resolve_create_order(_, info, user_id, relation_id, size, start_stop, end_stop, price=None, today_delivery=False):
+    if DB_ASYNC:
+        order = await book_order_async(AsyncSessionLocal, user_id, relation_id, size, start_stop, end_stop, today_delivery)
+    else:
+        order = await run_in_threadpool(book_order, SessionLocal, user_id, relation_id, size, start_stop, end_stop, today_delivery)
+    if price is not None and abs(order.price - price) >= 0.005:
+        logger.warning(f"Order {order.order_id} priced at {order.price} instead of client price {price}.")
+    return order
 
-    finally:
-        # Zamykamy sesję z bazą danych, aby uwolnić zasoby
-        db.close()
+mutation.set_field("createOrder", resolve_create_order)
 
 # Aktualizacja środków portfela
 @mutation.field("updateUserFunds")
 def resolve_update_user_funds(_, info, user_id, new_balance):
-    db = SessionLocal()
-    wallet = db.query(Wallet).filter(Wallet.user_id == user_id).first()
+    db = get_session(info)
+    # Nowe saldo zapisywane jako transakcja korygująca w księdze portfela
+    wallet = set_balance(db, user_id, new_balance)
     if wallet:
-        wallet.balance = new_balance  # Nadpisujemy nową wartością
-        db.commit()
-        db.refresh(wallet)
-        db.close()
-        logger.info(f"Zaktualizowano saldo portfela {wallet.wallet_id}. Nowe saldo: {wallet.balance}")
+        db.flush()
+        logger.info(f"Zaktualizowano saldo portfela {wallet.wallet_id}. Nowe saldo: {new_balance}")
         return wallet
-    db.close()
     logger.warning(f"Portfel użytkownika {user_id} nie został znaleziony.")
     return None
 
 # Pobranie profilu użytkownika
 @query.field("getUserProfile")
 def resolve_get_user_profile(_, info, email, user_type):
-    db = SessionLocal()
-    user = db.query(User).options(joinedload(User.wallet)).filter(User.email == email, User.user_type == user_type).first()
-    db.close()
+    db = get_session(info)
+    user = db.query(User).filter(User.email == email, User.user_type == user_type).first()
     if user:
         return user
     return None
 
 # Pobranie pojazdów użytkownika
 @query.field("getUserVehicles")
+@cached_query("getUserVehicles", lambda owner_id: [owner_tag(owner_id)])
 def resolve_get_user_vehicles(_, info, owner_id):
-    db = SessionLocal()
+    db = get_session(info)
     vehicles = db.query(Vehicle).filter(Vehicle.owner_id == owner_id).all()
-    db.close()
     return vehicles
 
 # Pobranie rozkładu jazdy pojazdu
 @query.field("getVehicleSchedules")
+@cached_query("getVehicleSchedules", lambda vehicle_id, relation_id=None: [vehicle_tag(vehicle_id), relation_tag(relation_id) if relation_id is not None else None])
 def resolve_get_vehicle_schedules(_, info, vehicle_id, relation_id=None):
-    db = SessionLocal()
+    db = get_session(info)
     query = db.query(Schedule).filter(Schedule.vehicle_id == vehicle_id)
     
     if relation_id is not None:
@@ -499,255 +417,213 @@ def resolve_get_vehicle_schedules(_, info, vehicle_id, relation_id=None):
         query = query.filter(Schedule.relation_id == None)  # Dodane: filtruj tylko nieprzypisane przystanki
     
     schedules = query.all()
-    db.close()
     return schedules
 
+def user_orders_query(db, user_id):
+    return db.query(Order).filter(Order.user_id == user_id, Order.deleted_by_user == False)
+
 # Pobranie zamówień użytkownika
 @query.field("getUserOrders")
 def resolve_get_user_orders(_, info, user_id):
-    db = SessionLocal()
-    try:
-        # Ładujemy zamówienia razem z relacjami do pojazdu przez relation
-        orders = db.query(Order).options(
-            joinedload(Order.status_history),
-            joinedload(Order.driver),       
-            joinedload(Order.relation).joinedload(Relation.vehicle) 
-        ).filter(Order.user_id == user_id, Order.deleted_by_user == False).all()
-        return orders
-    finally:
-        db.close()
+    db = get_session(info)
+    # Powiązane obiekty (relacja, pojazd, kierowca, historia) ładują zbiorczo loadery z app/loaders.py
+    orders = user_orders_query(db, user_id).all()
+    return orders
+
+@query.field("getUserOrdersConnection")
+def resolve_get_user_orders_connection(_, info, user_id, first=None, after=None):
+    return paginate(user_orders_query(get_session(info), user_id), Order.order_id, first, after)
+
+def carrier_orders_query(db, owner_id):
+    # Subquery for vehicle_id
+    vehicles_subquery = select(Vehicle.vehicle_id).filter(Vehicle.owner_id == owner_id).subquery()
+    
+    # Subquery for relation_id (instead of schedule_id)
+    relations_subquery = select(Relation.relation_id).filter(
+        Relation.vehicle_id.in_(select(vehicles_subquery.c.vehicle_id))
+    ).subquery()
+    
+    return db.query(Order).filter(
+        Order.relation_id.in_(select(relations_subquery.c.relation_id)),  # Use relation_id instead of schedule_id
+        Order.deleted_by_carrier.is_(False)
+    )
 
 # Pobranie zamówień przewoźnika
 @query.field("getCarrierOrders")
 def resolve_get_carrier_orders(_, info, owner_id):
-    db = SessionLocal()
-    
-    try:
-        # Subquery for vehicle_id
-        vehicles_subquery = select(Vehicle.vehicle_id).filter(Vehicle.owner_id == owner_id).subquery()
-        
-        # Subquery for relation_id (instead of schedule_id)
-        relations_subquery = select(Relation.relation_id).filter(
-            Relation.vehicle_id.in_(select(vehicles_subquery.c.vehicle_id))
-        ).subquery()
-        
-        # Fetch orders with the new relation_id subquery and loading options
-        orders = db.query(Order).options(
-            joinedload(Order.user),
-            joinedload(Order.relation).joinedload(Relation.vehicle),  # Load relation and associated vehicle
-            joinedload(Order.driver).joinedload(Driver.owner),
-            joinedload(Order.status_history)
-        ).filter(
-            Order.relation_id.in_(select(relations_subquery.c.relation_id)),  # Use relation_id instead of schedule_id
-            Order.deleted_by_carrier.is_(False)
-        ).all()
-        
-        # Processing results
-        orders_data = []
-        for order in orders:
-            order_data = {
-                "order_id": order.order_id,
-                "order_code": order.order_code,
-                "user": order.user,
-                "start_stop": order.start_stop,
-                "end_stop": order.end_stop,
-                "departure_time": order.departure_time,
-                "arrival_time": order.arrival_time,
-                "status": order.status,
-                "size": order.size,
-                "created_at": order.created_at,
-                "relation": order.relation,  # Now relation instead of schedule
-                "driver": order.driver,
-                "status_history": order.status_history,
-                "deleted_by_carrier": order.deleted_by_carrier
-            }
-            orders_data.append(order_data)
-    
-    finally:
-        db.close()
-    
-    return orders_data
+    db = get_session(info)
+    # Powiązane obiekty ładują zbiorczo loadery z app/loaders.py
+    orders = carrier_orders_query(db, owner_id).all()
+    return orders
+
+@query.field("getCarrierOrdersConnection")
+def resolve_get_carrier_orders_connection(_, info, owner_id, first=None, after=None):
+    return paginate(carrier_orders_query(get_session(info), owner_id), Order.order_id, first, after)
 
 # Pobranie statystyk przewoźnika
 @query.field("getCarrierStats")
 def resolve_get_carrier_stats(_, info, owner_id):
-    db = SessionLocal()
-    
-    # Zliczanie wykonanych zleceń (status: 'Dostarczona')
-    completed_orders = db.query(func.count(Order.order_id)).filter(
-        Order.status == 'Dostarczona',
-        Order.relation.has(Relation.vehicle.has(Vehicle.owner_id == owner_id))
-    ).scalar()
-    
-    # Zliczanie nowych zleceń (status: 'Nadana')
-    new_orders = db.query(func.count(Order.order_id)).filter(
-        Order.status == 'Nadana',
-        Order.relation.has(Relation.vehicle.has(Vehicle.owner_id == owner_id))
-    ).scalar()
-
-    db.close()
-    
+    db = get_session(info)
+    # Liczniki i sumy cen per status z tabeli carrier_stats (app/carrier_stats.py)
+    stats = get_carrier_stats(db, owner_id)
+    completed_orders, total_earnings = stats[COMPLETED_STATUS]
+    new_orders, _ = stats[NEW_STATUS]
     return {
-        "completedOrders": completed_orders or 0,
-        "totalEarnings": 0.0,
-        "newOrders": new_orders or 0  # Zwracamy liczbę nowych zleceń
+        "completedOrders": completed_orders,
+        "totalEarnings": total_earnings,
+        "newOrders": new_orders
     }
 
+# Analityka zamówień dla panelu administratora z agregatów godzinowych/dziennych (app/analytics.py).
+# Zakres dat RRRR-MM-DD, obie daty włącznie.
+@query.field("getAnalyticsTimeSeries")
+def resolve_get_analytics_time_series(_, info, period, date_from, date_to, carrier_id=None, relation_id=None):
+    return time_series(get_session(info), period, date_from, date_to, carrier_id, relation_id)
+
+@query.field("getAnalyticsBreakdown")
+def resolve_get_analytics_breakdown(_, info, group_by, date_from, date_to):
+    return breakdown(get_session(info), group_by, date_from, date_to)
+
 
 # Pobranie wszystkich przystanków
 @query.field("getAllStops")
 def resolve_get_all_stops(_, info):
-    db = SessionLocal()
-    stops = db.query(Schedule.stop).distinct().all()
-    db.close()
-    return [stop[0] for stop in stops]
-
-# Pobranie dostępnych przystanków na podstawie początkowego przystanku
-@query.field("getAvailableStops")
-def resolve_get_available_stops(_, info, startStop):
-    db = SessionLocal()
-
-    # Znajdujemy wszystkie rozkłady (schedules) z przystankiem początkowym
-    schedules = db.query(Schedule).filter(Schedule.stop == startStop).all()
-
-    available_stops = set()  # Używamy zbioru, aby uniknąć duplikatów
-
-    # Przechodzimy przez każdy z rozkładów
-    for schedule in schedules:
-        relation_id = schedule.relation_id  # Pobieramy relację
+    # Nazwy przystanków z katalogu w pamięci (app/stop_catalogue.py)
+    stop_catalogue.ensure_fresh(get_session(info))
+    return stop_catalogue.all_stops()
 
-        if relation_id is None:
-            continue  # Jeśli brak przypisanej relacji, przechodzimy do następnego rozkładu
+# Podpowiedzi przystanków dla wpisywanego tekstu (prefiks nazwy lub dowolnego słowa w nazwie)
+@query.field("searchStops")
+def resolve_search_stops(_, info, prefix, limit=DEFAULT_SEARCH_LIMIT):
+    stop_catalogue.ensure_fresh(get_session(info))
+    return stop_catalogue.search(prefix, limit)
 
-        # Pobieramy wszystkie przystanki tego samego pojazdu w tej samej relacji
-        vehicle_schedules = (
-            db.query(Schedule)
-            .filter(Schedule.vehicle_id == schedule.vehicle_id)
-            .filter(Schedule.relation_id == relation_id)  # Filtrowanie przystanków w tej samej relacji
-            .filter(Schedule.order_number > schedule.order_number)  # Filtrujemy tylko te, które są później
-            .order_by(Schedule.order_number)
-            .all()
+# Pobranie dostępnych przystanków na podstawie początkowego przystanku
+# Przystanki osiągalne z `start_stop`: późniejsze przystanki tej samej relacji, jedno zapytanie (self-join)
+def available_stops_query(start_stop):
+    start = aliased(Schedule)
+    later = aliased(Schedule)
+    first_order_number = func.min(later.order_number)
+    return select(later.stop, first_order_number).join(
+        start, and_(
+            start.relation_id == later.relation_id,
+            start.vehicle_id == later.vehicle_id,
+            later.order_number > start.order_number,
         )
+    ).where(start.stop == start_stop).group_by(later.stop).order_by(first_order_number, later.stop)
 
-        # Dodajemy te przystanki do zbioru (unikamy duplikatów)
-        for vs in vehicle_schedules:
-            available_stops.add((vs.stop, vs.order_number))  # Dodajemy tuple do zbioru
-
-    db.close()
-
-    # Zamieniamy zbiór z powrotem na listę i sortujemy po order_number
-    available_stops = sorted(list(available_stops), key=lambda x: x[1])
+@query.field("getAvailableStops")
+def resolve_get_available_stops(_, info, startStop):
+    def load():
+        db = get_session(info)
+        rows = db.execute(available_stops_query(startStop)).all()
+        return [{"stop": stop, "order_number": order_number} for stop, order_number in rows]
 
-    # Konwersja do formatu z przystankiem i order_number
-    return [{"stop": stop, "order_number": order_number} for stop, order_number in available_stops]
+    # Wynik zależy tylko od rozkładu jazdy - pamięć podręczną czyści timetable_changed,
+    # a zmianę z innego procesu wykrywa sprawdzenie wersji rozkładu
+    timetable_version.check(get_session(info))
+    return available_stops_cache.get_or_load(startStop, load)
 
 # Pobranie dostępnych kursów na podstawie początkowego i końcowego przystanku oraz rozmiaru przesyłki
 @query.field("getAvailableCourses")
 def resolve_get_available_courses(_, info, startStop, endStop, size, todayDelivery):
-    db = SessionLocal()
-    try:
-        # Pobieramy wszystkie rozkłady, które zawierają przystanek startowy
-        start_schedules = db.query(Schedule).filter(Schedule.stop == startStop).all()
-
-        available_courses = []
-        now = datetime.now()
-
-        for schedule in start_schedules:
-            # Pobieramy relację (trasę), do której należy kurs
-            relation = schedule.relation
-            if not relation:
-                continue  # Jeśli brak relacji, przejdź do następnego
-
-            # Sprawdzamy, czy w tej samej trasie istnieje przystanek końcowy
-            vehicle_schedules = (
-                db.query(Schedule)
-                .filter(Schedule.vehicle_id == schedule.vehicle_id, Schedule.relation_id == relation.relation_id)
-                .order_by(Schedule.order_number)
-                .all()
-            )
+    db = get_session(info)
+    # Kandydatów wyznaczamy z indeksu tras w pamięci (bez zapytań per rozkład)
+    route_index.ensure_fresh(db)
+    now = datetime.now()
+    departure_date = now.date() if todayDelivery else (now + timedelta(days=1)).date()
+
+    courses = []
+    for course in route_index.find_courses(startStop, endStop):
+        # Sprawdzamy, czy różnica czasu między obecnym czasem a czasem odjazdu jest większa niż 2 godziny
+        if todayDelivery and not can_send_today(course.start.departure_time.strftime('%Y-%m-%d %H:%M:%S'), now):
+            continue
+        courses.append(course)
+
+    if not courses:
+        return []
+
+    relation_ids = {course.relation_id for course in courses}
+    vehicle_ids = {course.start.vehicle_id for course in courses}
+
+    # Pojazdy wraz z nazwą firmy właściciela - jedno zapytanie dla wszystkich kandydatów
+    vehicles = {
+        vehicle_id: (capacity, company_name)
+        for vehicle_id, capacity, company_name in db.query(Vehicle.vehicle_id, Vehicle.capacity, User.company_name)
+        .join(User, Vehicle.owner_id == User.user_id)
+        .filter(Vehicle.vehicle_id.in_(vehicle_ids))
+    }
 
-            # Szukamy przystanku końcowego w tej samej relacji
-            stop_found = False
-            for vs in vehicle_schedules:
-                if vs.stop == startStop:
-                    stop_found = True  # Znalazłem przystanek startowy, teraz szukam końcowego
-                if stop_found and vs.stop == endStop:  # Znalazłem przystanek końcowy
-
-                    # Ustal datę, dla której sprawdzamy kurs (dzisiaj lub jutro)
-                    departure_date = now.date() if todayDelivery else (now + timedelta(days=1)).date()
-
-                    # Sprawdzamy, czy różnica czasu między obecnym czasem a czasem odjazdu jest większa niż 2 godziny
-                    if todayDelivery and not can_send_today(schedule.departure_time.strftime('%Y-%m-%d %H:%M:%S'), now):
-                        continue
-
-                    # Obliczanie sumy zajętej pojemności na dany dzień i relację
-                    orders_for_relation = db.query(Order).filter(
-                        Order.relation_id == relation.relation_id,
-                        func.date(Order.departure_time) == departure_date,  # Filtrujemy zamówienia na konkretną datę
-                        Order.status.in_(['Nadana', 'Przypisano kierowcę', 'Przyjęta od klienta'])
-                    ).all()
-
-                    total_capacity_used = 0
-                    for order in orders_for_relation:
-                        if order.size == 'S':
-                            total_capacity_used += 1
-                        elif order.size == 'M':
-                            total_capacity_used += 2
-                        elif order.size == 'L':
-                            total_capacity_used += 3
-
-                    # Sprawdzenie, ile miejsc jest jeszcze dostępnych
-                    vehicle = schedule.vehicle
-                    required_capacity = 1 if size == 'S' else 2 if size == 'M' else 3
-
-                    # Logi do debugowania
-                    print(f"Sprawdzam kurs: {schedule.schedule_id}, Pojazd: {vehicle.vehicle_id}, Całkowita zajęta pojemność: {total_capacity_used}, Wymagana pojemność: {required_capacity}, Pojemność pojazdu: {vehicle.capacity}")
-
-                    if total_capacity_used + required_capacity > vehicle.capacity:
-                        print(f"Pojazd jest pełny: total_capacity_used={total_capacity_used}, required_capacity={required_capacity}, vehicle_capacity={vehicle.capacity}")
-                        continue  # Pojazd nie ma wystarczającej pojemności
-
-                    # Obliczanie ceny kursu na podstawie przystanków
-                    price_list = db.query(PriceList).filter(PriceList.relation_id == relation.relation_id).first()
-                    if price_list:
-                        stops_count = abs(vs.order_number - schedule.order_number)
-                        total_price = price_list.base_price + (stops_count * price_list.price_per_stop)
-                    else:
-                        total_price = 0
-
-                    # Pobieramy informacje o pojeździe i właścicielu
-                    owner = vehicle.owner
-
-                    available_courses.append({
-                        "schedule_id": vs.schedule_id,
-                        "relation_id": relation.relation_id,  # Dodaj relation_id do zwracanego kursu
-                        "vehicle_id": vs.vehicle_id,
-                        "company_name": owner.company_name,
-                        "start_stop": startStop,
-                        "end_stop": endStop,
-                        "departure_time": schedule.departure_time.strftime('%H:%M'),
-                        "arrival_time": vs.arrival_time.strftime('%H:%M'),
-                        "total_price": total_price
-                    })
-                    break
-        return available_courses
-    finally:
-        db.close()
+    # Zajęta pojemność na dany dzień z rejestru relation_daily_load - jedno zapytanie po kluczu głównym
+    capacity_used = get_used_units(db, relation_ids, departure_date)
+
+    # Ceny wszystkich kandydatów jednym przejściem po cennikach w pamięci (app/fares.py)
+    fare_table.ensure_fresh(db)
+    prices = fare_table.quote(
+        [course.relation_id for course in courses],
+        [stop_count(course.start, course.end) for course in courses],
+        [size] * len(courses),
+    )
+
+    required_capacity = size_units(size)
+    available_courses = []
+    for course, total_price in zip(courses, prices):
+        if total_price is None or course.start.vehicle_id not in vehicles:
+            continue  # relacja bez cennika - createOrder odrzuciłby rezerwację
+        vehicle_capacity, company_name = vehicles[course.start.vehicle_id]
+        total_capacity_used = capacity_used.get(course.relation_id, 0)
+
+        logger.debug(f"Sprawdzam kurs: {course.start.schedule_id}, Pojazd: {course.start.vehicle_id}, Całkowita zajęta pojemność: {total_capacity_used}, Wymagana pojemność: {required_capacity}, Pojemność pojazdu: {vehicle_capacity}")
+
+        if total_capacity_used + required_capacity > vehicle_capacity:
+            continue  # Pojazd nie ma wystarczającej pojemności
+
+        available_courses.append({
+            "schedule_id": course.end.schedule_id,
+            "relation_id": course.relation_id,  # Dodaj relation_id do zwracanego kursu
+            "vehicle_id": course.end.vehicle_id,
+            "company_name": company_name,
+            "start_stop": startStop,
+            "end_stop": endStop,
+            "departure_time": course.start.departure_time.strftime('%H:%M'),
+            "arrival_time": course.end.arrival_time.strftime('%H:%M'),
+            "total_price": total_price
+        })
+    return available_courses
+
+# Wycena wielu kursów naraz z cenników w pamięci (app/fares.py) - te same ceny nalicza createOrder
+@query.field("quoteFares")
+def resolve_quote_fares(_, info, requests):
+    return quote_fares(get_session(info), requests)
+
+# Podróże z przesiadkami między relacjami (app/journeys.py) - getAvailableCourses zwraca tylko kursy bezpośrednie
+@query.field("planJourney")
+def resolve_plan_journey(_, info, startStop, endStop, size, todayDelivery, maxTransfers=None):
+    return plan_journey(get_session(info), startStop, endStop, size, todayDelivery, maxTransfers)
 
 # Pobranie wszystkich użytkowników
 @query.field("getAllUsers")
 def resolve_get_all_users(_, info):
-    session = SessionLocal()
-    try:
-        users = session.query(User).options(joinedload(User.wallet)).all()
-        return users
-    finally:
-        session.close()
+    session = get_session(info)
+    users = session.query(User).all()
+    return users
+
+@query.field("getAllUsersConnection")
+def resolve_get_all_users_connection(_, info, first=None, after=None):
+    return paginate(get_session(info).query(User), User.user_id, first, after)
+
+# Historia portfela użytkownika (księga transakcji), od najstarszej
+@query.field("getWalletTransactionsConnection")
+def resolve_get_wallet_transactions_connection(_, info, user_id, first=None, after=None):
+    query = get_session(info).query(WalletTransaction).join(Wallet, Wallet.wallet_id == WalletTransaction.wallet_id).filter(
+        Wallet.user_id == user_id
+    )
+    return paginate(query, WalletTransaction.transaction_id, first, after)
 
 # Aktualizacja użytkownika
 @mutation.field("updateUser")
 def resolve_update_user(_, info, user_id, email, user_type, company_name=None, postal_code=None, city=None, street=None, first_name=None, last_name=None, phone_number=None):
-    session = SessionLocal()
+    session = get_session(info)
     user = session.query(User).filter(User.user_id == user_id).first()
     if user:
         user.email = email
@@ -759,54 +635,49 @@ def resolve_update_user(_, info, user_id, email, user_type, company_name=None, p
         user.last_name = last_name
         user.user_type = user_type
         user.phone_number = phone_number
-        session.commit()
+        session.flush()
         session.refresh(user)
-        session.close()
         return user
-    session.close()
     return None
 
 @mutation.field("createDriver")
 def resolve_create_driver(_, info, first_name, last_name, pin_code, owner_id):
-    db = SessionLocal()
-    driver_id_code = generate_driver_id_code(db)
+    db = get_session(info)
     driver = Driver(
         first_name=first_name,
         last_name=last_name,
-        driver_id_code=driver_id_code,
         pin_code=pin_code,
         owner_id=owner_id
     )
-    db.add(driver)
-    db.commit()
+    # Identyfikator kierowcy z alokatora kodów; unikalność pilnuje indeks w bazie
+    add_with_unique_code(db, driver, 'driver_id_code', driver_codes)
+    db.flush()
     db.refresh(driver)
-    db.close()
+    evict_tags(db, owner_tag(owner_id))
     return driver
 
 @mutation.field("deleteDriver")
 def resolve_delete_driver(_, info, driver_id):
-    db = SessionLocal()
+    db = get_session(info)
     driver = db.query(Driver).filter(Driver.driver_id == driver_id).first()
     if driver:
         db.delete(driver)
-        db.commit()
-        db.close()
+        db.flush()
+        evict_tags(db, owner_tag(driver.owner_id))
         return "Driver deleted"
-    db.close()
     return "Driver not found"
 
 @query.field("getCarrierDrivers")
+@cached_query("getCarrierDrivers", lambda owner_id: [owner_tag(owner_id)])
 def resolve_get_carrier_drivers(_, info, owner_id):
-    db = SessionLocal()
+    db = get_session(info)
     drivers = db.query(Driver).filter(Driver.owner_id == owner_id).all()
-    db.close()
     return drivers
 
 @mutation.field("loginDriver")
 def resolve_login_driver(_, info, id, pin):
-    db = SessionLocal()
+    db = get_session(info)
     driver = db.query(Driver).filter(Driver.driver_id_code == id, Driver.pin_code == pin).first()
-    db.close()
     if driver:
         return {"message": "User logged in", "user_id": driver.driver_id, "token": "some-token-value"}
     else:
@@ -814,495 +685,525 @@ def resolve_login_driver(_, info, id, pin):
     
 @mutation.field("changeDriverPin")
 def resolve_change_driver_pin(_, info, driver_id, new_pin_code):
-    db = SessionLocal()
+    db = get_session(info)
     driver = db.query(Driver).filter(Driver.driver_id == driver_id).first()
     if driver:
         driver.pin_code = new_pin_code
-        db.commit()
+        db.flush()
         db.refresh(driver)
-        db.close()
+        evict_tags(db, owner_tag(driver.owner_id))
         return {"message": "PIN changed successfully"}
-    db.close()
     return {"message": "Driver not found"}
 
 # Przypisanie kierowcy do zamówienia
 @mutation.field("assignDriverToOrder")
 def resolve_assign_driver_to_order(_, info, order_id, driver_id):
-    db = SessionLocal()
+    db = get_session(info)
     try:
-        order = db.query(Order).options(joinedload(Order.driver)).filter(Order.order_id == order_id).first()
-        if not order:
-            raise Exception("Order not found")
-
-        driver = db.query(Driver).filter(Driver.driver_id == driver_id).first()
-        if not driver:
-            raise Exception("Driver not found")
-
-        order.driver = driver
-        order.status = "Przypisano kierowcę"
-
-        # Generowanie 4-cyfrowych kodów nadania i odbioru
-        order.pickup_code = generate_random_code()
-        order.delivery_code = generate_random_code()
+        with db.begin_nested():
+            order = db.query(Order).options(joinedload(Order.driver)).filter(Order.order_id == order_id).first()
+            if not order:
+                raise Exception("Order not found")
+
+            driver = db.query(Driver).filter(Driver.driver_id == driver_id).first()
+            if not driver:
+                raise Exception("Driver not found")
+
+            load_before = order_load(order)
+            previous_status = order.status
+            order.driver = driver
+            order.status = "Przypisano kierowcę"
+            track_order(db, order, load_before)
+
+            # Generowanie 4-cyfrowych kodów nadania i odbioru
+            order.pickup_code = generate_random_code()
+            order.delivery_code = generate_random_code()
+
+            # Dodanie nowego wpisu w historii statusów zamówienia
+            status_history = OrderStatusHistory(order_id=order_id, status=order.status)
+            db.add(status_history)
 
-        # Dodanie nowego wpisu w historii statusów zamówienia
-        status_history = OrderStatusHistory(order_id=order_id, status=order.status)
-        db.add(status_history)
+            # Statystyki przewoźnika i powiadomienie - poza zapytaniem (app/outbox.py)
+            enqueue_status_change(db, order, previous_status)
 
-        db.commit()
-        db.refresh(order)
+            db.flush()
+            db.refresh(order)
+            order_status_changed(db, order, status_history)
         
-        return order
+            return order
     except Exception as e:
-        db.rollback()
         raise Exception(f"Error assigning driver to order: {e}")
-    finally:
-        db.close()
 
 @query.field("trackShipment")
 def resolve_track_shipment(_, info, order_code):
-    db = SessionLocal()  # Otwórz sesję
-    try:
-        # Użyj joinedload, aby załadować status_history wraz z Order
-        order = db.query(Order).options(joinedload(Order.status_history)).filter(Order.order_code == order_code).first()
-        
-        if not order:
-            raise Exception("Order not found")
-        
-        return order
-    finally:
-        db.close()
+    db = get_session(info)
+    # Użyj joinedload, aby załadować status_history wraz z Order
+    order = db.query(Order).options(joinedload(Order.status_history)).filter(Order.order_code == order_code).first()
+    
+    if not order:
+        raise Exception("Order not found")
+    
+    return order
 
 @query.field("getDriverProfile")
 def resolve_get_driver_profile(_, info, driver_id):
-    db = SessionLocal()
+    db = get_session(info)
     driver = db.query(Driver).filter(Driver.driver_id == driver_id).first()
-    db.close()
     if driver:
         return driver
     raise Exception("Driver not found")
 
+def driver_orders_query(session, driver_id):
+    # Używamy .in_() do filtrowania zamówień z określonymi statusami
+    return session.query(Order).filter(
+        Order.driver_id == driver_id,
+        Order.status.in_(['Przypisano kierowcę', 'Przyjęta od klienta'])
+    )
+
 # Query to get orders for a driver
 @query.field("getDriverOrders")
 def resolve_get_driver_orders(_, info, driver_id):
-    session = SessionLocal()
-    try:
-        # Używamy .in_() do filtrowania zamówień z określonymi statusami
-        orders = session.query(Order).filter(
-            Order.driver_id == driver_id,
-            Order.status.in_(['Przypisano kierowcę', 'Przyjęta od klienta'])
-        ).all()
-        return orders
-    finally:
-        session.close()
+    session = get_session(info)
+    orders = driver_orders_query(session, driver_id).all()
+    return orders
+
+@query.field("getDriverOrdersConnection")
+def resolve_get_driver_orders_connection(_, info, driver_id, first=None, after=None):
+    return paginate(driver_orders_query(get_session(info), driver_id), Order.order_id, first, after)
 
 # Mutation to accept a shipment
 @mutation.field("acceptShipment")
 def resolve_accept_shipment(_, info, order_code, pickup_code):
-    session = SessionLocal()
-    try:
-        order = session.query(Order).filter(Order.order_code == order_code).first()
+    session = get_session(info)
+    order = session.query(Order).filter(Order.order_code == order_code).first()
 
-        if not order:
-            return {"status": "Order not found"}
+    if not order:
+        return {"status": "Order not found"}
 
-        if order.pickup_code != pickup_code:
-            return {"status": "Błędny kod"}
+    if order.pickup_code != pickup_code:
+        return {"status": "Błędny kod"}
 
-        if order.status != "Przypisano kierowcę":
-            return {"status": "Order is not ready for pickup"}
+    if order.status != "Przypisano kierowcę":
+        return {"status": "Order is not ready for pickup"}
 
-        # Aktualizacja statusu zamówienia
-        order.status = "Przyjęta od klienta"
-        
-        # Tworzenie nowego wpisu w historii statusów zamówienia
-        status_history = OrderStatusHistory(order_id=order.order_id, status=order.status)
-        session.add(status_history)
+    # Aktualizacja statusu zamówienia
+    load_before = order_load(order)
+    previous_status = order.status
+    order.status = "Przyjęta od klienta"
+    track_order(session, order, load_before)
+    
+    # Tworzenie nowego wpisu w historii statusów zamówienia
+    status_history = OrderStatusHistory(order_id=order.order_id, status=order.status)
+    session.add(status_history)
+    enqueue_status_change(session, order, previous_status)
 
-        session.commit()
+    session.flush()
 
-        session.refresh(order)  # Upewnij się, że instancja Order jest nadal związana z sesją przed zakończeniem
+    session.refresh(order)  # Upewnij się, że instancja Order jest nadal związana z sesją przed zakończeniem
+    order_status_changed(session, order, status_history)
 
-        return {"status": order.status}
-    finally:
-        session.close()
+    return {"status": order.status}
 
 # Mutation to deliver a shipment
 @mutation.field("deliverShipment")
 def resolve_deliver_shipment(_, info, order_code, delivery_code):
-    session = SessionLocal()
+    session = get_session(info)
     try:
-        order = session.query(Order).filter(Order.order_code == order_code).first()
+        with session.begin_nested():
+            order = session.query(Order).filter(Order.order_code == order_code).first()
         
-        if not order:
-            return {"status": "Order not found"}
+            if not order:
+                return {"status": "Order not found"}
 
-        if order.delivery_code != delivery_code:
-            return {"status": "Błędny kod"}
+            if order.delivery_code != delivery_code:
+                return {"status": "Błędny kod"}
 
-        if order.status != "Przyjęta od klienta":
-            return {"status": "Order is not ready for delivery"}
+            if order.status != "Przyjęta od klienta":
+                return {"status": "Order is not ready for delivery"}
 
-        # Aktualizacja statusu zamówienia
-        order.status = "Dostarczona"
+            # Aktualizacja statusu zamówienia (dostarczona przesyłka zwalnia miejsce w pojeździe)
+            load_before = order_load(order)
+            previous_status = order.status
+            order.status = "Dostarczona"
+            track_order(session, order, load_before)
         
-        # Tworzenie nowego wpisu w historii statusów zamówienia
-        status_history = OrderStatusHistory(order_id=order.order_id, status=order.status)
-        session.add(status_history)
+            # Tworzenie nowego wpisu w historii statusów zamówienia
+            status_history = OrderStatusHistory(order_id=order.order_id, status=order.status)
+            session.add(status_history)
 
-        # Przekazanie środków przewoźnikowi
-        carrier_wallet = order.relation.vehicle.owner.wallet
-        carrier_wallet.balance += order.price  # Przekazanie zapisanej kwoty
+            # Przekazanie środków przewoźnikowi (zapisanej kwoty) i statystyki - poza zapytaniem (app/outbox.py)
+            owner_id = order_carrier_id(session, order)
+            enqueue_status_change(session, order, previous_status, owner_id)
+            enqueue_delivery(session, order, owner_id)
 
-        session.commit()
+            session.flush()
+            order_status_changed(session, order, status_history)
 
-        return {"status": order.status}
+            return {"status": order.status}
     except Exception as e:
-        session.rollback()
         return {"status": f"Error: {str(e)}"}
-    finally:
-        session.close()
 
 @query.field("getAllOrders")
 def resolve_get_all_orders(_, info):
-    session = SessionLocal()
-    try:
-        orders = session.query(Order).options(
-            joinedload(Order.user),  # Załaduj relację user
-            joinedload(Order.driver).joinedload(Driver.owner),  # Załaduj relację driver i jego owner w jednym zapytaniu
-            joinedload(Order.relation).joinedload(Relation.vehicle).joinedload(Vehicle.owner)  # Dodaj to, aby załadować schedule, vehicle i jego owner
-        ).all()
-        return orders
-    finally:
-        session.close()
+    session = get_session(info)
+    # Użytkownik, kierowca, relacja, pojazd i właściciel ładowane są zbiorczo przez loadery
+    orders = session.query(Order).all()
+    return orders
+
+@query.field("getAllOrdersConnection")
+def resolve_get_all_orders_connection(_, info, first=None, after=None):
+    return paginate(get_session(info).query(Order), Order.order_id, first, after)
 
 @mutation.field("deleteVehicle")
 def resolve_delete_vehicle(_, info, vehicle_id):
-    session = SessionLocal()
+    session = get_session(info)
     try:
-        # Sprawdź, czy pojazd jest przypisany do rozkładu jazdy
-        schedules = session.query(Schedule).filter(Schedule.vehicle_id == vehicle_id).all()
-        if schedules:
-            return "Cannot delete vehicle with schedules associated"
+        with session.begin_nested():
+            # Sprawdź, czy pojazd jest przypisany do rozkładu jazdy
+            schedules = session.query(Schedule).filter(Schedule.vehicle_id == vehicle_id).all()
+            if schedules:
+                return "Cannot delete vehicle with schedules associated"
         
-        # Jeśli nie jest przypisany, usuń pojazd
-        vehicle = session.query(Vehicle).filter(Vehicle.vehicle_id == vehicle_id).first()
-        if vehicle:
-            session.delete(vehicle)
-            session.commit()
-            return "Vehicle deleted successfully"
-        else:
-            return "Vehicle not found"
+            # Jeśli nie jest przypisany, usuń pojazd
+            vehicle = session.query(Vehicle).filter(Vehicle.vehicle_id == vehicle_id).first()
+            if vehicle:
+                session.delete(vehicle)
+                session.flush()
+                evict_tags(session, owner_tag(vehicle.owner_id), vehicle_tag(vehicle_id))
+                return "Vehicle deleted successfully"
+            else:
+                return "Vehicle not found"
     except Exception as e:
-        session.rollback()
         return str(e)
-    finally:
-        session.close()
 
 @mutation.field("deleteSchedule")
 def resolve_delete_schedule(_, info, schedule_id):
-    session = SessionLocal()
+    session = get_session(info)
     try:
-        # Sprawdź, czy przystanek istnieje
-        schedule = session.query(Schedule).filter(Schedule.schedule_id == schedule_id).first()
-        if schedule:
-            session.delete(schedule)
-            session.commit()
-            return "Schedule deleted successfully"
-        else:
-            return "Schedule not found"
+        with session.begin_nested():
+            # Sprawdź, czy przystanek istnieje
+            schedule = session.query(Schedule).filter(Schedule.schedule_id == schedule_id).first()
+            if schedule:
+                relation_id = schedule.relation_id
+                session.delete(schedule)
+                session.flush()
+                timetable_changed(session, relation_id)
+                evict_tags(session, vehicle_tag(schedule.vehicle_id))
+                return "Schedule deleted successfully"
+            else:
+                return "Schedule not found"
     except Exception as e:
-        session.rollback()
         return str(e)
-    finally:
-        session.close()
 
 @mutation.field("deleteAllSchedules")
 def resolve_delete_all_schedules(_, info, relation_id):
-    session = SessionLocal()
+    session = get_session(info)
     try:
-        # Pobierz wszystkie przystanki dla relacji
-        schedules = session.query(Schedule).filter(Schedule.relation_id == relation_id).all()
-
-        if schedules:
-            for schedule in schedules:
-                session.delete(schedule)
-            session.commit()
-            return True  # Operacja zakończona sukcesem
-        else:
-            return False  # Brak przystanków do usunięcia
+        with session.begin_nested():
+            # Pobierz wszystkie przystanki dla relacji
+            schedules = session.query(Schedule).filter(Schedule.relation_id == relation_id).all()
+
+            if schedules:
+                for schedule in schedules:
+                    session.delete(schedule)
+                session.flush()
+                timetable_changed(session, relation_id)
+                return True  # Operacja zakończona sukcesem
+            else:
+                return False  # Brak przystanków do usunięcia
     except Exception as e:
-        session.rollback()
-        print(f"Error occurred: {str(e)}")
+        logger.error(f"Error deleting schedules of relation {relation_id}: {str(e)}")
         return False  # Błąd operacji
-    finally:
-        session.close()
 
 @mutation.field("updateScheduleOrder")
 def resolve_update_schedule_order(_, info, schedule_id, new_order_number):
-    session = SessionLocal()
+    session = get_session(info)
     try:
-        schedule = session.query(Schedule).filter(Schedule.schedule_id == schedule_id).first()
-        if schedule:
-            schedule.order_number = new_order_number
-            session.commit()
-            session.refresh(schedule)
-            return schedule
-        else:
-            return None
+        with session.begin_nested():
+            schedule = session.query(Schedule).filter(Schedule.schedule_id == schedule_id).first()
+            if schedule:
+                schedule.order_number = new_order_number
+                session.flush()
+                session.refresh(schedule)
+                timetable_changed(session, schedule.relation_id)
+                evict_tags(session, vehicle_tag(schedule.vehicle_id))
+                return schedule
+            else:
+                return None
     except Exception as e:
-        session.rollback()
         return str(e)
-    finally:
-        session.close()
+
+# Dodanie wielu przystanków relacji (lub zastąpienie całego rozkładu) jednym zapytaniem
+@mutation.field("importSchedules")
+def resolve_import_schedules(_, info, relation_id, stops, replace=False):
+    db = get_session(info)
+    schedules = import_schedules(db, relation_id, stops, replace)
+    timetable_changed(db, relation_id)
+    logger.info(f"{len(stops)} schedules imported for relation {relation_id}.")
+    return schedules
+
+# Nowa kolejność wszystkich przystanków relacji w jednym zapytaniu
+@mutation.field("reorderSchedules")
+def resolve_reorder_schedules(_, info, relation_id, schedule_ids):
+    db = get_session(info)
+    schedules = reorder_schedules(db, relation_id, schedule_ids)
+    timetable_changed(db, relation_id)
+    return schedules
 
 # Resolver dla `getVehicleRelations`
 @query.field("getVehicleRelations")
+@cached_query("getVehicleRelations", lambda vehicle_id: [vehicle_tag(vehicle_id)])
 def resolve_get_vehicle_relations(_, info, vehicle_id):
-    db = SessionLocal()
+    db = get_session(info)
     relations = db.query(Relation).filter(Relation.vehicle_id == vehicle_id).all()
-    db.close()
     return relations
 
 # Resolver dla `createRelation`
 @mutation.field("createRelation")
 def resolve_create_relation(_, info, vehicle_id, relation_name):
-    db = SessionLocal()
+    db = get_session(info)
     try:
-        relation = Relation(relation_name=relation_name, vehicle_id=vehicle_id)
-        db.add(relation)
-        db.commit()
-        db.refresh(relation)
-        logger.info(f"Relation '{relation_name}' created for vehicle {vehicle_id}.")
-        return relation
+        with db.begin_nested():
+            relation = Relation(relation_name=relation_name, vehicle_id=vehicle_id)
+            db.add(relation)
+            db.flush()
+            db.refresh(relation)
+            vehicle_relations_changed(db, vehicle_id)
+            logger.info(f"Relation '{relation_name}' created for vehicle {vehicle_id}.")
+            return relation
     except Exception as e:
-        db.rollback()
         logger.error(f"Error creating relation: {e}")
         return None
-    finally:
-        db.close()
 
 @mutation.field("deleteRelation")
 def resolve_delete_relation(_, info, vehicle_id, relation_id):
-    db = SessionLocal()
+    db = get_session(info)
     try:
-        # Znajdź relację na podstawie `relation_id` i `vehicle_id`
-        relation = db.query(Relation).filter(Relation.relation_id == relation_id, Relation.vehicle_id == vehicle_id).first()
-        if relation:
-            # Usunięcie przystanków powiązanych z relacją
-            schedules = db.query(Schedule).filter(Schedule.relation_id == relation_id).all()
-            for schedule in schedules:
-                schedule.relation_id = None  # Usuń ID relacji z przystanków
+        with db.begin_nested():
+            # Znajdź relację na podstawie `relation_id` i `vehicle_id`
+            relation = db.query(Relation).filter(Relation.relation_id == relation_id, Relation.vehicle_id == vehicle_id).first()
+            if relation:
+                # Usunięcie przystanków powiązanych z relacją
+                schedules = db.query(Schedule).filter(Schedule.relation_id == relation_id).all()
+                for schedule in schedules:
+                    schedule.relation_id = None  # Usuń ID relacji z przystanków
            
-            # Usuń powiązaną pozycję w tabeli `PriceList`
-            pricelist = db.query(PriceList).filter(PriceList.relation_id == relation_id).first()
-            if pricelist:
-                db.delete(pricelist)
-
-            # Usuń relację
-            db.delete(relation)
-            db.commit()
-            return "Relacja usunięta wraz z cenami"
-        else:
-            return "Relacja nie została znaleziona"
+                # Usuń powiązaną pozycję w tabeli `PriceList`
+                pricelist = db.query(PriceList).filter(PriceList.relation_id == relation_id).first()
+                if pricelist:
+                    db.delete(pricelist)
+
+                # Usuń rejestr zajętości relacji
+                db.query(RelationDailyLoad).filter(RelationDailyLoad.relation_id == relation_id).delete()
+
+                # Usuń relację
+                db.delete(relation)
+                db.flush()
+                timetable_changed(db, relation_id)
+                vehicle_relations_changed(db, vehicle_id)
+                return "Relacja usunięta wraz z cenami"
+            else:
+                return "Relacja nie została znaleziona"
     except Exception as e:
-        db.rollback()
         return str(e)
-    finally:
-        db.close()
 
 @mutation.field("assignScheduleToRelation")
 def resolve_assign_schedule_to_relation(_, info, schedule_id, relation_id):
-    session = SessionLocal()
+    session = get_session(info)
     try:
-        schedule = session.query(Schedule).filter(Schedule.schedule_id == schedule_id).first()
-        if schedule:
-            schedule.relation_id = relation_id
-            session.commit()
-            session.refresh(schedule)
-            return schedule
-        else:
-            raise Exception("Schedule not found")
+        with session.begin_nested():
+            schedule = session.query(Schedule).filter(Schedule.schedule_id == schedule_id).first()
+            if schedule:
+                previous_relation_id = schedule.relation_id
+                schedule.relation_id = relation_id
+                session.flush()
+                session.refresh(schedule)
+                timetable_changed(session, previous_relation_id, relation_id)
+                evict_tags(session, vehicle_tag(schedule.vehicle_id))
+                return schedule
+            else:
+                raise Exception("Schedule not found")
     except Exception as e:
-        session.rollback()
         return str(e)
-    finally:
-        session.close()
 
 @mutation.field("addShipmentProblem")
 def resolve_add_shipment_problem(_, info, order_id, user_id, description):
-    db = SessionLocal()
+    db = get_session(info)
     try:
-        # Dodaj problem przesyłki
-        problem = ShipmentProblem(order_id=order_id, user_id=user_id, description=description, status='Interwencja')
-        db.add(problem)
-
-        # Zaktualizuj status zamówienia na 'Interwencja'
-        order = db.query(Order).filter(Order.order_id == order_id).first()
-        if order:
-            order.status = 'Interwencja'
-
-            # Dodanie nowego wpisu do tabeli historii statusów
-            status_history = OrderStatusHistory(order_id=order_id, status='Interwencja')
-            db.add(status_history)
-        else:
-            raise Exception("Order not found")
-
-        db.commit()  # Zapisz wszystkie zmiany
-        db.refresh(problem)
-        return problem
+        with db.begin_nested():
+            # Dodaj problem przesyłki
+            problem = ShipmentProblem(order_id=order_id, user_id=user_id, description=description, status='Interwencja')
+            db.add(problem)
+
+            # Zaktualizuj status zamówienia na 'Interwencja'
+            order = db.query(Order).filter(Order.order_id == order_id).first()
+            if order:
+                load_before = order_load(order)
+                stats_before = order_stat(db, order)
+                order.status = 'Interwencja'
+                track_order(db, order, load_before)
+                track_order_stats(db, order, stats_before)
+
+                # Dodanie nowego wpisu do tabeli historii statusów
+                status_history = OrderStatusHistory(order_id=order_id, status='Interwencja')
+                db.add(status_history)
+            else:
+                raise Exception("Order not found")
+
+            db.flush()  # Zapisz wszystkie zmiany
+            db.refresh(problem)
+            order_status_changed(db, order, status_history)
+            intervention_reported(db, problem, order)
+            return problem
     except Exception as e:
-        db.rollback()
         raise Exception(f"Error adding shipment problem: {e}")
-    finally:
-        db.close()
 
 @mutation.field("deleteShipmentProblem")
 def resolve_delete_shipment_problem(_, info, problem_id):
-    db = SessionLocal()
+    db = get_session(info)
     try:
-        # Znajdź problem przesyłki na podstawie problem_id
-        problem = db.query(ShipmentProblem).filter(ShipmentProblem.problem_id == problem_id).first()
-        if problem:
-            # Usuń problem przesyłki
-            db.delete(problem)
-            db.commit()
-            return "Problem przesyłki został usunięty"
-        else:
-            return "Problem przesyłki nie został znaleziony"
+        with db.begin_nested():
+            # Znajdź problem przesyłki na podstawie problem_id
+            problem = db.query(ShipmentProblem).filter(ShipmentProblem.problem_id == problem_id).first()
+            if problem:
+                # Usuń problem przesyłki
+                db.delete(problem)
+                db.flush()
+                return "Problem przesyłki został usunięty"
+            else:
+                return "Problem przesyłki nie został znaleziony"
     except Exception as e:
-        db.rollback()
         return f"Błąd podczas usuwania problemu przesyłki: {str(e)}"
-    finally:
-        db.close()
 
 @mutation.field("deleteShipmentHistory")
 def resolve_delete_shipment_history(_, info, order_id):
-    db = SessionLocal()
+    db = get_session(info)
     try:
-        # Usuń wpisy problemów przesyłek powiązane z zamówieniem
-        db.query(ShipmentProblem).filter(ShipmentProblem.order_id == order_id).delete()
-
-        # Usuń wpisy historii statusu powiązane z zamówieniem
-        db.query(OrderStatusHistory).filter(OrderStatusHistory.order_id == order_id).delete()
-
-        # Znajdź i usuń zamówienie
-        order = db.query(Order).filter(Order.order_id == order_id).first()
-        if order:
-            db.delete(order)
-            db.commit()
-            return "Order removed from history"
-        else:
-            raise Exception("Order not found")
+        with db.begin_nested():
+            # Usuń wpisy problemów przesyłek powiązane z zamówieniem
+            db.query(ShipmentProblem).filter(ShipmentProblem.order_id == order_id).delete()
+
+            # Usuń wpisy historii statusu powiązane z zamówieniem
+            db.query(OrderStatusHistory).filter(OrderStatusHistory.order_id == order_id).delete()
+
+            # Znajdź i usuń zamówienie
+            order = db.query(Order).filter(Order.order_id == order_id).first()
+            if order:
+                track_order(db, None, order_load(order))
+                track_order_stats(db, None, order_stat(db, order))
+                db.delete(order)
+                db.flush()
+                return "Order removed from history"
+            else:
+                raise Exception("Order not found")
     except Exception as e:
-        db.rollback()
         raise Exception(f"Error deleting shipment history: {e}")
-    finally:
-        db.close()
 
 @query.field("getUserShipmentProblems")
 def resolve_get_user_shipment_problems(_, info, user_id):
-    db = SessionLocal()
-    try:
-        problems = db.query(ShipmentProblem).filter(ShipmentProblem.user_id == user_id).all()
-        return problems
-    finally:
-        db.close()
+    db = get_session(info)
+    problems = db.query(ShipmentProblem).filter(ShipmentProblem.user_id == user_id).all()
+    return problems
+
+@query.field("getUserShipmentProblemsConnection")
+def resolve_get_user_shipment_problems_connection(_, info, user_id, first=None, after=None):
+    problems = get_session(info).query(ShipmentProblem).filter(ShipmentProblem.user_id == user_id)
+    return paginate(problems, ShipmentProblem.problem_id, first, after)
 
 @mutation.field("addOrderStatusHistory")
 def resolve_add_order_status_history(_, info, order_id, status):
-    db = SessionLocal()
+    db = get_session(info)
     try:
-        # Znajdź zamówienie po order_id, aby upewnić się, że istnieje
-        order = db.query(Order).filter(Order.order_id == order_id).first()
-        if not order:
-            raise Exception("Order not found")
-
-        # Dodaj nowy wpis do historii statusów zamówienia
-        status_history = OrderStatusHistory(order_id=order_id, status=status, changed_at=datetime.utcnow())
-        db.add(status_history)
-        db.commit()
-
-        # Odświeżenie obiektu status_history, aby uzyskać najnowsze dane
-        db.refresh(status_history)
-        return status_history
+        with db.begin_nested():
+            # Znajdź zamówienie po order_id, aby upewnić się, że istnieje
+            order = db.query(Order).filter(Order.order_id == order_id).first()
+            if not order:
+                raise Exception("Order not found")
+
+            # Dodaj nowy wpis do historii statusów zamówienia
+            status_history = OrderStatusHistory(order_id=order_id, status=status, changed_at=datetime.utcnow())
+            db.add(status_history)
+            db.flush()
+
+            # Odświeżenie obiektu status_history, aby uzyskać najnowsze dane
+            db.refresh(status_history)
+            return status_history
     except Exception as e:
-        db.rollback()
         raise Exception(f"Error adding order status history: {e}")
-    finally:
-        db.close()
 
 @mutation.field("removeOrderFromUserHistory")
 def resolve_remove_order_from_user_history(_, info, order_id, user_id):
-    db = SessionLocal()
+    db = get_session(info)
     try:
-        # Logika do usunięcia przesyłki z historii użytkownika
-        order = db.query(Order).filter(Order.order_id == order_id, Order.user_id == user_id).first()
-        if order:
-            # Dodajemy pole "deleted_by_user" do modelu Order w bazie danych, aby oznaczyć usunięcie przez użytkownika
-            order.deleted_by_user = True
-            db.commit()
-            return "Order removed from user history"
-        else:
-            return "Order not found for this user"
+        with db.begin_nested():
+            # Logika do usunięcia przesyłki z historii użytkownika
+            order = db.query(Order).filter(Order.order_id == order_id, Order.user_id == user_id).first()
+            if order:
+                # Dodajemy pole "deleted_by_user" do modelu Order w bazie danych, aby oznaczyć usunięcie przez użytkownika
+                order.deleted_by_user = True
+                db.flush()
+                return "Order removed from user history"
+            else:
+                return "Order not found for this user"
     except Exception as e:
-        db.rollback()
         raise Exception(f"Error removing order from user history: {e}")
-    finally:
-        db.close()
 
 @mutation.field("removeOrderFromCarrierHistory")
 def resolve_remove_order_from_carrier_history(_, info, order_id, carrier_id):
-    db = SessionLocal()
+    db = get_session(info)
     try:
-        # Logika do usunięcia przesyłki z historii przewoźnika
-        order = db.query(Order).join(Relation).join(Vehicle).filter(Order.order_id == order_id, Vehicle.owner_id == carrier_id).first()
-        if order:
-            # Dodajemy pole "deleted_by_carrier" do modelu Order w bazie danych, aby oznaczyć usunięcie przez przewoźnika
-            order.deleted_by_carrier = True
-            db.commit()
-            return "Order removed from carrier history"
-        else:
-            return "Order not found for this carrier"
+        with db.begin_nested():
+            # Logika do usunięcia przesyłki z historii przewoźnika
+            order = db.query(Order).join(Relation).join(Vehicle).filter(Order.order_id == order_id, Vehicle.owner_id == carrier_id).first()
+            if order:
+                # Dodajemy pole "deleted_by_carrier" do modelu Order w bazie danych, aby oznaczyć usunięcie przez przewoźnika
+                order.deleted_by_carrier = True
+                db.flush()
+                return "Order removed from carrier history"
+            else:
+                return "Order not found for this carrier"
     except Exception as e:
-        db.rollback()
         raise Exception(f"Error removing order from carrier history: {e}")
-    finally:
-        db.close()
 
 @mutation.field("updateOrderDetails")
 def resolve_update_order_details(_, info, order_id, pickup_code, delivery_code, deleted_by_user, deleted_by_carrier, status=None):
-    session = SessionLocal()
+    session = get_session(info)
     try:
-        order = session.query(Order).filter(Order.order_id == order_id).first()
-        if not order:
-            raise Exception("Order not found")
-
-        # Aktualizacja szczegółów zamówienia
-        order.pickup_code = pickup_code
-        order.delivery_code = delivery_code
-        order.deleted_by_user = deleted_by_user
-        order.deleted_by_carrier = deleted_by_carrier
-
-        # Aktualizacja statusu zamówienia, jeśli podano
-        if status:
-            order.status = status
-            # Tworzenie nowego wpisu w historii statusów zamówienia
-            status_history = OrderStatusHistory(order_id=order_id, status=status)
-            session.add(status_history)
-
-        session.commit()
-        session.refresh(order)
-        return order
+        with session.begin_nested():
+            order = session.query(Order).filter(Order.order_id == order_id).first()
+            if not order:
+                raise Exception("Order not found")
+
+            load_before = order_load(order)
+            stats_before = order_stat(session, order)
+
+            # Aktualizacja szczegółów zamówienia
+            order.pickup_code = pickup_code
+            order.delivery_code = delivery_code
+            order.deleted_by_user = deleted_by_user
+            order.deleted_by_carrier = deleted_by_carrier
+
+            # Aktualizacja statusu zamówienia, jeśli podano
+            status_history = None
+            if status:
+                order.status = status
+                # Tworzenie nowego wpisu w historii statusów zamówienia
+                status_history = OrderStatusHistory(order_id=order_id, status=status)
+                session.add(status_history)
+
+            track_order(session, order, load_before)
+            track_order_stats(session, order, stats_before)
+            session.flush()
+            session.refresh(order)
+            if status_history is not None:
+                order_status_changed(session, order, status_history)
+            return order
     except Exception as e:
-        session.rollback()
         raise Exception(f"Error updating order details: {e}")
-    finally:
-        session.close()
 
 @query.field("getInterventionOrders")
 def resolve_get_intervention_orders(_, info):
-    db = SessionLocal()
+    db = get_session(info)
     try:
         # Pobierz zamówienia, które mają problemy i status 'Interwencja'
         intervention_orders = db.query(Order).options(
@@ -1328,12 +1229,30 @@ def resolve_get_intervention_orders(_, info):
         return results
     except Exception as e:
         raise Exception(f"Error fetching intervention orders: {e}")
-    finally:
-        db.close()
+
+# Strona zgłoszeń interwencji: zamówienie, problem, klient i przewoźnik w jednym zapytaniu na stronę
+@query.field("getInterventionOrdersConnection")
+def resolve_get_intervention_orders_connection(_, info, first=None, after=None):
+    db = get_session(info)
+    customer = aliased(User)
+    carrier = aliased(User)
+    rows = db.query(ShipmentProblem, Order, customer, carrier).join(
+        Order, Order.order_id == ShipmentProblem.order_id
+    ).join(customer, customer.user_id == Order.user_id).join(
+        Relation, Relation.relation_id == Order.relation_id
+    ).join(Vehicle, Vehicle.vehicle_id == Relation.vehicle_id).join(
+        carrier, carrier.user_id == Vehicle.owner_id
+    ).filter(ShipmentProblem.status == 'Interwencja')
+
+    return paginate(
+        rows, ShipmentProblem.problem_id, first, after,
+        key=lambda row: row[0].problem_id,
+        node=lambda row: {"problem": row[0], "order": row[1], "customer": row[2], "carrier": row[3]},
+    )
 
 @mutation.field("createOrUpdatePriceList")
 def resolve_create_or_update_price_list(_, info, relation_id, base_price, price_per_stop):
-    db = SessionLocal()
+    db = get_session(info)
     price_list = db.query(PriceList).filter(PriceList.relation_id == relation_id).first()
 
     if not price_list:
@@ -1343,16 +1262,18 @@ def resolve_create_or_update_price_list(_, info, relation_id, base_price, price_
         price_list.base_price = base_price
         price_list.price_per_stop = price_per_stop
 
-    db.commit()
+    db.flush()
     db.refresh(price_list)
-    db.close()
+    evict_tags(db, relation_tag(relation_id))
+    after_commit(db, timetable_version.committed, timetable_version.bump(db))
+    after_commit(db, fare_table.invalidate, price_list.relation_id)
     return price_list
 
 @query.field("getPriceList")
+@cached_query("getPriceList", lambda relation_id: [relation_tag(relation_id)])
 def resolve_get_price_list(_, info, relation_id):
-    db = SessionLocal()
+    db = get_session(info)
     pricelist = db.query(PriceList).filter(PriceList.relation_id == relation_id).first()  # Użyj poprawnej nazwy klasy PriceList
-    db.close()
     if pricelist:
         return {
             "base_price": pricelist.base_price,
@@ -1361,11 +1282,91 @@ def resolve_get_price_list(_, info, relation_id):
     return None
 
 @query.field("getUserRelations")
+@cached_query("getUserRelations", lambda owner_id: [owner_tag(owner_id)])
 def resolve_get_user_relations(_, info, owner_id):
-    db = SessionLocal()
-    try:
-        # Pobierz relacje powiązane z pojazdami danego właściciela (owner_id)
-        relations = db.query(Relation).join(Vehicle).filter(Vehicle.owner_id == owner_id).all()
-        return relations
-    finally:
-        db.close()
+    db = get_session(info)
+    # Pobierz relacje powiązane z pojazdami danego właściciela (owner_id)
+    relations = db.query(Relation).join(Vehicle).filter(Vehicle.owner_id == owner_id).all()
+    return relations
+
+# Subskrypcje (WebSocket) - zdarzenia publikowane po zatwierdzeniu mutacji, bez dostępu do bazy danych
+
+@subscription.source("orderStatusChanged")
+def order_status_changed_source(_, info, user_id=None, carrier_id=None, driver_id=None):
+    return subscribe_events(ORDER_STATUS_CHANNEL, user_id=user_id, carrier_id=carrier_id, driver_id=driver_id)
+
+@subscription.field("orderStatusChanged")
+def resolve_order_status_changed(event, info, **_filters):
+    return event
+
+@subscription.source("interventionReported")
+def intervention_reported_source(_, info, carrier_id=None):
+    return subscribe_events(INTERVENTION_CHANNEL, carrier_id=carrier_id)
+
+@subscription.field("interventionReported")
+def resolve_intervention_reported(event, info, **_filters):
+    return event
+
+
+# Resolvery pól zagnieżdżonych - powiązane obiekty ładowane zbiorczo przez loadery z kontekstu zapytania
+
+def _loaded_value(obj, name):
+    # Zwraca (True, wartość), jeśli pole jest już dostępne bez zapytania do bazy
+    if isinstance(obj, dict):
+        return name in obj, obj.get(name)
+    if name in obj.__dict__:
+        return True, obj.__dict__[name]
+    return False, None
+
+def _load_related(name, loader_name, key_name, many=False):
+    def resolve_related(obj, info):
+        loaded, value = _loaded_value(obj, name)
+        if loaded:
+            return value
+        key = obj.get(key_name) if isinstance(obj, dict) else getattr(obj, key_name)
+        if key is None:
+            return [] if many else None
+        return getattr(get_loaders(info), loader_name).load(key)
+    return resolve_related
+
+user_type = ObjectType("User")
+user_type.set_field("wallet", _load_related("wallet", "wallets_by_user", "user_id"))
+
+vehicle_type = ObjectType("Vehicle")
+vehicle_type.set_field("owner", _load_related("owner", "users", "owner_id"))
+
+schedule_type = ObjectType("Schedule")
+schedule_type.set_field("vehicle", _load_related("vehicle", "vehicles", "vehicle_id"))
+schedule_type.set_field("relation", _load_related("relation", "relations", "relation_id"))
+
+relation_type = ObjectType("Relation")
+relation_type.set_field("vehicle", _load_related("vehicle", "vehicles", "vehicle_id"))
+relation_type.set_field("schedules", _load_related("schedules", "schedules_by_relation", "relation_id", many=True))
+
+order_type = ObjectType("Order")
+order_type.set_field("user", _load_related("user", "users", "user_id"))
+order_type.set_field("relation", _load_related("relation", "relations", "relation_id"))
+order_type.set_field("driver", _load_related("driver", "drivers", "driver_id"))
+order_type.set_field("status_history", _load_related("status_history", "status_history", "order_id", many=True))
+
+wallet_type = ObjectType("Wallet")
+wallet_type.set_field("user", _load_related("user", "users", "user_id"))
+wallet_type.set_field("balance", _load_related("current_balance", "wallet_balances", "wallet_id"))
+
+driver_type = ObjectType("Driver")
+driver_type.set_field("owner", _load_related("owner", "users", "owner_id"))
+
+shipment_problem_type = ObjectType("ShipmentProblem")
+shipment_problem_type.set_field("order", _load_related("order", "orders", "order_id"))
+shipment_problem_type.set_field("user", _load_related("user", "users", "user_id"))
+
+# Kwoty z księgi portfela (Decimal) serializowane jako liczby, jak dotychczasowe pola Float
+money_scalar = ScalarType("Money", serializer=float)
+
+price_list_type = ObjectType("PriceList")
+price_list_type.set_field("relation", _load_related("relation", "relations", "relation_id"))
+
+object_types = [
+    user_type, vehicle_type, schedule_type, relation_type, order_type,
+    wallet_type, driver_type, shipment_problem_type, price_list_type, money_scalar,
+]
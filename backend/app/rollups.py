@@ -0,0 +1,31 @@
+from sqlalchemy import insert
+from sqlalchemy.dialects import mysql, sqlite
+
+# Wspólne operacje na tabelach agregatów (rejestr zajętości, statystyki przewoźników itp.)
+
+
+# Dodaje `deltas` do liczników wiersza o kluczu `keys` jednym atomowym upsertem;
+# brakujący wiersz jest wstawiany z wartościami równymi deltom
+def upsert_add(db, model, keys, deltas):
+    values = {**keys, **deltas}
+    dialect = db.get_bind().dialect.name
+    if dialect == 'mysql':
+        stmt = mysql.insert(model).values(**values)
+        stmt = stmt.on_duplicate_key_update(
+            {name: getattr(model, name) + getattr(stmt.inserted, name) for name in deltas}
+        )
+    elif dialect == 'sqlite':
+        stmt = sqlite.insert(model).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[getattr(model, name) for name in keys],
+            set_={name: getattr(model, name) + getattr(stmt.excluded, name) for name in deltas},
+        )
+    else:
+        updated = db.query(model).filter(*[getattr(model, name) == value for name, value in keys.items()]).update(
+            {getattr(model, name): getattr(model, name) + delta for name, delta in deltas.items()},
+            synchronize_session=False,
+        )
+        if updated:
+            return
+        stmt = insert(model).values(**values)
+    db.execute(stmt)
@@ -0,0 +1,144 @@
+import threading
+from collections import namedtuple
+
+from app.data_versions import timetable_version
+from app.models import Schedule
+
+# Pojedynczy przystanek relacji w indeksie tras
+StopTime = namedtuple("StopTime", ["schedule_id", "vehicle_id", "stop", "order_number", "arrival_time", "departure_time"])
+
+# Kandydat kursu: relacja oraz przystanek początkowy i końcowy na tej relacji
+Course = namedtuple("Course", ["relation_id", "start", "end"])
+
+
+class RouteIndex:
+    # Indeks tras trzymany w pamięci procesu:
+    #   relation_id -> przystanki relacji posortowane po order_number
+    #   stop -> lista (relation_id, pozycja na liście przystanków relacji)
+    # Relacje zmienione przez mutacje rozkładu są oznaczane jako nieaktualne
+    # i przeładowywane jednym zapytaniem przy następnym wyszukiwaniu.
+    # Zmiany z innych procesów wykrywa `version` (app/data_versions.py) - wtedy indeks wczytywany jest od nowa.
+
+    def __init__(self, version=None):
+        self._lock = threading.RLock()
+        self._relations = {}
+        self._stops = {}
+        self._loaded = False
+        self._dirty = set()
+        self._version = version
+        if version is not None:
+            version.on_change(self.reset)
+
+    def invalidate(self, *relation_ids):
+        with self._lock:
+            self._dirty.update(r for r in relation_ids if r is not None)
+
+    def reset(self):
+        with self._lock:
+            self._relations = {}
+            self._stops = {}
+            self._loaded = False
+            self._dirty = set()
+
+    # force_check - wersja sprawdzana w bazie niezależnie od DATA_VERSION_CHECK_SECONDS
+    def ensure_fresh(self, db, force_check=False):
+        if self._version is not None:
+            self._version.check(db, force_check)
+        with self._lock:
+            if not self._loaded:
+                self.load_rows(self._fetch_rows(db), full=True)
+            elif self._dirty:
+                dirty = set(self._dirty)
+                rows = self._fetch_rows(db, dirty)
+                self.load_rows(rows, relation_ids=dirty)
+
+    def _fetch_rows(self, db, relation_ids=None):
+        query = db.query(
+            Schedule.relation_id,
+            Schedule.schedule_id,
+            Schedule.vehicle_id,
+            Schedule.stop,
+            Schedule.order_number,
+            Schedule.arrival_time,
+            Schedule.departure_time,
+        )
+        if relation_ids is None:
+            query = query.filter(Schedule.relation_id.isnot(None))
+        else:
+            query = query.filter(Schedule.relation_id.in_(relation_ids))
+        return query.order_by(Schedule.relation_id, Schedule.order_number, Schedule.schedule_id).all()
+
+    def load_rows(self, rows, relation_ids=None, full=False):
+        # rows: krotki (relation_id, schedule_id, vehicle_id, stop, order_number, arrival_time, departure_time)
+        grouped = {}
+        for relation_id, *rest in rows:
+            grouped.setdefault(relation_id, []).append(StopTime(*rest))
+
+        with self._lock:
+            if full:
+                self._relations = {}
+                self._stops = {}
+                relation_ids = grouped.keys()
+            else:
+                relation_ids = set(relation_ids or ()) | set(grouped)
+
+            for relation_id in list(relation_ids):
+                self._remove_relation(relation_id)
+                stops = sorted(grouped.get(relation_id, ()), key=lambda s: (s.order_number, s.schedule_id))
+                if not stops:
+                    continue
+                self._relations[relation_id] = stops
+                for position, stop_time in enumerate(stops):
+                    self._stops.setdefault(stop_time.stop, []).append((relation_id, position))
+
+            if full:
+                self._dirty.clear()
+            else:
+                self._dirty.difference_update(relation_ids)
+            self._loaded = True
+
+    def _remove_relation(self, relation_id):
+        old = self._relations.pop(relation_id, None)
+        if not old:
+            return
+        for stop in {s.stop for s in old}:
+            entries = [e for e in self._stops.get(stop, ()) if e[0] != relation_id]
+            if entries:
+                self._stops[stop] = entries
+            else:
+                self._stops.pop(stop, None)
+
+    def relation_stops(self, relation_id):
+        with self._lock:
+            return list(self._relations.get(relation_id, ()))
+
+    def stops_at(self, stop):
+        with self._lock:
+            return list(self._stops.get(stop, ()))
+
+    # Przystanek początkowy i końcowy relacji (ostatnie wystąpienia nazw); None, gdy któregoś brakuje
+    def course_endpoints(self, relation_id, start_stop, end_stop):
+        start = end = None
+        for stop_time in self.relation_stops(relation_id):
+            if stop_time.stop == start_stop:
+                start = stop_time
+            if stop_time.stop == end_stop:
+                end = stop_time
+        return (start, end) if start and end else None
+
+    def find_courses(self, start_stop, end_stop):
+        # Dla każdego wystąpienia przystanku początkowego szukamy pierwszego
+        # późniejszego przystanku końcowego tego samego pojazdu na tej samej relacji
+        courses = []
+        with self._lock:
+            for relation_id, position in self._stops.get(start_stop, ()):
+                stops = self._relations[relation_id]
+                start = stops[position]
+                for candidate in stops[position + 1:]:
+                    if candidate.vehicle_id == start.vehicle_id and candidate.stop == end_stop:
+                        courses.append(Course(relation_id, start, candidate))
+                        break
+        return courses
+
+
+route_index = RouteIndex(timetable_version)
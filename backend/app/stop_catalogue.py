@@ -0,0 +1,92 @@
+import threading
+import unicodedata
+from bisect import bisect_left
+
+from app.data_versions import timetable_version
+from app.models import Schedule
+
+DEFAULT_SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 50
+
+# Znaki, których NFKD nie rozkłada na literę bazową i znak diakrytyczny
+EXTRA_FOLDING = str.maketrans({"ł": "l", "ø": "o", "đ": "d", "ß": "ss"})
+
+
+def normalize(text):
+    # Porównanie bez wielkości liter i polskich znaków: "Łódź" ~ "lodz"
+    text = text.casefold().translate(EXTRA_FOLDING)
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+class StopCatalogue:
+    # Katalog nazw przystanków w pamięci procesu z posortowanym indeksem prefiksów.
+    # Każda nazwa indeksowana jest od początku każdego słowa ("Kraków Dworzec" pasuje
+    # do "kra" i do "dwo"). Po zmianie rozkładu katalog jest oznaczany jako nieaktualny
+    # i wczytywany ponownie jednym zapytaniem przy następnym użyciu, także po zmianie
+    # wykonanej przez inny proces (`version`, app/data_versions.py).
+
+    def __init__(self, version=None):
+        self._lock = threading.Lock()
+        self._stops = []
+        self._keys = []
+        self._entries = []
+        self._loaded = False
+        self._generation = 0
+        self._version = version
+        if version is not None:
+            version.on_change(self.invalidate)
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+            self._generation += 1
+
+    def ensure_fresh(self, db):
+        if self._version is not None:
+            self._version.check(db)
+        with self._lock:
+            if self._loaded:
+                return
+            generation = self._generation
+        stops = [stop for (stop,) in db.query(Schedule.stop).distinct()]
+        self.load(stops, generation)
+
+    def load(self, stops, generation=None):
+        entries = []
+        for stop in set(stops):
+            words = stop.split()
+            for i in range(len(words)):
+                entries.append((normalize(" ".join(words[i:])), stop))
+        entries.sort()
+        with self._lock:
+            self._stops = sorted(set(stops))
+            self._keys = [key for key, _ in entries]
+            self._entries = entries
+            # Katalog wczytany przed unieważnieniem zostanie wczytany ponownie przy następnym użyciu
+            self._loaded = generation is None or generation == self._generation
+
+    def all_stops(self):
+        with self._lock:
+            return list(self._stops)
+
+    def search(self, prefix, limit=DEFAULT_SEARCH_LIMIT):
+        prefix = normalize(prefix.strip())
+        limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        with self._lock:
+            position = bisect_left(self._keys, prefix)
+            while position < len(self._keys) and self._keys[position].startswith(prefix):
+                stop = self._entries[position][1]
+                if stop not in seen:
+                    seen.add(stop)
+                    results.append(stop)
+                    if len(results) == limit:
+                        break
+                position += 1
+        return results
+
+
+stop_catalogue = StopCatalogue(timetable_version)
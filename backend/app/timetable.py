@@ -0,0 +1,158 @@
+import argparse
+import csv
+import logging
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import case, func, insert
+
+from app.models import Relation, Schedule, Vehicle
+
+logger = logging.getLogger(__name__)
+
+# Zbiorcze operacje na rozkładzie jazdy relacji: import wielu przystanków jednym INSERT-em,
+# zmiana kolejności jednym UPDATE ... CASE oraz import całej sieci przewoźnika z pliku CSV.
+# Funkcje nie zatwierdzają transakcji - robi to wywołujący (zapytanie GraphQL albo CLI).
+# Import z CLI działa w osobnym procesie: zwiększa wersję rozkładu w tej samej transakcji
+# (app/data_versions.py), a uruchomione procesy aplikacji wczytują indeks tras, cenniki i katalog
+# przystanków ponownie najpóźniej po DATA_VERSION_CHECK_SECONDS - bez restartu.
+
+# Kolumny pliku CSV z siecią przewoźnika (jeden wiersz = jeden przystanek relacji)
+CSV_COLUMNS = ["registration_number", "relation_name", "stop_sequence", "stop", "arrival_time", "departure_time"]
+
+
+def parse_time(value):
+    try:
+        return datetime.strptime(value.strip(), '%H:%M').replace(year=1970, month=1, day=1)
+    except ValueError:
+        raise ValueError(f"Nieprawidłowa godzina: {value} (oczekiwany format GG:MM)")
+
+def schedule_rows(vehicle_id, relation_id, stops, first_order_number):
+    rows = []
+    for order_number, stop in enumerate(stops, start=first_order_number):
+        name = stop["stop"].strip()
+        if not name:
+            raise ValueError(f"Brak nazwy przystanku na pozycji {order_number - first_order_number + 1}")
+        rows.append({
+            "vehicle_id": vehicle_id,
+            "relation_id": relation_id,
+            "stop": name,
+            "arrival_time": parse_time(stop["arrival_time"]),
+            "departure_time": parse_time(stop["departure_time"]),
+            "order_number": order_number,
+        })
+    return rows
+
+def get_relation(db, relation_id):
+    relation = db.query(Relation).filter(Relation.relation_id == relation_id).first()
+    if relation is None:
+        raise ValueError(f"Relacja {relation_id} nie istnieje")
+    return relation
+
+def relation_schedules(db, relation_id):
+    # populate_existing - obiekty już wczytane do sesji dostają wartości po zbiorczym INSERT/UPDATE
+    return db.query(Schedule).filter(Schedule.relation_id == relation_id).order_by(
+        Schedule.order_number
+    ).populate_existing().all()
+
+# Dodaje przystanki na końcu relacji (albo zastępuje cały jej rozkład, gdy `replace`).
+# Numeracja kontynuuje numerację przystanków pojazdu, tak jak w addSchedule.
+def import_schedules(db, relation_id, stops, replace=False):
+    relation = get_relation(db, relation_id)
+    if replace:
+        db.query(Schedule).filter(Schedule.relation_id == relation_id).delete(synchronize_session=False)
+    last_order_number = db.query(func.max(Schedule.order_number)).filter(
+        Schedule.vehicle_id == relation.vehicle_id
+    ).scalar() or 0
+    rows = schedule_rows(relation.vehicle_id, relation_id, stops, last_order_number + 1)
+    if rows:
+        db.execute(insert(Schedule), rows)
+    return relation_schedules(db, relation_id)
+
+# Ustawia kolejność przystanków relacji według listy `schedule_ids` (numery 1..n) jednym zapytaniem
+def reorder_schedules(db, relation_id, schedule_ids):
+    get_relation(db, relation_id)
+    current = {schedule_id for (schedule_id,) in db.query(Schedule.schedule_id).filter(Schedule.relation_id == relation_id)}
+    if len(set(schedule_ids)) != len(schedule_ids) or set(schedule_ids) != current:
+        raise ValueError(f"Lista przystanków musi zawierać każdy przystanek relacji {relation_id} dokładnie raz")
+    if schedule_ids:
+        order_numbers = {schedule_id: position for position, schedule_id in enumerate(schedule_ids, start=1)}
+        db.query(Schedule).filter(Schedule.relation_id == relation_id).update(
+            {Schedule.order_number: case(order_numbers, value=Schedule.schedule_id)}, synchronize_session=False
+        )
+    return relation_schedules(db, relation_id)
+
+# Wczytuje plik CSV i grupuje przystanki po (numer rejestracyjny, nazwa relacji) w kolejności stop_sequence
+def read_network_csv(file):
+    reader = csv.DictReader(file)
+    missing = [column for column in CSV_COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"Brak kolumn w pliku CSV: {', '.join(missing)}")
+    routes = defaultdict(list)
+    for line, row in enumerate(reader, start=2):
+        try:
+            sequence = int(row["stop_sequence"])
+        except ValueError:
+            raise ValueError(f"Nieprawidłowy stop_sequence w wierszu {line}: {row['stop_sequence']}")
+        routes[(row["registration_number"].strip(), row["relation_name"].strip())].append((sequence, row))
+    return {key: [row for _, row in sorted(stops, key=lambda item: item[0])] for key, stops in routes.items()}
+
+# Import sieci przewoźnika: relacje są tworzone lub odszukiwane po nazwie w obrębie pojazdu,
+# a ich rozkład jest zastępowany zawartością pliku. Zwraca id zmienionych relacji.
+def import_network(db, owner_id, routes):
+    registrations = {registration for registration, _ in routes}
+    vehicles = dict(db.query(Vehicle.registration_number, Vehicle.vehicle_id).filter(
+        Vehicle.owner_id == owner_id, Vehicle.registration_number.in_(registrations)
+    ))
+    unknown = sorted(registrations - vehicles.keys())
+    if unknown:
+        raise ValueError(f"Przewoźnik {owner_id} nie ma pojazdów: {', '.join(unknown)}")
+
+    relations = {
+        (vehicle_id, name): relation_id for relation_id, vehicle_id, name in db.query(
+            Relation.relation_id, Relation.vehicle_id, Relation.relation_name
+        ).filter(Relation.vehicle_id.in_(vehicles.values()))
+    }
+    relation_ids = []
+    for (registration, relation_name), stops in routes.items():
+        vehicle_id = vehicles[registration]
+        relation_id = relations.get((vehicle_id, relation_name))
+        if relation_id is None:
+            relation = Relation(relation_name=relation_name, vehicle_id=vehicle_id)
+            db.add(relation)
+            db.flush()
+            relation_id = relation.relation_id
+        import_schedules(db, relation_id, stops, replace=True)
+        relation_ids.append(relation_id)
+    return relation_ids
+
+
+if __name__ == "__main__":
+    # Import sieci przewoźnika z pliku CSV w jednej transakcji:
+    # python -m app.timetable --owner-id 5 siec.csv
+    from app.data_versions import DATA_VERSION_CHECK_SECONDS, timetable_version
+    from app.database import SessionLocal
+    from app.query_cache import evict_all
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--owner-id", type=int, required=True)
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with open(args.path, newline="", encoding="utf-8") as file:
+        routes = read_network_csv(file)
+
+    db = SessionLocal()
+    try:
+        relation_ids = import_network(db, args.owner_id, routes)
+        version = timetable_version.bump(db)
+        evict_all(db)
+        db.commit()
+        logger.info(f"Imported {sum(len(stops) for stops in routes.values())} stops into {len(relation_ids)} relations.")
+        logger.info(f"Timetable version {version}: running servers reload it within {DATA_VERSION_CHECK_SECONDS:g}s.")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
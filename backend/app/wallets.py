@@ -0,0 +1,203 @@
+import argparse
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from sqlalchemy import func, insert, or_, select
+
+from app.metrics import registry
+from app.models import Wallet, WalletTransaction
+
+logger = logging.getLogger(__name__)
+
+# Portfel jako księga transakcji: każda zmiana środków to dopisany wiersz wallet_transactions
+# z dokładną kwotą dziesiętną, a Wallet.balance to saldo transakcji już rozliczonych.
+# Bieżące saldo = Wallet.balance + suma nierozliczonych transakcji (jedno zapytanie).
+# Uznania (wypłata za doręczenie) tylko dopisują wiersz, bez blokady wiersza portfela, więc
+# portfel przewoźnika z wieloma doręczeniami nie jest punktem rywalizacji. Obciążenia
+# i rozliczenie blokują wiersz portfela, dzięki czemu saldo nie spadnie poniżej zera, a żadna
+# transakcja nie zostanie doliczona do salda dwa razy.
+# Rozliczenie przenosi nierozliczone transakcje do Wallet.balance, gdy portfel ma ich co najmniej
+# WALLET_SETTLE_THRESHOLD albo najstarsza czeka dłużej niż WALLET_SETTLE_MAX_AGE sekund.
+
+WALLET_SETTLE_SECONDS = float(os.environ.get("WALLET_SETTLE_SECONDS", "30"))  # 0 - tylko `python -m app.wallets`
+WALLET_SETTLE_THRESHOLD = int(os.environ.get("WALLET_SETTLE_THRESHOLD", "100"))
+WALLET_SETTLE_MAX_AGE = float(os.environ.get("WALLET_SETTLE_MAX_AGE", "3600"))
+
+# Rodzaje transakcji
+ORDER_PAYMENT = "order_payment"
+DELIVERY_PAYOUT = "delivery_payout"
+ADJUSTMENT = "adjustment"
+
+CENT = Decimal("0.01")
+
+wallet_transactions = registry.counter("wallet_transactions_total", "Transakcje dopisane do księgi portfeli (kind)")
+wallet_settlements = registry.counter("wallet_settlements_total", "Transakcje przeniesione do salda rozliczonego")
+
+
+class InsufficientFunds(ValueError):
+    pass
+
+
+# Kwota jako Decimal z dokładnością do grosza (ceny zamówień są jeszcze typu Float)
+def to_amount(value):
+    return Decimal(str(value)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+def wallet_ids(db, user_ids):
+    return dict(db.query(Wallet.user_id, Wallet.wallet_id).filter(Wallet.user_id.in_(set(user_ids))))
+
+# Dopisuje transakcje jednym INSERT; `entries` - słowniki wallet_id, amount, kind i opcjonalnie order_id
+def record(db, entries):
+    rows = [{**entry, "amount": to_amount(entry["amount"]), "created_at": datetime.now()} for entry in entries]
+    if not rows:
+        return
+    db.execute(insert(WalletTransaction), rows)
+    for row in rows:
+        wallet_transactions.inc(kind=row["kind"])
+
+def credit(db, wallet_id, amount, kind, order_id=None):
+    record(db, [{"wallet_id": wallet_id, "amount": amount, "kind": kind, "order_id": order_id}])
+
+def unsettled_tail():
+    return select(func.coalesce(func.sum(WalletTransaction.amount), 0)).where(
+        WalletTransaction.wallet_id == Wallet.wallet_id, WalletTransaction.settled_at.is_(None)
+    ).scalar_subquery()
+
+# Bieżące salda portfeli {wallet_id: saldo}; saldo rozliczone i nierozliczone transakcje z jednego odczytu
+def balances(db, ids):
+    rows = db.query(Wallet.wallet_id, Wallet.balance + unsettled_tail()).filter(Wallet.wallet_id.in_(set(ids)))
+    return {wallet_id: to_amount(balance) for wallet_id, balance in rows}
+
+def balance(db, wallet_id):
+    return balances(db, [wallet_id]).get(wallet_id)
+
+# Blokuje portfel spełniający `criteria` i jego nierozliczone transakcje; zwraca (portfel, [(transaction_id, kwota)])
+def lock_wallet(db, *criteria):
+    wallet = db.query(Wallet).filter(*criteria).with_for_update().first()
+    if wallet is None:
+        return None, []
+    # Odczyt blokujący widzi ostatnio zatwierdzone wiersze, a nie migawkę z początku transakcji
+    tail = db.query(WalletTransaction.transaction_id, WalletTransaction.amount).filter(
+        WalletTransaction.wallet_id == wallet.wallet_id, WalletTransaction.settled_at.is_(None)
+    ).with_for_update().all()
+    return wallet, tail
+
+def locked_balance(wallet, tail):
+    return to_amount(wallet.balance) + sum((to_amount(amount) for _, amount in tail), Decimal(0))
+
+# Obciąża portfel użytkownika, jeśli bieżące saldo na to pozwala; zwraca nowe saldo
+def debit(db, user_id, amount, kind, order_id=None):
+    amount = to_amount(amount)
+    wallet, tail = lock_wallet(db, Wallet.user_id == user_id)
+    if wallet is None:
+        raise InsufficientFunds(f"Portfel użytkownika {user_id} nie istnieje")
+    available = locked_balance(wallet, tail)
+    if available < amount:
+        raise InsufficientFunds("Brak wystarczających środków na koncie")
+    credit(db, wallet.wallet_id, -amount, kind, order_id)
+    return available - amount
+
+# Ustawia bieżące saldo na `new_balance` transakcją korygującą różnicę; zwraca portfel albo None
+def set_balance(db, user_id, new_balance):
+    wallet, tail = lock_wallet(db, Wallet.user_id == user_id)
+    if wallet is None:
+        return None
+    difference = to_amount(new_balance) - locked_balance(wallet, tail)
+    if difference:
+        credit(db, wallet.wallet_id, difference, ADJUSTMENT)
+    return wallet
+
+
+# Przenosi nierozliczone transakcje portfela do Wallet.balance; zwraca liczbę rozliczonych transakcji
+def settle_wallet(db, wallet_id, now=None):
+    wallet, tail = lock_wallet(db, Wallet.wallet_id == wallet_id)
+    if not tail:
+        return 0
+    now = now or datetime.now()
+    wallet.balance = locked_balance(wallet, tail)
+    wallet.settled_at = now
+    db.query(WalletTransaction).filter(WalletTransaction.transaction_id.in_([transaction_id for transaction_id, _ in tail])).update(
+        {WalletTransaction.settled_at: now}, synchronize_session=False
+    )
+    db.flush()
+    wallet_settlements.inc(len(tail))
+    return len(tail)
+
+# Portfele do rozliczenia: co najmniej `threshold` nierozliczonych transakcji albo najstarsza sprzed `max_age` sekund
+def wallets_to_settle(db, threshold=WALLET_SETTLE_THRESHOLD, max_age=WALLET_SETTLE_MAX_AGE, now=None):
+    cutoff = (now or datetime.now()) - timedelta(seconds=max_age)
+    return [wallet_id for (wallet_id,) in db.query(WalletTransaction.wallet_id).filter(
+        WalletTransaction.settled_at.is_(None)
+    ).group_by(WalletTransaction.wallet_id).having(or_(
+        func.count() >= threshold, func.min(WalletTransaction.created_at) <= cutoff
+    ))]
+
+# Rozlicza portfele w osobnych, krótkich transakcjach; zwraca liczbę rozliczonych transakcji
+def settle_wallets(session_factory, threshold=WALLET_SETTLE_THRESHOLD, max_age=WALLET_SETTLE_MAX_AGE):
+    db = session_factory()
+    try:
+        candidates = wallets_to_settle(db, threshold, max_age)
+        db.commit()
+        settled = 0
+        for wallet_id in candidates:
+            try:
+                settled += settle_wallet(db, wallet_id)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Error settling wallet {wallet_id}: {str(e)}")
+        return settled
+    finally:
+        db.close()
+
+
+class WalletSettler:
+    # Wątek rozliczający portfele co `interval` sekund
+    def __init__(self, session_factory, interval=WALLET_SETTLE_SECONDS):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                settled = settle_wallets(self.session_factory)
+                if settled:
+                    logger.info(f"Settled {settled} wallet transactions.")
+            except Exception as e:
+                logger.error(f"Wallet settlement error: {str(e)}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="wallet-settler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def start_settler(session_factory):
+    if WALLET_SETTLE_SECONDS <= 0:
+        return None
+    settler = WalletSettler(session_factory)
+    settler.start()
+    return settler
+
+
+if __name__ == "__main__":
+    # Rozliczenie wszystkich nierozliczonych transakcji: python -m app.wallets --all
+    from app.outbox import worker_session_factory
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--all", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    options = {"threshold": 1, "max_age": 0} if args.all else {}
+    settled = settle_wallets(worker_session_factory(), **options)
+    logger.info(f"Settled {settled} wallet transactions.")
@@ -0,0 +1,49 @@
+from app.cache import LRUCache
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+def test_load_finished_after_invalidation_is_not_cached():
+    cache = LRUCache()
+
+    def load():
+        cache.clear()  # np. zmiana rozkładu zatwierdzona w trakcie wczytywania
+        return "stale"
+
+    assert cache.get_or_load("key", load) == "stale"
+    assert cache.get("key") is None
+    assert cache.get_or_load("key", lambda: "fresh") == "fresh"
+    assert cache.get("key") == "fresh"
+
+def test_entries_are_evicted_by_tag():
+    cache = LRUCache()
+    cache.set("vehicles:1", ["a"], tags=["owner:1"])
+    cache.set("drivers:1", ["b"], tags=["owner:1"])
+    cache.set("vehicles:2", ["c"], tags=["owner:2"])
+
+    cache.invalidate_tags("owner:1")
+
+    assert cache.get("vehicles:1") is None
+    assert cache.get("drivers:1") is None
+    assert cache.get("vehicles:2") == ["c"]
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.cache.time.monotonic", lambda: now[0])
+    cache = LRUCache(ttl=60)
+    cache.set("key", "value")
+
+    now[0] += 59
+    assert cache.get("key") == "value"
+    now[0] += 2
+    assert cache.get("key") is None
+    assert len(cache) == 0
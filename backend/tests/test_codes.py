@@ -0,0 +1,18 @@
+from app.codes import CodeAllocator, FeistelPermutation
+
+
+def test_feistel_permutation_is_a_bijection():
+    permutation = FeistelPermutation(1000, key=b"test-key")
+    values = [permutation.permute(i) for i in range(1000)]
+    assert sorted(values) == list(range(1000))
+
+def test_allocator_codes_are_unique_and_well_formed():
+    allocator = CodeAllocator(width=9, minimum=100000000, key=b"test-key")
+    codes = [allocator.next_code() for _ in range(20000)]
+
+    assert len(set(codes)) == len(codes)
+    assert all(len(code) == 9 and 100000000 <= int(code) <= 999999999 for code in codes)
+
+def test_allocator_keeps_leading_zeros():
+    allocator = CodeAllocator(width=14, key=b"test-key")
+    assert all(len(allocator.next_code()) == 14 for _ in range(1000))
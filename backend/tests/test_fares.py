@@ -0,0 +1,37 @@
+import pytest
+
+from app.fares import FareTable, parse_size_factors
+
+ROWS = [
+    # relation_id, base_price, price_per_stop
+    (1, 10.0, 2.0),
+    (2, 5.0, 0.5),
+]
+
+def test_quote_batch_in_one_pass():
+    fares = FareTable(parse_size_factors("S=1,M=2,L=3"))
+    fares.load_rows(ROWS, full=True)
+
+    prices = fares.quote([1, 2, 1, 3], [2, 3, 1, 1], ["S", "S", "L", "M"])
+    # Relacja bez cennika nie ma ceny
+    assert prices == [14.0, 6.5, 36.0, None]
+    # Nieznany rozmiar wyceniany jak największy
+    assert fares.quote_one(2, 1, "XL") == 16.5
+
+def test_reload_relation_replaces_price_lists():
+    fares = FareTable()
+    fares.load_rows(ROWS, full=True)
+
+    # Usunięty cennik relacji 1, zmieniony relacji 2 i nowy relacji 3
+    fares.load_rows([(2, 7.0, 1.0), (3, 1.0, 1.0)], relation_ids={1, 2, 3})
+    assert fares.quote([1, 2, 3], [1, 1, 1], ["S", "S", "S"]) == [None, 8.0, 2.0]
+
+def test_zero_price_list_is_priced_not_missing():
+    fares = FareTable()
+    fares.load_rows([(1, 0.0, 0.0)], full=True)
+    assert fares.quote_one(1, 3, "L") == 0.0
+    assert fares.quote_one(2, 3, "L") is None
+
+def test_invalid_size_factor():
+    with pytest.raises(ValueError):
+        parse_size_factors("XXL=4")
@@ -0,0 +1,55 @@
+from ariadne import QueryType, graphql_sync, make_executable_schema
+from sqlalchemy import create_engine, text
+
+from app.instrumentation import (
+    RequestMetricsExtension, instrument_engine, request_db_queries, request_seconds, resolver_seconds, slow_queries,
+)
+
+engine = create_engine("sqlite://")
+instrument_engine(engine)
+
+query = QueryType()
+
+@query.field("stops")
+def resolve_stops(*_):
+    with engine.connect() as connection:
+        return [connection.execute(text(f"SELECT 'S{i}'")).scalar() for i in range(3)]
+
+schema = make_executable_schema("type Query { stops: [String!]! }", query)
+
+
+def test_request_counts_queries_per_operation():
+    _, resolved = resolver_seconds.value(field="Query.stops")
+    success, result = graphql_sync(
+        schema, {"query": "query Stops { stops }"}, context_value={}, extensions=[RequestMetricsExtension]
+    )
+
+    assert success and result["data"] == {"stops": ["S0", "S1", "S2"]}
+    assert resolver_seconds.value(field="Query.stops")[1] == resolved + 1
+    assert request_db_queries.value(operation="Stops") == (3, 1)
+
+def test_slow_queries_are_logged_with_operation(monkeypatch, caplog):
+    monkeypatch.setattr("app.instrumentation.SLOW_QUERY_SECONDS", 1e-9)
+    graphql_sync(schema, {"query": "query Panel { stops }"}, context_value={}, extensions=[RequestMetricsExtension])
+
+    assert slow_queries.value(operation="Panel") == 3
+    assert "operation Panel): SELECT 'S0'" in caplog.text
+
+def test_unknown_operation_name_is_not_a_label():
+    _, invalid = request_seconds.value(operation="invalid")
+    success, _ = graphql_sync(
+        schema, {"query": "query Stops { stops }", "operationName": 'x0"} 1\nfake_metric 1'},
+        context_value={}, extensions=[RequestMetricsExtension],
+    )
+
+    assert not success
+    assert request_seconds.value(operation="invalid")[1] == invalid + 1
+    assert not any("x0" in str(labels) for labels in request_seconds._values)
+
+def test_operation_labels_are_capped(monkeypatch):
+    monkeypatch.setattr("app.instrumentation.MAX_METRIC_OPERATIONS", 0)
+    monkeypatch.setattr("app.instrumentation.known_operations", set())
+    graphql_sync(schema, {"query": "query Extra { stops }"}, context_value={}, extensions=[RequestMetricsExtension])
+
+    assert request_seconds.value(operation="Extra") == (0.0, 0)
+    assert request_seconds.value(operation="other")[1] >= 1
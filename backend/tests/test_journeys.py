@@ -0,0 +1,71 @@
+from datetime import datetime
+
+from app.fares import FareTable
+from app.journeys import plan, same_day_earliest
+from app.route_index import RouteIndex
+
+
+def t(hour, minute=0):
+    return datetime(1970, 1, 1, hour, minute)
+
+ROWS = [
+    # relation_id, schedule_id, vehicle_id, stop, order_number, arrival_time, departure_time
+    (1, 10, 100, "A", 1, t(8), t(8)),
+    (1, 11, 100, "B", 2, t(9), t(9)),
+    (1, 12, 100, "C", 3, t(10), t(10)),
+    # Odjazd 20 minut po przyjeździe relacji 1 - za mało na przesiadkę
+    (2, 20, 200, "B", 1, t(9, 20), t(9, 20)),
+    (2, 21, 200, "D", 2, t(11), t(11)),
+    (3, 30, 300, "B", 1, t(9, 45), t(9, 45)),
+    (3, 31, 300, "D", 2, t(12), t(12)),
+    # Kurs bezpośredni - później, ale drożej
+    (4, 40, 400, "A", 1, t(8, 30), t(8, 30)),
+    (4, 41, 400, "D", 2, t(13), t(13)),
+]
+
+PRICES = [
+    # relation_id, base_price, price_per_stop
+    (1, 10.0, 2.0),
+    (2, 5.0, 1.0),
+    (3, 5.0, 1.0),
+    (4, 15.0, 0.0),
+]
+
+def network():
+    index = RouteIndex()
+    index.load_rows(ROWS, full=True)
+    fares = FareTable()
+    fares.load_rows(PRICES, full=True)
+    return index, fares
+
+def route(journey):
+    return [(leg.relation_id, leg.board.stop, leg.alight.stop) for leg in journey.legs]
+
+def test_transfer_and_direct_journeys_are_pareto_optimal():
+    index, fares = network()
+
+    journeys = plan(index, fares, "A", "D", "S", min_transfer=30)
+    assert [(journey.arrival, journey.price, route(journey)) for journey in journeys] == [
+        (12 * 60, 18.0, [(1, "A", "B"), (3, "B", "D")]),
+        (13 * 60, 15.0, [(4, "A", "D")]),
+    ]
+
+    # Krótsza przesiadka pozwala zdążyć na relację 2, która dominuje relację 3
+    journeys = plan(index, fares, "A", "D", "S", min_transfer=15)
+    assert [route(journey) for journey in journeys] == [[(1, "A", "B"), (2, "B", "D")], [(4, "A", "D")]]
+
+def test_transfer_limit_earliest_departure_and_exclusions():
+    index, fares = network()
+
+    assert [route(journey) for journey in plan(index, fares, "A", "D", "S", max_transfers=0)] == [[(4, "A", "D")]]
+    # Relacja 1 odjeżdża z A przed najwcześniejszym możliwym odjazdem
+    assert [route(journey) for journey in plan(index, fares, "A", "D", "S", earliest=8 * 60 + 10)] == [[(4, "A", "D")]]
+    assert [route(journey) for journey in plan(index, fares, "A", "D", "S", excluded={4})] == [[(1, "A", "B"), (3, "B", "D")]]
+    # Relacja bez cennika nie jest brana pod uwagę
+    fares.load_rows([], relation_ids={4})
+    assert [route(journey) for journey in plan(index, fares, "A", "D", "S", max_transfers=0)] == []
+
+def test_same_day_earliest_departure():
+    assert same_day_earliest(datetime(2026, 1, 1, 9, 15)) == 11 * 60 + 15
+    assert same_day_earliest(datetime(2026, 1, 1, 9, 15, 30)) == 11 * 60 + 16
+    assert same_day_earliest(datetime(2026, 1, 1, 22, 30)) is None
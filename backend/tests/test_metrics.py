@@ -0,0 +1,31 @@
+from app.metrics import Registry
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.histogram("wait_seconds", "Wait time", buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5.0)
+
+    text = registry.render()
+    assert 'wait_seconds_bucket{le="0.1"} 1' in text
+    assert 'wait_seconds_bucket{le="1.0"} 2' in text
+    assert 'wait_seconds_bucket{le="+Inf"} 3' in text
+    assert "wait_seconds_count 3" in text
+
+def test_counter_keeps_labels_apart():
+    registry = Registry()
+    counter = registry.counter("requests_total", "Requests")
+    counter.inc(operation="a")
+    counter.inc(2, operation="b")
+
+    assert counter.value(operation="a") == 1
+    assert counter.value(operation="b") == 2
+    assert registry.counter("requests_total", "Requests") is counter
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    registry.counter("requests_total", "Requests").inc(operation='a"} 1\nfake_metric 1\\')
+
+    assert registry.render().splitlines()[-1] == 'requests_total{operation="a\\"} 1\\nfake_metric 1\\\\"} 1'
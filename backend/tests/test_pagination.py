@@ -0,0 +1,16 @@
+import pytest
+
+from app.pagination import MAX_PAGE_SIZE, decode_cursor, encode_cursor, page_size
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(12345)) == 12345
+
+def test_invalid_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+def test_page_size_is_bounded():
+    assert page_size(MAX_PAGE_SIZE * 10) == MAX_PAGE_SIZE
+    with pytest.raises(ValueError):
+        page_size(0)
@@ -0,0 +1,31 @@
+import pytest
+
+from app.persisted_queries import PersistedQueryError, get_document, query_hash, resolve_persisted_query
+
+QUERY = "query Stops($prefix: String!) { searchStops(prefix: $prefix) }"
+
+
+def persisted(sha256_hash, **data):
+    return {**data, "extensions": {"persistedQuery": {"version": 1, "sha256Hash": sha256_hash}}}
+
+def test_same_query_text_is_parsed_once():
+    assert get_document(QUERY) is get_document(QUERY)
+
+def test_unknown_hash_requires_full_query():
+    with pytest.raises(PersistedQueryError) as error:
+        resolve_persisted_query(persisted("0" * 64, variables={"prefix": "kra"}))
+    assert error.value.code == "PERSISTED_QUERY_NOT_FOUND"
+
+def test_registered_hash_is_resolved_to_query_text():
+    sha256_hash = query_hash(QUERY)
+    _, registered = resolve_persisted_query(persisted(sha256_hash, query=QUERY))
+    data, document = resolve_persisted_query(persisted(sha256_hash, variables={"prefix": "kra"}))
+
+    assert data["query"] == QUERY
+    assert data["variables"] == {"prefix": "kra"}
+    assert document is registered
+
+def test_hash_must_match_query_text():
+    with pytest.raises(PersistedQueryError) as error:
+        resolve_persisted_query(persisted(query_hash(QUERY), query=QUERY + " "))
+    assert error.value.code == "PERSISTED_QUERY_HASH_MISMATCH"
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+
+from app.pubsub import Broker, InMemoryBackend
+
+
+async def next_message(subscription):
+    return await asyncio.wait_for(subscription.__anext__(), timeout=1)
+
+# Generator subskrypcji rejestruje się w brokerze dopiero po uruchomieniu
+async def subscribed(backend, channel, count=1):
+    while backend.subscriber_count(channel) < count:
+        await asyncio.sleep(0)
+
+def test_subscriber_receives_only_its_channel():
+    async def run():
+        broker = Broker(InMemoryBackend())
+        carrier = broker.subscribe("order_status:carrier_id:1")
+        other = broker.subscribe("order_status:carrier_id:2")
+        pending = asyncio.ensure_future(next_message(carrier))
+        other_pending = asyncio.ensure_future(next_message(other))
+        await subscribed(broker.backend, "order_status:carrier_id:1")
+        await subscribed(broker.backend, "order_status:carrier_id:2")
+
+        broker.publish("order_status:carrier_id:1", {"order_id": 5, "status": "Dostarczona"})
+        assert await pending == {"order_id": 5, "status": "Dostarczona"}
+        await asyncio.sleep(0.05)
+        assert not other_pending.done()
+        other_pending.cancel()
+        await carrier.aclose()
+
+    asyncio.run(run())
+
+def test_publish_from_another_thread():
+    async def run():
+        backend = InMemoryBackend()
+        subscription = backend.subscribe("interventions")
+        pending = asyncio.ensure_future(next_message(subscription))
+        await subscribed(backend, "interventions")
+
+        thread = threading.Thread(target=backend.publish, args=("interventions", {"problem_id": 1}))
+        thread.start()
+        thread.join()
+        assert await pending == {"problem_id": 1}
+        await subscription.aclose()
+        assert backend.subscriber_count("interventions") == 0
+
+    asyncio.run(run())
+
+def test_full_queue_drops_messages_without_blocking_publisher():
+    async def run():
+        backend = InMemoryBackend(queue_size=2)
+        subscription = backend.subscribe("order_status")
+        pending = asyncio.ensure_future(next_message(subscription))
+        await subscribed(backend, "order_status")
+
+        for order_id in range(5):
+            backend.publish("order_status", {"order_id": order_id})
+        assert await pending == {"order_id": 0}
+        await asyncio.sleep(0.05)
+        assert await next_message(subscription) == {"order_id": 1}
+        await subscription.aclose()
+
+    asyncio.run(run())
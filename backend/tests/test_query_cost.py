@@ -0,0 +1,59 @@
+from ariadne import load_schema_from_path
+from graphql import build_schema, parse, specified_rules, validate
+
+from app.pagination import MAX_PAGE_SIZE
+from app.query_cost import MAX_QUERY_COST, MAX_QUERY_DEPTH, QueryCostRule, analyze_document
+
+schema = build_schema(load_schema_from_path("app/schema.graphql"))
+
+
+def cost(query):
+    return analyze_document(schema, parse(query))
+
+def errors(query):
+    return [error.extensions["code"] for error in validate(schema, parse(query), specified_rules + (QueryCostRule,))]
+
+def test_list_multiplies_nested_fields():
+    # 10 (pole główne) + 1000 zamówień * (1 relacja + 1 lista przystanków + 20 przystanków * 1 pojazd)
+    assert cost("{ getAllOrders { order_id relation { schedules { vehicle { model } } } } }") == (10 + 1000 * 22, 5)
+
+def test_scalar_fields_are_free():
+    assert cost("{ getAllOrders { order_id status price } }") == (10, 2)
+
+def test_connection_uses_requested_page_size():
+    query = "query($first: Int) { getAllOrdersConnection(first: %s) { edges { node { user { email } } } } }"
+    # 10 (pole główne) + 1 (krawędzie) + strona * (1 zamówienie + 1 użytkownik)
+    assert cost(query % "10") == (10 + 1 + 10 * 2, 5)
+    # Zmienna może mieć dowolną wartość - liczona jest maksymalna strona
+    assert cost(query % "$first") == (10 + 1 + MAX_PAGE_SIZE * 2, 5)
+
+def test_fragments_are_expanded():
+    query = """
+        query { trackShipment(order_code: "X") { ...OrderRelation } }
+        fragment OrderRelation on Order { relation { schedules { vehicle { model } } } }
+    """
+    assert cost(query) == (10 + 1 + 1 + 20 * 1, 5)
+
+def test_small_query_passes_validation():
+    assert errors("{ getUserVehicles(owner_id: 1) { model owner { email } } }") == []
+
+def test_cyclic_query_over_budget_is_rejected():
+    query = "{ getAllOrders { relation { schedules { relation { schedules { stop } } } } } }"
+    assert cost(query)[0] > MAX_QUERY_COST
+    assert errors(query) == ["QUERY_TOO_COMPLEX"]
+
+def test_too_deep_query_is_rejected():
+    # Cykl User.wallet.user - każde powtórzenie dodaje dwa poziomy przy stałym, niskim koszcie
+    query = "{ trackShipment(order_code: \"X\") { user " + "{ wallet { user " * MAX_QUERY_DEPTH + "{ email }" + " } }" * MAX_QUERY_DEPTH + " } }"
+    assert cost(query)[1] > MAX_QUERY_DEPTH
+    assert "QUERY_TOO_DEEP" in errors(query)
+
+def test_repeated_fragments_are_analyzed_once():
+    # Każdy fragment używa poprzedniego dwa razy - po rozwinięciu 2^39 kopii F0; bez zapamiętywania
+    # kosztu fragmentów analiza takiego dokumentu nie skończyłaby się
+    fragments = ["fragment F0 on Order { relation { relation_id } }"] + [
+        f"fragment F{number} on Order {{ ...F{number - 1} ...F{number - 1} }}" for number in range(1, 40)
+    ]
+    query = "{ trackShipment(order_code: \"X\") { ...F39 } }\n" + "\n".join(fragments)
+    assert cost(query) == (10 + 2 ** 39, 3)
+    assert errors(query) == ["QUERY_TOO_COMPLEX"]
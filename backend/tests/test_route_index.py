@@ -0,0 +1,75 @@
+from datetime import datetime
+
+from app.data_versions import VersionedData
+from app.route_index import RouteIndex
+
+
+def t(hour, minute=0):
+    return datetime(1970, 1, 1, hour, minute)
+
+ROWS = [
+    # relation_id, schedule_id, vehicle_id, stop, order_number, arrival_time, departure_time
+    (1, 10, 100, "Kraków", 1, t(8), t(8, 5)),
+    (1, 11, 100, "Katowice", 2, t(9), t(9, 5)),
+    (1, 12, 100, "Wrocław", 3, t(11), t(11, 5)),
+    (2, 20, 200, "Wrocław", 1, t(7), t(7, 5)),
+    (2, 21, 200, "Kraków", 2, t(10), t(10, 5)),
+]
+
+def test_find_courses_respects_stop_order():
+    index = RouteIndex()
+    index.load_rows(ROWS, full=True)
+
+    courses = index.find_courses("Kraków", "Wrocław")
+    assert [(c.relation_id, c.start.schedule_id, c.end.schedule_id) for c in courses] == [(1, 10, 12)]
+
+    courses = index.find_courses("Wrocław", "Kraków")
+    assert [(c.relation_id, c.start.schedule_id, c.end.schedule_id) for c in courses] == [(2, 20, 21)]
+
+def test_reload_relation_replaces_inverted_index():
+    index = RouteIndex()
+    index.load_rows(ROWS, full=True)
+
+    # Relacja 1 zostaje skrócona do jednego przystanku
+    index.invalidate(1)
+    index.load_rows([(1, 10, 100, "Kraków", 1, t(8), t(8, 5))], relation_ids={1})
+
+    assert index.find_courses("Kraków", "Wrocław") == []
+    assert index.stops_at("Katowice") == []
+    assert index.stops_at("Wrocław") == [(2, 0)]
+
+def test_reload_removes_deleted_relation():
+    index = RouteIndex()
+    index.load_rows(ROWS, full=True)
+
+    index.load_rows([], relation_ids={2})
+
+    assert index.relation_stops(2) == []
+    assert index.stops_at("Kraków") == [(1, 0)]
+
+
+class StubVersion(VersionedData):
+    # Wersja w "bazie" ustawiana przez test
+    def __init__(self):
+        super().__init__("test", check_seconds=0)
+        self.value = 0
+
+    def read(self, db):
+        return self.value
+
+def test_version_change_from_other_process_resets_index():
+    version = StubVersion()
+    index = RouteIndex(version)
+    index.load_rows(ROWS, full=True)
+    assert version.check(None) is False
+
+    # Zmiana zatwierdzona przez ten proces - indeks unieważnił już zmienione relacje
+    version.value = 1
+    version.committed(1)
+    assert version.check(None) is False
+    assert index.stops_at("Wrocław") == [(1, 2), (2, 0)]
+
+    # Zmiana z innego procesu (np. import rozkładu z CLI)
+    version.value = 2
+    assert version.check(None) is True
+    assert index.stops_at("Wrocław") == []
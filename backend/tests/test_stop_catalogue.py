@@ -0,0 +1,30 @@
+from app.stop_catalogue import StopCatalogue
+
+
+def make_catalogue():
+    catalogue = StopCatalogue()
+    catalogue.load(["Kraków Dworzec", "Kraków Bronowice", "Łódź Kaliska", "Katowice", "Warszawa Centralna"])
+    return catalogue
+
+def test_search_matches_name_and_word_prefixes():
+    catalogue = make_catalogue()
+    assert catalogue.search("kra") == ["Kraków Bronowice", "Kraków Dworzec"]
+    assert catalogue.search("centr") == ["Warszawa Centralna"]
+    assert catalogue.search("ka") == ["Łódź Kaliska", "Katowice"]
+
+def test_search_ignores_case_and_polish_characters():
+    catalogue = make_catalogue()
+    assert catalogue.search("LODZ") == ["Łódź Kaliska"]
+    assert catalogue.search("krakow d") == ["Kraków Dworzec"]
+
+def test_search_respects_limit():
+    catalogue = make_catalogue()
+    assert len(catalogue.search("k", limit=2)) == 2
+    assert catalogue.search("  ") == []
+
+def test_load_started_before_invalidation_stays_stale():
+    catalogue = StopCatalogue()
+    catalogue.invalidate()
+    catalogue.load(["Katowice"], generation=0)
+    assert catalogue.search("kat") == ["Katowice"]
+    assert not catalogue._loaded
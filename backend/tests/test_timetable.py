@@ -0,0 +1,30 @@
+import io
+from datetime import datetime
+
+import pytest
+
+from app.timetable import parse_time, read_network_csv, schedule_rows
+
+HEADER = "registration_number,relation_name,stop_sequence,stop,arrival_time,departure_time\n"
+
+
+def test_network_csv_is_grouped_by_relation_and_sorted_by_sequence():
+    routes = read_network_csv(io.StringIO(
+        HEADER + "KR1,Poranna,2,Tarnów,09:00,09:05\nKR1,Poranna,1,Kraków,08:00,08:10\nKR2,Wieczorna,1,Rzeszów,18:00,18:05\n"
+    ))
+    assert [row["stop"] for row in routes[("KR1", "Poranna")]] == ["Kraków", "Tarnów"]
+    assert [row["stop"] for row in routes[("KR2", "Wieczorna")]] == ["Rzeszów"]
+
+def test_network_csv_requires_all_columns():
+    with pytest.raises(ValueError):
+        read_network_csv(io.StringIO("registration_number,stop\nKR1,Kraków\n"))
+
+def test_schedule_rows_are_numbered_consecutively():
+    stops = [{"stop": "A ", "arrival_time": "08:00", "departure_time": "08:05"}, {"stop": "B", "arrival_time": "09:00", "departure_time": "09:05"}]
+    rows = schedule_rows(1, 2, stops, 7)
+    assert [(row["stop"], row["order_number"]) for row in rows] == [("A", 7), ("B", 8)]
+    assert rows[0]["arrival_time"] == datetime(1970, 1, 1, 8, 0)
+
+def test_invalid_time_is_rejected():
+    with pytest.raises(ValueError):
+        parse_time("25:00")
@@ -1,10 +1,36 @@
-import { ApolloClient, InMemoryCache, createHttpLink } from '@apollo/client';
+import { ApolloClient, InMemoryCache, createHttpLink, split } from '@apollo/client';
 import { setContext } from '@apollo/client/link/context';
+import { createPersistedQueryLink } from '@apollo/client/link/persisted-queries';
+import { GraphQLWsLink } from '@apollo/client/link/subscriptions';
+import { getMainDefinition } from '@apollo/client/utilities';
+import { relayStylePagination } from '@apollo/client/utilities';
+import { createClient } from 'graphql-ws';
 
 const httpLink = createHttpLink({
   uri: 'http://localhost:8000/graphql',  // Upewnij się, że ten adres jest poprawny
 });
 
+// Skrót SHA-256 tekstu zapytania (Web Crypto API), wymagany przez zapytania utrwalone
+const sha256 = async (query) => {
+  const digest = await crypto.subtle.digest('SHA-256', new TextEncoder().encode(query));
+  return Array.from(new Uint8Array(digest)).map(byte => byte.toString(16).padStart(2, '0')).join('');
+};
+
+// Zapytania wysyłane są jako GET z samym skrótem; pełny tekst tylko przy pierwszym użyciu na serwerze.
+// Mutacje zawsze idą metodą POST.
+const persistedQueriesLink = createPersistedQueryLink({ sha256, useGETForHashedQueries: true });
+
+// Subskrypcje (zmiany statusów zamówień, interwencje) przez WebSocket, protokół graphql-transport-ws
+const wsLink = new GraphQLWsLink(createClient({
+  url: 'ws://localhost:8000/graphql/',
+  lazy: true,
+  retryAttempts: Infinity,
+  connectionParams: () => {
+    const token = localStorage.getItem('token');
+    return token ? { authorization: `Bearer ${token}` } : {};
+  },
+}));
+
 const authLink = setContext((_, { headers }) => {
   const token = localStorage.getItem('token');
   return {
@@ -16,8 +42,30 @@ const authLink = setContext((_, { headers }) => {
 });
 
 const client = new ApolloClient({
-  link: authLink.concat(httpLink),
-  cache: new InMemoryCache()
+  link: split(
+    ({ query }) => {
+      const definition = getMainDefinition(query);
+      return definition.kind === 'OperationDefinition' && definition.operation === 'subscription';
+    },
+    wsLink,
+    authLink.concat(persistedQueriesLink).concat(httpLink),
+  ),
+  cache: new InMemoryCache({
+    typePolicies: {
+      Query: {
+        fields: {
+          // Kolejne strony list (*Connection) są doklejane do już pobranych wyników
+          getAllOrdersConnection: relayStylePagination(),
+          getAllUsersConnection: relayStylePagination(),
+          getUserOrdersConnection: relayStylePagination(['user_id']),
+          getCarrierOrdersConnection: relayStylePagination(['owner_id']),
+          getDriverOrdersConnection: relayStylePagination(['driver_id']),
+          getUserShipmentProblemsConnection: relayStylePagination(['user_id']),
+          getInterventionOrdersConnection: relayStylePagination(),
+        },
+      },
+    },
+  })
 });
 
 export default client;
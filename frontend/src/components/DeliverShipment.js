@@ -1,7 +1,8 @@
-import React, { useState } from 'react';
+import React, { useState, useEffect } from 'react';
 import { useMutation, useQuery, gql } from '@apollo/client';
 import { Form, Button, Alert, Card, Container } from 'react-bootstrap';
 import styled from 'styled-components';
+import { ORDER_STATUS_CHANGED, updateDriverOrders } from '../orderEvents';
 
 const DELIVER_SHIPMENT = gql`
   mutation DeliverShipment($order_code: String!, $delivery_code: String!) {
@@ -38,13 +39,18 @@ const DeliverShipment = () => {
   const [deliveryCodeError, setDeliveryCodeError] = useState('');
   const driver_id = parseInt(localStorage.getItem('user_id'));
 
-  const { data, loading, error } = useQuery(GET_DRIVER_ORDERS, {
+  const { data, loading, error, subscribeToMore } = useQuery(GET_DRIVER_ORDERS, {
     variables: { driver_id },
   });
 
-  const [deliverShipment, { data: deliverData, loading: deliverLoading, error: deliverError }] = useMutation(DELIVER_SHIPMENT, {
-    refetchQueries: [{ query: GET_DRIVER_ORDERS, variables: { driver_id } }],
-  });
+  // Zmiany statusów zamówień kierowcy przychodzą subskrypcją - lista nie jest pobierana ponownie
+  useEffect(() => subscribeToMore({
+    document: ORDER_STATUS_CHANGED,
+    variables: { driver_id },
+    updateQuery: updateDriverOrders(driver_id),
+  }), [subscribeToMore, driver_id]);
+
+  const [deliverShipment, { data: deliverData, loading: deliverLoading, error: deliverError }] = useMutation(DELIVER_SHIPMENT);
 
   const handleDeliveryCodeChange = (e) => {
     const value = e.target.value;
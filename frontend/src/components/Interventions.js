@@ -1,7 +1,8 @@
 import React from 'react';
-import { useQuery, useMutation, gql } from '@apollo/client';
+import { useQuery, useMutation, useSubscription, gql } from '@apollo/client';
 import { Table, Card, Button } from 'react-bootstrap';
 import styled from 'styled-components';
+import { INTERVENTION_REPORTED } from '../orderEvents';
 
 // GraphQL Query
 const GET_INTERVENTION_ORDERS = gql`
@@ -83,7 +84,9 @@ const ActionButton = styled(Button)`
 `;
 
 const InterventionOrders = () => {
-  const { loading, error, data } = useQuery(GET_INTERVENTION_ORDERS);
+  const { loading, error, data, refetch } = useQuery(GET_INTERVENTION_ORDERS);
+  // Nowe zgłoszenie problemu - lista (z danymi kontaktowymi klienta i przewoźnika) pobierana jest tylko wtedy
+  useSubscription(INTERVENTION_REPORTED, { onData: () => refetch() });
   const [deleteShipmentProblem] = useMutation(DELETE_SHIPMENT_PROBLEM, {
     refetchQueries: [{ query: GET_INTERVENTION_ORDERS }],
     onError: (err) => {
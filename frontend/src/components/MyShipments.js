@@ -3,6 +3,7 @@ import { useQuery, useMutation, gql } from '@apollo/client';
 import { Table, Alert, Button, Form, Modal, Offcanvas } from 'react-bootstrap';
 import styled from 'styled-components';
 import { FaChevronDown, FaChevronUp } from 'react-icons/fa';
+import { ORDER_STATUS_CHANGED, isMissingFrom, updateOrderList } from '../orderEvents';
 
 const GET_USER_ORDERS = gql`
   query GetUserOrders($user_id: Int!) {
@@ -115,10 +116,8 @@ const ClickableRow = styled.tr`
 
 const MyShipments = () => {
   const user_id = parseInt(localStorage.getItem('user_id'));
-  const { data, loading, error, refetch } = useQuery(GET_USER_ORDERS, { variables: { user_id } });
-  const [addShipmentProblem] = useMutation(ADD_SHIPMENT_PROBLEM, {
-    refetchQueries: [{ query: GET_USER_ORDERS, variables: { user_id } }],
-  });
+  const { data, loading, error, refetch, subscribeToMore } = useQuery(GET_USER_ORDERS, { variables: { user_id } });
+  const [addShipmentProblem] = useMutation(ADD_SHIPMENT_PROBLEM);
   const [removeOrderFromUserHistory] = useMutation(REMOVE_ORDER_FROM_USER_HISTORY, {
     refetchQueries: [{ query: GET_USER_ORDERS, variables: { user_id } }],
   });
@@ -178,9 +177,20 @@ const MyShipments = () => {
     setExpandedRows(newExpandedRows);
   };
 
-  useEffect(() => {
-    refetch();
-  }, [data, refetch]);
+  // Zmiany statusów przesyłek przychodzą subskrypcją zamiast ponownego pobierania listy.
+  // Przypisanie kierowcy generuje nowe kody nadania i odbioru, których zdarzenie nie zawiera - wtedy lista jest pobierana.
+  useEffect(() => subscribeToMore({
+    document: ORDER_STATUS_CHANGED,
+    variables: { user_id },
+    updateQuery: (prev, options) => {
+      const event = options.subscriptionData.data.orderStatusChanged;
+      if (event.status === 'Przypisano kierowcę' || isMissingFrom(prev.getUserOrders, event)) {
+        refetch();
+        return prev;
+      }
+      return updateOrderList('getUserOrders')(prev, options);
+    },
+  }), [subscribeToMore, refetch, user_id]);
 
   if (loading) return <p>Loading...</p>;
   if (error) return <Alert variant="danger">Error loading shipments: {error.message}</Alert>;
@@ -4,28 +4,40 @@ import { Table, Form, Card, Button, Alert } from 'react-bootstrap';
 import styled from 'styled-components';
 
 // GraphQL Queries i Mutacje
+// Zamówienia pobierane stronami (kursor `after`), kolejne strony doładowuje przycisk "Załaduj więcej"
+const ORDERS_PAGE_SIZE = 50;
+
 const GET_ALL_ORDERS = gql`
-  query GetAllOrders {
-  getAllOrders {
-    order_id
-    order_code
-    status
-    pickup_code
-    delivery_code
-    deleted_by_user
-    deleted_by_carrier
-    user {
-      first_name
-      last_name
-      email
-    }
-    relation {
-      vehicle {
-        owner {
+  query GetAllOrders($first: Int, $after: String) {
+  getAllOrdersConnection(first: $first, after: $after) {
+    edges {
+      cursor
+      node {
+        order_id
+        order_code
+        status
+        pickup_code
+        delivery_code
+        deleted_by_user
+        deleted_by_carrier
+        user {
+          first_name
+          last_name
           email
         }
+        relation {
+          vehicle {
+            owner {
+              email
+            }
+          }
+        }
       }
     }
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
   }
 }
 `;
@@ -138,9 +150,11 @@ const StatusColumn = styled.td`
 `;
 
 const OrderStatusManagement = () => {
-  const { loading, error, data, refetch } = useQuery(GET_ALL_ORDERS);
+  const { loading, error, data, fetchMore } = useQuery(GET_ALL_ORDERS, {
+    variables: { first: ORDERS_PAGE_SIZE },
+  });
   const [updateOrderDetails] = useMutation(UPDATE_ORDER_DETAILS, {
-    refetchQueries: [{ query: GET_ALL_ORDERS }],
+    refetchQueries: ['GetAllOrders'],
     onCompleted: () => {
       alert('Zamówienie zostało zaktualizowane');
     },
@@ -151,7 +165,7 @@ const OrderStatusManagement = () => {
   });
 
   const [deleteOrder] = useMutation(DELETE_ORDER, {
-    refetchQueries: [{ query: GET_ALL_ORDERS }],
+    refetchQueries: ['GetAllOrders'],
     onCompleted: () => {
       alert('Zamówienie zostało usunięte');
     },
@@ -216,9 +230,17 @@ const OrderStatusManagement = () => {
     }
   };
 
+  const handleLoadMore = () => {
+    fetchMore({
+      variables: { after: data.getAllOrdersConnection.pageInfo.endCursor },
+    });
+  };
+
   if (loading) return <p>Loading...</p>;
   if (error) return <Alert variant="danger">Error loading orders: {error.message}</Alert>;
 
+  const orders = data.getAllOrdersConnection.edges.map((edge) => edge.node);
+
   return (
     <TableCardStyled>
       <h2>Zarządzanie szczegółami zamówień</h2>
@@ -239,7 +261,7 @@ const OrderStatusManagement = () => {
             </tr>
           </thead>
           <tbody>
-            {data.getAllOrders.map((order) => (
+            {orders.map((order) => (
               <tr key={order.order_id}>
                 <td>{order.order_code}</td>
                 <td>{`${order.user.first_name} ${order.user.last_name}`}</td>
@@ -320,6 +342,11 @@ const OrderStatusManagement = () => {
           </tbody>
         </Table>
       </div>
+      {data.getAllOrdersConnection.pageInfo.hasNextPage && (
+        <Button variant="secondary" onClick={handleLoadMore}>
+          Załaduj więcej
+        </Button>
+      )}
     </TableCardStyled>
   );
 };
@@ -1,8 +1,9 @@
-import React, { useState } from 'react';
+import React, { useState, useEffect } from 'react';
 import { useQuery, useMutation, gql } from '@apollo/client';
 import { Table, Button, Form, Card, Offcanvas, Modal } from 'react-bootstrap';
 import { FaChevronDown, FaChevronUp } from 'react-icons/fa';
 import styled, { createGlobalStyle } from 'styled-components';
+import { ORDER_STATUS_CHANGED, isMissingFrom, updateOrderList } from '../orderEvents';
 
 // Zapytania i mutacje GraphQL
 const GET_CARRIER_ORDERS = gql`
@@ -164,20 +165,30 @@ const OffcanvasStyled = styled(Offcanvas)`
 const Orders = () => {
   const owner_id = parseInt(localStorage.getItem('user_id'));
 
-  const { data: orderData, loading: orderLoading, error: orderError, refetch: refetchOrders } = useQuery(GET_CARRIER_ORDERS, { variables: { owner_id } });
+  const { data: orderData, loading: orderLoading, error: orderError, refetch: refetchOrders, subscribeToMore } = useQuery(GET_CARRIER_ORDERS, { variables: { owner_id } });
   const { data: driverData, loading: driverLoading, error: driverError, refetch: refetchDrivers } = useQuery(GET_CARRIER_DRIVERS, { variables: { owner_id } });
 
-  const [assignDriverToOrder] = useMutation(ASSIGN_DRIVER_TO_ORDER, {
-    refetchQueries: [{ query: GET_CARRIER_ORDERS, variables: { owner_id } }, { query: GET_CARRIER_DRIVERS, variables: { owner_id } }],
-  });
+  // Zmiany statusów (przypisanie kierowcy, odbiór, doręczenie, interwencja) nakładane są na listę;
+  // pełna lista pobierana jest tylko dla zamówienia, którego jeszcze na niej nie ma
+  useEffect(() => subscribeToMore({
+    document: ORDER_STATUS_CHANGED,
+    variables: { carrier_id: owner_id },
+    updateQuery: (prev, options) => {
+      if (isMissingFrom(prev.getCarrierOrders, options.subscriptionData.data.orderStatusChanged)) {
+        refetchOrders();
+        return prev;
+      }
+      return updateOrderList('getCarrierOrders')(prev, options);
+    },
+  }), [subscribeToMore, refetchOrders, owner_id]);
+
+  const [assignDriverToOrder] = useMutation(ASSIGN_DRIVER_TO_ORDER);
 
   const [removeOrderFromCarrierHistory] = useMutation(REMOVE_ORDER_FROM_CARRIER_HISTORY, {
     refetchQueries: [{ query: GET_CARRIER_ORDERS, variables: { owner_id } }],
   });
 
-  const [addShipmentProblem] = useMutation(ADD_SHIPMENT_PROBLEM, {
-    refetchQueries: [{ query: GET_CARRIER_ORDERS, variables: { owner_id } }],
-  });
+  const [addShipmentProblem] = useMutation(ADD_SHIPMENT_PROBLEM);
 
   const [selectedOrder, setSelectedOrder] = useState(null);
   const [selectedDriver, setSelectedDriver] = useState('');
@@ -1,12 +1,15 @@
-import React, { useState, useEffect } from 'react';
-import { useQuery, gql, useMutation } from '@apollo/client';
+import React, { useState, useEffect, useRef } from 'react';
+import { useQuery, useLazyQuery, gql, useMutation } from '@apollo/client';
 import { Form, Button, Alert, Container, Offcanvas, Table } from 'react-bootstrap';
 import styled from 'styled-components';
 
 // GraphQL Queries and Mutations
-const GET_ALL_STOPS = gql`
-  query GetAllStops {
-    getAllStops
+// Podpowiedzi przystanków wyszukiwane po stronie serwera (katalog przystanków w pamięci)
+const STOP_SUGGESTIONS_LIMIT = 10;
+
+const SEARCH_STOPS = gql`
+  query SearchStops($prefix: String!, $limit: Int) {
+    searchStops(prefix: $prefix, limit: $limit)
   }
 `;
 
@@ -92,9 +95,9 @@ const DELETE_ALL_SCHEDULES = gql`
   }
 `;
 
-const UPDATE_SCHEDULE_ORDER = gql`
-  mutation UpdateScheduleOrder($schedule_id: Int!, $new_order_number: Int!) {
-    updateScheduleOrder(schedule_id: $schedule_id, new_order_number: $new_order_number) {
+const REORDER_SCHEDULES = gql`
+  mutation ReorderSchedules($relation_id: Int!, $schedule_ids: [Int!]!) {
+    reorderSchedules(relation_id: $relation_id, schedule_ids: $schedule_ids) {
       schedule_id
       order_number
     }
@@ -287,7 +290,10 @@ const Schedule = () => {
   const [filteredStops, setFilteredStops] = useState([]); // Filtered stops for new stop
   const [filteredEditStops, setFilteredEditStops] = useState([]); // Filtered stops for edit stop
 
-  const { data: allStopsData } = useQuery(GET_ALL_STOPS);
+  const [searchStops] = useLazyQuery(SEARCH_STOPS, { fetchPolicy: 'network-only' });
+  // Ostatnio wpisane prefiksy - odpowiedzi dla starszych prefiksów (wolniejsze) są pomijane
+  const newStopPrefix = useRef('');
+  const editStopPrefix = useRef('');
   const { data: vehiclesData, loading: vehiclesLoading, error: vehiclesError } = useQuery(GET_USER_VEHICLES, { variables: { owner_id } });
   const { data: relationsData, refetch: refetchRelations } = useQuery(GET_VEHICLE_RELATIONS, { variables: { vehicle_id: parseInt(vehicle_id) }, skip: !vehicle_id });
   const { data: schedulesData, loading: schedulesLoading, error: schedulesError, refetch } = useQuery(GET_VEHICLE_SCHEDULES, { 
@@ -324,7 +330,7 @@ const Schedule = () => {
     refetchQueries: [{ query: GET_VEHICLE_SCHEDULES, variables: { vehicle_id: parseInt(vehicle_id, 10), relation_id: parseInt(relation_id, 10) } }],
   });
 
-  const [updateScheduleOrder] = useMutation(UPDATE_SCHEDULE_ORDER, {
+  const [reorderSchedules] = useMutation(REORDER_SCHEDULES, {
     refetchQueries: [{ query: GET_VEHICLE_SCHEDULES, variables: { vehicle_id: parseInt(vehicle_id, 10), relation_id: parseInt(relation_id, 10) } }],
   });
 
@@ -368,29 +374,29 @@ const Schedule = () => {
     setRelationName('');
   };
 
-  const handleNewStopChange = (e) => {
+  const handleNewStopChange = async (e) => {
     const value = e.target.value;
     setNewStop(value);
+    newStopPrefix.current = value;
 
-    if (value.length > 0 && allStopsData) {
-      const filtered = allStopsData.getAllStops.filter((stop) =>
-        stop.toLowerCase().includes(value.toLowerCase())
-      );
-      setFilteredStops(filtered);
+    if (value.length > 0) {
+      const { data } = await searchStops({ variables: { prefix: value, limit: STOP_SUGGESTIONS_LIMIT } });
+      if (newStopPrefix.current !== value) return;
+      setFilteredStops(data ? data.searchStops : []);
     } else {
       setFilteredStops([]);
     }
   };
 
-  const handleEditStopChange = (e) => {
+  const handleEditStopChange = async (e) => {
     const value = e.target.value;
     setEditStop(value);
+    editStopPrefix.current = value;
 
-    if (value.length > 0 && allStopsData) {
-      const filtered = allStopsData.getAllStops.filter((stop) =>
-        stop.toLowerCase().includes(value.toLowerCase())
-      );
-      setFilteredEditStops(filtered);
+    if (value.length > 0) {
+      const { data } = await searchStops({ variables: { prefix: value, limit: STOP_SUGGESTIONS_LIMIT } });
+      if (editStopPrefix.current !== value) return;
+      setFilteredEditStops(data ? data.searchStops : []);
     } else {
       setFilteredEditStops([]);
     }
@@ -555,19 +561,16 @@ const Schedule = () => {
         return;
       }
 
-      await Promise.all(
-        schedulesData.getVehicleSchedules.map(schedule => {
-          if (schedule.order_number !== orderNumbers[schedule.schedule_id]) {
-            return updateScheduleOrder({
-              variables: {
-                schedule_id: parseInt(schedule.schedule_id, 10),
-                new_order_number: parseInt(orderNumbers[schedule.schedule_id], 10),
-              },
-            });
-          }
-          return null;
-        })
-      );
+      // Cała nowa kolejność zapisywana jednym zapytaniem
+      const scheduleIds = [...schedulesData.getVehicleSchedules]
+        .sort((a, b) => orderNumbers[a.schedule_id] - orderNumbers[b.schedule_id])
+        .map(schedule => parseInt(schedule.schedule_id, 10));
+      await reorderSchedules({
+        variables: {
+          relation_id: parseInt(relation_id, 10),
+          schedule_ids: scheduleIds,
+        },
+      });
 
       setIsEditingOrder(false);
     } catch (error) {
@@ -787,6 +790,7 @@ const Schedule = () => {
                                       onClick={() => {
                                         setEditStop(stop);
                                         setFilteredEditStops([]);
+                                        editStopPrefix.current = stop;
                                       }}
                                       className="autocomplete-item"
                                     >
@@ -863,6 +867,7 @@ const Schedule = () => {
                                 onClick={() => {
                                   setNewStop(stop);
                                   setFilteredStops([]);
+                                  newStopPrefix.current = stop;
                                 }}
                                 className="autocomplete-item"
                               >
@@ -1,13 +1,16 @@
-import React, { useState, useEffect } from 'react';
-import { useMutation, useQuery, gql } from '@apollo/client';
+import React, { useState, useEffect, useRef } from 'react';
+import { useMutation, useQuery, useLazyQuery, gql } from '@apollo/client';
 import { Form, Button, Alert } from 'react-bootstrap';
 import client from '../ApolloClient';
 import styled from 'styled-components';
 
 // GraphQL Queries
-const GET_ALL_STOPS = gql`
-  query GetAllStops {
-    getAllStops
+// Podpowiedzi przystanków wyszukiwane po stronie serwera (katalog przystanków w pamięci)
+const STOP_SUGGESTIONS_LIMIT = 10;
+
+const SEARCH_STOPS = gql`
+  query SearchStops($prefix: String!, $limit: Int) {
+    searchStops(prefix: $prefix, limit: $limit)
   }
 `;
 
@@ -36,9 +39,20 @@ const GET_AVAILABLE_COURSES = gql`
   }
 `;
 
+// Ceny kursów dla innego rozmiaru przesyłki - jedno zapytanie dla wszystkich kursów z listy
+const QUOTE_FARES = gql`
+  query QuoteFares($requests: [FareQuoteInput!]!) {
+    quoteFares(requests: $requests) {
+      relation_id
+      price
+    }
+  }
+`;
+
+// Cenę zamówienia wylicza serwer (ta sama taryfa co w getAvailableCourses i quoteFares)
 const CREATE_ORDER = gql`
-  mutation CreateOrder($user_id: Int!, $relation_id: Int!, $size: String!, $start_stop: String!, $end_stop: String!, $price: Float!, $today_delivery: Boolean!) {
-    createOrder(user_id: $user_id, relation_id: $relation_id, size: $size, start_stop: $start_stop, end_stop: $end_stop, price: $price, today_delivery: $today_delivery) {
+  mutation CreateOrder($user_id: Int!, $relation_id: Int!, $size: String!, $start_stop: String!, $end_stop: String!, $today_delivery: Boolean!) {
+    createOrder(user_id: $user_id, relation_id: $relation_id, size: $size, start_stop: $start_stop, end_stop: $end_stop, today_delivery: $today_delivery) {
       order_id
       status
       order_code
@@ -108,12 +122,13 @@ const ShipmentForm = ({ user_id, onShipmentCreated }) => {
   const [selectedCourse, setSelectedCourse] = useState('');
   const [coursesLoading, setCoursesLoading] = useState(false);
   const [coursesError, setCoursesError] = useState(null);
-  const [totalPrice, setTotalPrice] = useState(0);
   const [todayDelivery, setTodayDelivery] = useState(true);
   const [noCoursesFound, setNoCoursesFound] = useState(false);
   const [formIncomplete, setFormIncomplete] = useState(false);
 
-  const { data: allStopsData, refetch: refetchAllStops } = useQuery(GET_ALL_STOPS);
+  const [searchStops] = useLazyQuery(SEARCH_STOPS);
+  // Ostatnio wpisany prefiks - odpowiedzi dla starszych prefiksów (wolniejsze) są pomijane
+  const startStopPrefix = useRef('');
   const { data: availableStopsData, refetch: refetchAvailableStops } = useQuery(GET_AVAILABLE_STOPS, {
     variables: { startStop },
     skip: !startStop,
@@ -121,12 +136,10 @@ const ShipmentForm = ({ user_id, onShipmentCreated }) => {
 
   const [createOrder, { loading: createLoading, error: createError }] = useMutation(CREATE_ORDER, {
     refetchQueries: [
-      { query: GET_ALL_STOPS },
       { query: GET_AVAILABLE_STOPS, variables: { startStop } },
       { query: GET_AVAILABLE_COURSES, variables: { startStop, endStop, size, todayDelivery } },
     ],
     onCompleted: () => {
-      refetchAllStops();
       refetchAvailableStops();
       setStartStop('');
       setEndStop('');
@@ -146,14 +159,14 @@ const ShipmentForm = ({ user_id, onShipmentCreated }) => {
     }
   }, [availableStopsData]);
 
-  const handleStartStopChange = (e) => {
+  const handleStartStopChange = async (e) => {
     const value = e.target.value;
     setStartStop(value);
-    if (value.length > 0 && allStopsData) {
-      const filtered = allStopsData.getAllStops.filter((stop) =>
-        stop.toLowerCase().includes(value.toLowerCase())
-      );
-      setFilteredStops(filtered);
+    startStopPrefix.current = value;
+    if (value.length > 0) {
+      const { data } = await searchStops({ variables: { prefix: value, limit: STOP_SUGGESTIONS_LIMIT } });
+      if (startStopPrefix.current !== value) return;
+      setFilteredStops(data ? data.searchStops : []);
     } else {
       setFilteredStops([]);
     }
@@ -190,7 +203,7 @@ const ShipmentForm = ({ user_id, onShipmentCreated }) => {
       if (data.getAvailableCourses.length === 0) {
         setNoCoursesFound(true);
       } else {
-        const validCourses = data.getAvailableCourses.filter(course => course.total_price > 0);
+        const validCourses = data.getAvailableCourses.filter(course => calculateFinalPrice(course.total_price) !== null);
         
         if (validCourses.length === 0) {
           alert('Brak dostępnych kursów z poprawną ceną.');
@@ -206,20 +219,16 @@ const ShipmentForm = ({ user_id, onShipmentCreated }) => {
     }
   };
   
-  const calculateFinalPrice = (basePrice) => {
-    // Upewnij się, że basePrice jest liczbą
-    let finalPrice = parseFloat(basePrice);
-  
-    if (isNaN(finalPrice) || finalPrice <= 0) {
-      console.error('Invalid base price:', basePrice);
-      return null; // Zwróć null, jeśli basePrice jest nieprawidłowa
+  const calculateFinalPrice = (coursePrice) => {
+    // Cena kursu zawiera już dopłatę za rozmiar przesyłki (liczoną na serwerze).
+    // null - relacja nie ma cennika; 0 to poprawna cena (cennik z zerowymi stawkami)
+    if (coursePrice === null || coursePrice === undefined) {
+      return null;
     }
+    let finalPrice = parseFloat(coursePrice);
   
-    // Zwiększ cenę w zależności od rozmiaru przesyłki
-    if (size === 'M') {
-      finalPrice *= 2;
-    } else if (size === 'L') {
-      finalPrice *= 3;
+    if (isNaN(finalPrice) || finalPrice < 0) {
+      return null; // Zwróć null, jeśli cena jest nieprawidłowa
     }
   
     return finalPrice.toFixed(2); // Zwróć cenę jako string z dwoma miejscami po przecinku
@@ -235,38 +244,53 @@ const ShipmentForm = ({ user_id, onShipmentCreated }) => {
       console.log('Selected course data:', selectedCourseData);  // Debuguj wybrany kurs
   
       // Sprawdź, czy total_price jest poprawną liczbą
-      if (isNaN(selectedCourseData.total_price) || selectedCourseData.total_price <= 0) {
+      if (calculateFinalPrice(selectedCourseData.total_price) === null) {
         alert('Wybrany kurs ma nieprawidłową cenę.');
-        setTotalPrice(null);
-      } else {
-        const finalPrice = calculateFinalPrice(selectedCourseData.total_price);
-        console.log('Final price:', finalPrice);  // Debuguj ostateczną cenę
-        setTotalPrice(finalPrice);
       }
     } else {
       console.error(`No course found for selected ID: ${selectedCourseId}`);
     }
   };
   
-  const handleSizeChange = (e) => {
-    setSize(e.target.value);
+  const handleSizeChange = async (e) => {
+    const newSize = e.target.value;
+    setSize(newSize);
+    if (!newSize || availableCourses.length === 0) return;
+
+    // Nowe ceny wszystkich pobranych kursów jednym zapytaniem quoteFares
+    setCoursesError(null);
+    let data;
+    try {
+      ({ data } = await client.query({
+        query: QUOTE_FARES,
+        variables: {
+          requests: availableCourses.map(course => ({
+            relation_id: course.relation_id,
+            start_stop: course.start_stop,
+            end_stop: course.end_stop,
+            size: newSize,
+          })),
+        },
+      }));
+    } catch (error) {
+      // Ceny dla poprzedniego rozmiaru są już nieaktualne - lista kursów do ponownego pobrania
+      setCoursesError(error);
+      setAvailableCourses([]);
+      setSelectedCourse('');
+      return;
+    }
+    // Kursy, których nie da się już wycenić (np. usunięty cennik), znikają z listy
+    const quotedCourses = availableCourses
+      .map((course, i) => ({ ...course, total_price: data.quoteFares[i].price }))
+      .filter(course => calculateFinalPrice(course.total_price) !== null);
+    setAvailableCourses(quotedCourses);
+    setNoCoursesFound(quotedCourses.length === 0);
   
     if (selectedCourse) {
-      const selectedCourseData = selectedCourse;  // Teraz selectedCourse zawiera cały obiekt
-  
-      if (selectedCourseData) {
-        // Sprawdź, czy total_price jest liczbą
-        if (isNaN(selectedCourseData.total_price) || selectedCourseData.total_price <= 0) {
-          console.error('Invalid total price:', selectedCourseData.total_price);
-          alert('Cena kursu jest nieprawidłowa. Wybierz inny kurs.');
-          setTotalPrice(null);
-          return;
-        }
-  
-        // Oblicz ostateczną cenę, jeśli total_price jest poprawny
-        const finalPrice = calculateFinalPrice(selectedCourseData.total_price);
-        console.log('Updated final price on size change:', finalPrice);  // Logowanie ceny po zmianie rozmiaru
-        setTotalPrice(finalPrice);
+      const selectedCourseData = quotedCourses.find(course => course.schedule_id === selectedCourse.schedule_id);
+      setSelectedCourse(selectedCourseData || '');
+      if (!selectedCourseData) {
+        alert('Wybrany kurs nie jest już dostępny. Wybierz inny kurs.');
       }
     }
   };
@@ -297,7 +321,6 @@ const ShipmentForm = ({ user_id, onShipmentCreated }) => {
           size,
           start_stop: startStop,
           end_stop: endStop,
-          price: parseFloat(totalPrice),
           today_delivery: todayDelivery,
         },
       });
@@ -333,6 +356,7 @@ const ShipmentForm = ({ user_id, onShipmentCreated }) => {
                   onClick={() => {
                     setStartStop(stop);
                     setFilteredStops([]);
+                    startStopPrefix.current = stop;
                   }}
                   className="autocomplete-item"
                 >
@@ -0,0 +1,81 @@
+import { gql } from '@apollo/client';
+
+// Subskrypcja zmian statusów zamówień - serwer wysyła tylko zmienione pola zamówienia
+export const ORDER_STATUS_CHANGED = gql`
+  subscription OrderStatusChanged($user_id: Int, $carrier_id: Int, $driver_id: Int) {
+    orderStatusChanged(user_id: $user_id, carrier_id: $carrier_id, driver_id: $driver_id) {
+      order_id
+      order_code
+      status
+      changed_at
+      user_id
+      carrier_id
+      driver_id
+      driver_first_name
+      driver_last_name
+    }
+  }
+`;
+
+export const INTERVENTION_REPORTED = gql`
+  subscription InterventionReported($carrier_id: Int) {
+    interventionReported(carrier_id: $carrier_id) {
+      problem_id
+      order_id
+      order_code
+      description
+      created_at
+    }
+  }
+`;
+
+// Nakłada zmianę statusu na zamówienie z listy; uzupełnia tylko pola obecne w zapytaniu listy
+export const applyOrderStatusEvent = (order, event) => {
+  const updated = { ...order, status: event.status };
+  if ('status_history' in order) {
+    updated.status_history = [
+      ...order.status_history,
+      { __typename: 'OrderStatusHistory', status: event.status, changed_at: event.changed_at },
+    ];
+  }
+  if ('driver' in order) {
+    updated.driver = event.driver_id === null ? null : {
+      ...order.driver,
+      __typename: 'Driver',
+      driver_id: String(event.driver_id),
+      first_name: event.driver_first_name,
+      last_name: event.driver_last_name,
+    };
+  }
+  return updated;
+};
+
+// `updateQuery` dla subscribeToMore: aktualizuje zamówienie z listy `field` na miejscu.
+// `keep(event)` decyduje, czy zamówienie zostaje na liście (np. lista kierowcy tylko z aktywnymi).
+export const updateOrderList = (field, keep = () => true) => (prev, { subscriptionData }) => {
+  const event = subscriptionData.data && subscriptionData.data.orderStatusChanged;
+  if (!event || !prev[field]) return prev;
+  const orders = prev[field]
+    .filter(order => order.order_id !== event.order_id || keep(event))
+    .map(order => (order.order_id === event.order_id ? applyOrderStatusEvent(order, event) : order));
+  return { ...prev, [field]: orders };
+};
+
+// Czy zamówienia ze zdarzenia nie ma na liście - wtedy brakuje jego pełnych danych i listę trzeba pobrać
+export const isMissingFrom = (orders, event) => !orders || !orders.some(order => order.order_id === event.order_id);
+
+// Lista zamówień kierowcy (getDriverOrders) zawiera tylko zamówienia przypisane i odebrane od klienta
+const DRIVER_ACTIVE_STATUSES = ['Przypisano kierowcę', 'Przyjęta od klienta'];
+
+export const updateDriverOrders = (driver_id) => (prev, { subscriptionData }) => {
+  const event = subscriptionData.data && subscriptionData.data.orderStatusChanged;
+  if (!event || !prev.getDriverOrders) return prev;
+  if (event.driver_id !== driver_id || !DRIVER_ACTIVE_STATUSES.includes(event.status)) {
+    return { ...prev, getDriverOrders: prev.getDriverOrders.filter(order => order.order_id !== event.order_id) };
+  }
+  if (isMissingFrom(prev.getDriverOrders, event)) {
+    const order = { __typename: 'Order', order_id: event.order_id, order_code: event.order_code, status: event.status };
+    return { ...prev, getDriverOrders: [...prev.getDriverOrders, order] };
+  }
+  return updateOrderList('getDriverOrders')(prev, { subscriptionData });
+};